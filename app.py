@@ -7,11 +7,43 @@ import plotly.graph_objects as go
 from langchain_groq import ChatGroq
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
+from langchain_core.language_models.llms import LLM
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import time
 import re
+import ast
+import math
+import operator
 import os
+import sqlite3
+import threading
+import uuid
+import pickle
+import weakref
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import hashlib
+import hmac
+import functools
+import gzip
+import zlib
+import base64
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import copy
+import heapq
+import queue
+from collections import deque, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
+from sortedcontainers import SortedList
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 # Load environment variables
 load_dotenv()
@@ -108,13 +140,36 @@ if 'answers' not in st.session_state:
 if 'test_start_time' not in st.session_state:
     st.session_state.test_start_time = None
 if 'progress_data' not in st.session_state:
-    st.session_state.progress_data = []
+    st.session_state.progress_data = None # Loaded from the shared state backend on the first run
 if 'essay_topic' not in st.session_state:
     st.session_state.essay_topic = ""
 if 'coding_problems' not in st.session_state:
     st.session_state.coding_problems = []
 if 'mode' not in st.session_state:
-    st.session_state.mode = "dashboard" # Can be "dashboard", "test", "practice", "practice_questions", "results", "practice_results_review"
+    st.session_state.mode = "dashboard" # Can be "dashboard", "test", "practice", "practice_questions", "results", "practice_results_review", "analytics", "leaderboard"
+if 'attempt_seed' not in st.session_state:
+    st.session_state.attempt_seed = None # Seed for the current attempt's question sampling and shuffling
+if 'question_shown' not in st.session_state:
+    st.session_state.question_shown = None # (attempt ID, question index, first-shown timestamp) of the current MCQ
+if 'editor_autosave' not in st.session_state:
+    st.session_state.editor_autosave = {} # Editor ID -> hash and time of its last autosave, and any unsaved content
+if 'attempt_id' not in st.session_state:
+    st.session_state.attempt_id = None # Checkpoint journal of the in-progress attempt, if any
+if 'candidate_id' not in st.session_state:
+    # Keys this candidate's progress history; carried in the page URL so it survives reconnects to any worker
+    url_candidate_id = st.query_params.get("candidate", "")
+    st.session_state.candidate_id = url_candidate_id if re.fullmatch(r"[0-9a-f]{32}", url_candidate_id) else uuid.uuid4().hex
+if 'cohort' not in st.session_state:
+    # Class or batch label from the invite link (?cohort=...), used to group answers in cohort reports
+    st.session_state.cohort = st.query_params.get("cohort", "").strip()[:64] or "open"
+if 'review_summary' not in st.session_state:
+    st.session_state.review_summary = None # (attempt key, summary) memo of the finished attempt's review stats
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex # Identifies this browser session for fair LLM scheduling
+if 'is_admin' not in st.session_state:
+    # Server-wide operator panels (show_admin_panels) need ?admin=<PREP_AI_ADMIN_TOKEN>
+    admin_token = os.getenv("PREP_AI_ADMIN_TOKEN", "")
+    st.session_state.is_admin = bool(admin_token) and hmac.compare_digest(st.query_params.get("admin", ""), admin_token)
 
 # Test configurations
 # Defines the structure and content for each test type
@@ -160,34 +215,1280 @@ TEST_CONFIGS = {
     }
 }
 
-# --- Groq API and Question Generation Functions ---
+# Local directory for on-disk app state (spilled sessions etc.)
+PREP_AI_DATA_DIR = os.getenv("PREP_AI_DATA_DIR", ".prep_ai")
 
-def initialize_groq_client():
-    """Initializes the Groq LLM client with the API key."""
-    if st.session_state.groq_api_key:
+# --- Shared State Backend ---
+# State that must survive a reconnect to a different app worker lives behind one small interface:
+# the question bank, attempt checkpoints, progress history and rate-limit counters. SQLite in WAL
+# mode serves every worker on one host; a Redis-compatible server serves workers on several hosts.
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite") # "sqlite", "redis" or "memory" (this process only)
+STATE_BACKEND_URL = os.getenv("STATE_BACKEND_URL", "") # SQLite file path or redis:// URL
+
+class StateBackend(ABC):
+    """
+    Interface of shared state. Values are JSON-serializable and grouped by namespace;
+    streams are append-only lists of entries.
+    """
+    @abstractmethod
+    def get(self, namespace, key, default=None):
+        """The value stored under `key`, or `default`."""
+
+    @abstractmethod
+    def put(self, namespace, key, value):
+        """Stores `value` under `key`, replacing any previous value."""
+
+    @abstractmethod
+    def update(self, namespace, key, fn):
+        """
+        Atomically applies `fn(value, now)` to one key, where `value` is None if the key is unset.
+        `fn` returns (new_value, result); a new_value of None leaves the key unchanged. Returns result.
+        """
+
+    @abstractmethod
+    def keys(self, namespace):
+        """Every key set in `namespace`."""
+
+    @abstractmethod
+    def append(self, stream, entry):
+        """Adds `entry` at the end of a stream."""
+
+    @abstractmethod
+    def read(self, stream, start=0):
+        """Entries of a stream from position `start` on, oldest first."""
+
+class MemoryStateBackend(StateBackend):
+    """State kept in this process's memory; for a single worker or tests."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.streams = {}
+
+    def get(self, namespace, key, default=None):
+        with self.lock:
+            return self.values.get((namespace, key), default)
+
+    def put(self, namespace, key, value):
+        with self.lock:
+            self.values[(namespace, key)] = value
+
+    def update(self, namespace, key, fn):
+        with self.lock:
+            new_value, result = fn(self.values.get((namespace, key)), time.time())
+            if new_value is not None:
+                self.values[(namespace, key)] = new_value
+            return result
+
+    def keys(self, namespace):
+        with self.lock:
+            return [key for ns, key in self.values if ns == namespace]
+
+    def append(self, stream, entry):
+        with self.lock:
+            self.streams.setdefault(stream, []).append(entry)
+
+    def read(self, stream, start=0):
+        with self.lock:
+            return self.streams.get(stream, [])[start:]
+
+class SQLiteStateBackend(StateBackend):
+    """State shared by every worker process on this host through one SQLite file in WAL mode."""
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local() # One connection per thread
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL") # Readers never block the writer; persists in the file
+        conn.execute("CREATE TABLE IF NOT EXISTS kv (namespace TEXT, key TEXT, value TEXT, PRIMARY KEY (namespace, key))")
+        conn.execute("CREATE TABLE IF NOT EXISTS streams (id INTEGER PRIMARY KEY AUTOINCREMENT, stream TEXT, entry TEXT)")
+        conn.execute("CREATE INDEX IF NOT EXISTS streams_by_name ON streams (stream, id)")
+
+    def _connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL") # Durable across app crashes; WAL makes this safe
+        return conn
+
+    def get(self, namespace, key, default=None):
+        row = self._connect().execute("SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def put(self, namespace, key, value):
+        self._connect().execute("INSERT OR REPLACE INTO kv (namespace, key, value) VALUES (?, ?, ?)",
+                                (namespace, key, json.dumps(value, ensure_ascii=False)))
+
+    def update(self, namespace, key, fn):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE") # Take the write lock up front so read-modify-write is atomic
         try:
-            llm = ChatGroq(
-                groq_api_key=st.session_state.groq_api_key,
-                model_name="llama-3.3-70b-versatile", # A powerful model for better quality responses
-                temperature=0.1, # Lower temperature for more consistent, less creative output
-                max_tokens=4000 # Max tokens for the response
-            )
-            return llm
+            row = conn.execute("SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+            new_value, result = fn(json.loads(row[0]) if row else None, time.time())
+            if new_value is not None:
+                conn.execute("INSERT OR REPLACE INTO kv (namespace, key, value) VALUES (?, ?, ?)",
+                             (namespace, key, json.dumps(new_value, ensure_ascii=False)))
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def keys(self, namespace):
+        return [key for key, in self._connect().execute("SELECT key FROM kv WHERE namespace = ?", (namespace,))]
+
+    def append(self, stream, entry):
+        self._connect().execute("INSERT INTO streams (stream, entry) VALUES (?, ?)",
+                                (stream, json.dumps(entry, ensure_ascii=False)))
+
+    def read(self, stream, start=0):
+        return [json.loads(entry) for entry, in self._connect().execute(
+            "SELECT entry FROM streams WHERE stream = ? ORDER BY id LIMIT -1 OFFSET ?", (stream, start))]
+
+class RedisStateBackend(StateBackend):
+    """
+    State on a Redis-compatible server (Redis, Valkey, KeyDB, ...), for workers on several hosts.
+    Requires the optional `redis` package.
+    """
+    def __init__(self, url, prefix="prep_ai"):
+        import redis # Optional dependency, only needed for this backend
+        self.redis = redis
+        self.client = redis.Redis.from_url(url or "redis://localhost:6379/0", decode_responses=True)
+        self.prefix = prefix
+
+    def _key(self, namespace, key):
+        return f"{self.prefix}:kv:{namespace}:{key}"
+
+    def get(self, namespace, key, default=None):
+        value = self.client.get(self._key(namespace, key))
+        return json.loads(value) if value is not None else default
+
+    def put(self, namespace, key, value):
+        self.client.set(self._key(namespace, key), json.dumps(value, ensure_ascii=False))
+
+    def update(self, namespace, key, fn):
+        name = self._key(namespace, key)
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(name) # EXEC fails if another worker writes the key before we do
+                    value = pipe.get(name)
+                    new_value, result = fn(json.loads(value) if value is not None else None, time.time())
+                    pipe.multi()
+                    if new_value is not None:
+                        pipe.set(name, json.dumps(new_value, ensure_ascii=False))
+                    pipe.execute()
+                    return result
+                except self.redis.WatchError:
+                    continue
+
+    def keys(self, namespace):
+        prefix = self._key(namespace, "")
+        return [name[len(prefix):] for name in self.client.scan_iter(match=f"{prefix}*")]
+
+    def append(self, stream, entry):
+        self.client.rpush(f"{self.prefix}:stream:{stream}", json.dumps(entry, ensure_ascii=False))
+
+    def read(self, stream, start=0):
+        return [json.loads(entry) for entry in self.client.lrange(f"{self.prefix}:stream:{stream}", start, -1)]
+
+STATE_BACKENDS = {
+    "sqlite": lambda url: SQLiteStateBackend(url or os.path.join(PREP_AI_DATA_DIR, "state.db")),
+    "redis": RedisStateBackend,
+    "memory": lambda url: MemoryStateBackend(),
+}
+
+@st.cache_resource(show_spinner=False)
+def get_state_backend():
+    """Process-wide handle on the shared state backend selected by STATE_BACKEND."""
+    return STATE_BACKENDS[STATE_BACKEND](STATE_BACKEND_URL)
+
+# --- LLM Rate Limiting and Request Coalescing ---
+# Every session shares one Groq key, so LLM calls are throttled across all sessions and workers.
+
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "12000"))
+LLM_MAX_QUEUE_WAIT = float(os.getenv("LLM_MAX_QUEUE_WAIT", "120")) # Seconds to wait for a slot before falling back to samples
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token) used for rate-limit accounting."""
+    return max(1, len(text) // 4)
+
+class SharedBucketStore:
+    """
+    Token buckets that refill `capacity` units per minute, kept as one record in the shared state
+    backend so every worker draws on the same limits.
+    """
+    def __init__(self, backend, capacities):
+        self.backend = backend
+        self.capacities = capacities
+
+    def _transaction(self, update):
+        """Atomically applies `update(levels, now)` -> (changed levels or None, result) to the record."""
+        def apply(state, now):
+            state = state or {}
+            new_state, result = update(state, now)
+            return ({**state, **new_state} if new_state else None), result
+        return self.backend.update("rate_limits", "llm", apply)
+
+    def _level(self, state, name, now):
+        tokens, updated = state.get(name, (self.capacities[name], now))
+        capacity = self.capacities[name]
+        return min(capacity, tokens + (now - updated) * capacity / 60.0)
+
+    def try_consume(self, costs):
+        """
+        Atomically takes every cost in `costs` (bucket name -> units).
+        Returns 0 when granted, otherwise the seconds until all of them would fit.
+        """
+        def update(state, now):
+            levels = {name: self._level(state, name, now) for name in costs}
+            # Requests larger than a whole bucket are capped so they can still go through eventually
+            capped = {name: min(cost, self.capacities[name]) for name, cost in costs.items()}
+            wait = max((capped[name] - levels[name]) * 60.0 / self.capacities[name] for name in costs)
+            if wait > 0:
+                return None, wait
+            return {name: (levels[name] - capped[name], now) for name in costs}, 0.0
+        return self._transaction(update)
+
+    def refund(self, costs):
+        """Returns unused units (e.g. over-reserved tokens) to their buckets."""
+        def update(state, now):
+            return {name: (min(self.capacities[name], self._level(state, name, now) + amount), now)
+                    for name, amount in costs.items() if amount > 0}, None
+        self._transaction(update)
+
+class LLMRateLimiter:
+    """
+    Grants LLM calls against the requests-per-minute and tokens-per-minute buckets.
+    Waiting calls are served round-robin across sessions (FIFO within a session),
+    so one user starting several tests cannot starve everyone else.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.cond = threading.Condition()
+        self.pending = {} # session_id -> deque of waiting tickets
+        self.turns = deque() # Sessions with waiting tickets, in serving order
+
+    def acquire(self, session_id, tokens, max_wait=LLM_MAX_QUEUE_WAIT):
+        """Blocks until the call may be sent. Raises TimeoutError after `max_wait` seconds."""
+        ticket = object()
+        deadline = time.monotonic() + max_wait
+        with self.cond:
+            if session_id not in self.pending:
+                self.pending[session_id] = deque()
+                self.turns.append(session_id)
+            self.pending[session_id].append(ticket)
+            try:
+                while True:
+                    wait = None
+                    if self.turns[0] == session_id and self.pending[session_id][0] is ticket:
+                        wait = self.store.try_consume({"requests": 1, "tokens": tokens})
+                        if wait == 0:
+                            return
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError("Timed out waiting for the shared LLM rate limit.")
+                    self.cond.wait(min(wait, remaining) if wait is not None else remaining)
+            finally:
+                # Granted or timed out, this ticket leaves the queue and the session goes to the back of the line
+                queue = self.pending[session_id]
+                queue.remove(ticket)
+                self.turns.remove(session_id)
+                if queue:
+                    self.turns.append(session_id)
+                else:
+                    del self.pending[session_id]
+                self.cond.notify_all()
+
+    def refund(self, tokens):
+        """Gives back tokens that were reserved but not used by the completed call."""
+        if tokens > 0:
+            self.store.refund({"tokens": tokens})
+            with self.cond:
+                self.cond.notify_all()
+
+class RequestCoalescer:
+    """Lets concurrent identical requests share the result of a single in-flight call."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.inflight = {}
+
+    def run(self, key, fn):
+        with self.lock:
+            call = self.inflight.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self.inflight[key] = {"done": threading.Event(), "result": None, "error": None}
+
+        if not is_leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = fn()
+            return call["result"]
         except Exception as e:
-            st.error(f"Error initializing Groq client: {str(e)}. Please check your API key and internet connection.")
+            call["error"] = e
+            raise
+        finally:
+            with self.lock:
+                del self.inflight[key]
+            call["done"].set()
+
+@st.cache_resource(show_spinner=False)
+def get_llm_rate_limiter():
+    """Process-wide rate limiter shared by all sessions (cached across Streamlit reruns)."""
+    capacities = {"requests": LLM_REQUESTS_PER_MINUTE, "tokens": LLM_TOKENS_PER_MINUTE}
+    return LLMRateLimiter(SharedBucketStore(get_state_backend(), capacities))
+
+@st.cache_resource(show_spinner=False)
+def get_request_coalescer():
+    """Process-wide registry of in-flight LLM requests."""
+    return RequestCoalescer()
+
+# --- LLM Provider Routing ---
+# Each task has its own profile: candidate models in order of preference ("provider:model"),
+# an output token budget, an overall timeout and the delay after which a hedge request is sent
+# to the next candidate. A model is skipped as primary once its measured p95 latency breaks the
+# profile's latency SLO. Set LLM_PROVIDER=stub to route every task to the offline stub provider, or
+# LLM_PROVIDER=local to serve every task from a model running on this machine's CPU.
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq")
+LLM_TASK_PROFILES = {
+    "question_generation": {
+        "models": ["groq:llama-3.3-70b-versatile", "groq:llama-3.1-8b-instant"],
+        "max_tokens": 4000,
+        "timeout": 60, # seconds
+        "latency_slo": 20,
+        "hedge_after": 15,
+        "json_output": True, # The response must be a JSON array; the local model decodes under that constraint
+    },
+    "essay_topic": {
+        "models": ["groq:llama-3.1-8b-instant", "groq:llama-3.3-70b-versatile"],
+        "max_tokens": 40, # A topic title is only a dozen tokens
+        "timeout": 10,
+        "latency_slo": 2,
+        "hedge_after": 2,
+    },
+    "coding_problems": {
+        "models": ["groq:llama-3.3-70b-versatile", "groq:llama-3.1-8b-instant"],
+        "max_tokens": 1500,
+        "timeout": 45,
+        "latency_slo": 15,
+        "hedge_after": 12,
+        "json_output": True,
+    },
+    "coding_judge": {
+        "models": ["groq:llama-3.3-70b-versatile", "groq:llama-3.1-8b-instant"],
+        "max_tokens": 2000, # Reference solution and input generator for one problem
+        "timeout": 60,
+        "latency_slo": 20,
+        "hedge_after": 15,
+        "json_output": True,
+    },
+}
+STUB_LLM_LATENCY = float(os.getenv("STUB_LLM_LATENCY", "0")) # Simulated seconds per stub response
+STUB_LLM_FAILURE_RATE = float(os.getenv("STUB_LLM_FAILURE_RATE", "0")) # Fraction of stub calls that raise
+
+STUB_CODING_JUDGES = {
+    "Stub Array Rotation": {
+        "io_format": "Input: the integers of `nums` on one line, separated by spaces, then `k` on the next line. "
+                     "Output: the rotated array on one line, separated by spaces.",
+        "sample_input": "1 2 3 4 5\n2\n",
+        "sample_output": "4 5 1 2 3\n",
+        "reference": "import sys\nlines = sys.stdin.read().split('\\n')\nnums, k = lines[0].split(), int(lines[1])\n"
+                     "k %= len(nums)\nprint(' '.join(nums[len(nums) - k:] + nums[:len(nums) - k]))\n",
+        "generator": "def generate(rng, n):\n    n = max(1, n)\n"
+                     "    return ' '.join(str(rng.randint(-1000, 1000)) for _ in range(n)) + f'\\n{rng.randint(0, 2 * n)}\\n'\n",
+    },
+    "Stub Interval Merge": {
+        "io_format": "Input: the number of intervals `m`, then one interval per line as `start end`. "
+                     "Output: the merged intervals sorted by start, one `start end` per line.",
+        "sample_input": "3\n1 3\n2 6\n8 10\n",
+        "sample_output": "1 6\n8 10\n",
+        "reference": "import sys\ndata = list(map(int, sys.stdin.read().split()))\n"
+                     "intervals = sorted(zip(data[1::2], data[2::2]))\nmerged = []\nfor start, end in intervals:\n"
+                     "    if merged and start <= merged[-1][1]:\n        merged[-1][1] = max(merged[-1][1], end)\n"
+                     "    else:\n        merged.append([start, end])\nprint('\\n'.join(f'{a} {b}' for a, b in merged))\n",
+        "generator": "def generate(rng, n):\n    n = max(1, n)\n    rows = []\n    for _ in range(n):\n"
+                     "        start = rng.randint(0, 10 * n)\n        rows.append(f'{start} {start + rng.randint(0, 20)}')\n"
+                     "    return f'{n}\\n' + '\\n'.join(rows) + '\\n'\n",
+    },
+}
+
+def stub_completion(prompt):
+    """
+    Offline stand-in for an LLM: returns a well-formed response shaped by the prompt (and by its
+    paper variant, if any, so provisioned papers differ).
+    """
+    variant_request = re.search(r"This is paper variant (\d+)", prompt)
+    variant = f" (variant {variant_request.group(1)})" if variant_request else ""
+    judge_request = re.search(r"judge for a stdin/stdout grader.*?Title: (.+?)\n", prompt, re.DOTALL)
+    if judge_request:
+        judge = STUB_CODING_JUDGES.get(re.sub(r" \(variant \d+\)$", "", judge_request.group(1).strip()))
+        return json.dumps([judge] if judge else [])
+    mcq_request = re.search(r"Generate (\d+) multiple choice questions for '(.+?)' of '(.+?)' difficulty", prompt)
+    if mcq_request:
+        count, topic, difficulty = int(mcq_request.group(1)), mcq_request.group(2), mcq_request.group(3)
+        return json.dumps([{
+            "question": f"[{difficulty}] Stub question {i + 1} on {topic}{variant}?",
+            "options": [f"{letter}) Option {letter} for question {i + 1}" for letter in "ABCD"],
+            "correct_answer": "ABCD"[i % 4],
+            "explanation": f"Option {'ABCD'[i % 4]} is the stub answer for question {i + 1}."
+        } for i in range(count)])
+    if "coding problems" in prompt:
+        return json.dumps([
+            {"title": f"Stub Array Rotation{variant}", "description": "Rotate an array of `n` integers to the right by `k` steps in place.",
+             "difficulty": "Medium", "example": "Input: nums = [1,2,3,4,5], k = 2\nOutput: [4,5,1,2,3]"},
+            {"title": f"Stub Interval Merge{variant}", "description": "Given a list of intervals, merge all overlapping intervals.",
+             "difficulty": "Hard", "example": "Input: [[1,3],[2,6],[8,10]]\nOutput: [[1,6],[8,10]]"},
+        ])
+    return f"Responsible Use of Generative AI in Software Teams{variant}"
+
+class StubLLM(LLM):
+    """LangChain LLM that answers from `stub_completion` without any network access."""
+    model_name: str = "stub"
+    max_tokens: int = 4000
+
+    @property
+    def _llm_type(self):
+        return "stub"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        if STUB_LLM_LATENCY:
+            time.sleep(STUB_LLM_LATENCY)
+        if STUB_LLM_FAILURE_RATE and random.random() < STUB_LLM_FAILURE_RATE:
+            raise RuntimeError("Stub LLM injected failure.")
+        return stub_completion(prompt)
+
+# --- Local Model Backend ---
+# A small instruction model served from the app process on CPU, so questions can be generated without a
+# Groq key or network. Its weights are loaded once per process (linear layers dynamically quantized to
+# int8) by a model server thread that drains queued prompts in batches, so a paper's topics share one
+# generate() call. Tasks that expect JSON decode under a constraint: only tokens that keep the response
+# a valid JSON array prefix may be chosen. Needs torch and transformers; see localbench.py for throughput.
+
+LOCAL_LLM_MODEL = os.getenv("LOCAL_LLM_MODEL", "Qwen/Qwen2.5-0.5B-Instruct") # Hugging Face model ID or local path
+LOCAL_LLM_QUANTIZE = os.getenv("LOCAL_LLM_QUANTIZE", "int8") # "int8" (dynamic quantization) or "none"
+LOCAL_LLM_BATCH_SIZE = int(os.getenv("LOCAL_LLM_BATCH_SIZE", "4")) # Prompts decoded together
+LOCAL_LLM_BATCH_WAIT = float(os.getenv("LOCAL_LLM_BATCH_WAIT", "0.05")) # Seconds to wait for a batch to fill
+LOCAL_LLM_THREADS = int(os.getenv("LOCAL_LLM_THREADS", str(os.cpu_count() or 1))) # torch intra-op threads
+LOCAL_LLM_TIMEOUT = float(os.getenv("LOCAL_LLM_TIMEOUT", "600")) # Per-request timeout; CPU decoding is slow
+LOCAL_LLM_JSON_TOP_K = 40 # Highest-scoring tokens checked against the JSON constraint at each step
+
+def json_prefix_step(state, char):
+    """
+    Advances a JSON-array prefix parser by one character. `state` is (open containers, mode, detail),
+    starting from ("", "start", ""). Returns the new state, or None if `char` cannot follow.
+    """
+    stack, mode, detail = state
+    if mode == "number":
+        if char in "0123456789+-.eE":
+            return state
+        return json_prefix_step((stack, "after_value", ""), char)
+    if mode == "string":
+        if detail.endswith("\\"):
+            return (stack, mode, detail[:-1]) if char in '"\\/bfnrtu' else None
+        if char == "\\":
+            return (stack, mode, detail + "\\")
+        if char == '"':
+            return (stack, "colon" if detail == "key" else "after_value", "")
+        return state if char >= " " else None
+    if mode == "literal":
+        if char != detail[0]:
             return None
-    return None
+        return (stack, mode, detail[1:]) if len(detail) > 1 else (stack, "after_value", "")
+    if char in " \t\n\r":
+        return state
+    if mode == "start":
+        return ("[", "value_or_close", "") if char == "[" else None
+    if mode in ("value", "value_or_close"):
+        if char == '"':
+            return (stack, "string", "value")
+        if char in "[{":
+            return (stack + char, "value_or_close" if char == "[" else "key_or_close", "")
+        if char in "-0123456789":
+            return (stack, "number", "")
+        if char in "tfn":
+            return (stack, "literal", {"t": "rue", "f": "alse", "n": "ull"}[char])
+        if char == "]" and mode == "value_or_close":
+            return json_prefix_step((stack, "after_value", ""), char)
+        return None
+    if mode in ("key", "key_or_close"):
+        if char == '"':
+            return (stack, "string", "key")
+        if char == "}" and mode == "key_or_close":
+            return json_prefix_step((stack, "after_value", ""), char)
+        return None
+    if mode == "colon":
+        return (stack, "value", "") if char == ":" else None
+    if mode == "after_value":
+        if char == ",":
+            return (stack, "value" if stack[-1] == "[" else "key", "")
+        if char == {"[": "]", "{": "}"}[stack[-1]]:
+            return (stack[:-1], "after_value" if len(stack) > 1 else "done", "")
+    return None # Only whitespace may follow a complete array
+
+class JSONLogitsProcessor:
+    """transformers logits processor that masks every token which would break the JSON array being generated."""
+    def __init__(self, tokenizer, prompt_length, batch_size):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.states = [("", "start", "")] * batch_size
+        self.token_texts = {}
+
+    def token_text(self, token_id):
+        if token_id not in self.token_texts:
+            self.token_texts[token_id] = self.tokenizer.decode([token_id])
+        return self.token_texts[token_id]
+
+    def advance(self, state, token_id):
+        for char in self.token_text(token_id):
+            state = json_prefix_step(state, char)
+            if state is None:
+                return None
+        return state
+
+    def __call__(self, input_ids, scores):
+        import torch
+        if input_ids.shape[1] > self.prompt_length: # Feed in the tokens chosen at the previous step
+            self.states = [self.advance(state, int(token_id)) if state is not None else None
+                           for state, token_id in zip(self.states, input_ids[:, -1])]
+        constrained = torch.full_like(scores, float("-inf"))
+        top_ids = torch.topk(scores, min(LOCAL_LLM_JSON_TOP_K, scores.shape[1]), dim=1).indices
+        for row, state in enumerate(self.states):
+            if state is None: # Left the grammar despite the constraint (e.g. a split multi-byte character)
+                constrained[row] = scores[row]
+            elif state[1] == "done":
+                constrained[row, self.tokenizer.eos_token_id] = 0
+            else:
+                allowed = [int(t) for t in top_ids[row] if self.advance(state, int(t)) is not None]
+                if not allowed:
+                    constrained[row] = scores[row]
+                else:
+                    constrained[row, allowed] = scores[row, allowed]
+        return constrained
+
+class LocalModelServer:
+    """Owns a loaded model and serves queued completion requests from a single thread, in batches."""
+    def __init__(self, model_name, quantize=LOCAL_LLM_QUANTIZE, batch_size=LOCAL_LLM_BATCH_SIZE,
+                 batch_wait=LOCAL_LLM_BATCH_WAIT, threads=LOCAL_LLM_THREADS):
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+        started = time.perf_counter()
+        torch.set_num_threads(threads)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, padding_side="left")
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32)
+        model.eval()
+        if quantize == "int8":
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.threads = threads
+        self.load_seconds = time.perf_counter() - started
+        self.stats = {"requests": 0, "batches": 0, "generated_tokens": 0, "generate_seconds": 0.0}
+        self.requests = queue.Queue()
+        threading.Thread(target=self.serve, name="local-llm", daemon=True).start()
+
+    def complete(self, prompt, max_tokens, json_output=False, timeout=None):
+        """Queues `prompt` and blocks until its response text is ready."""
+        future = Future()
+        self.requests.put((prompt, max_tokens, json_output, future))
+        return future.result(timeout)
+
+    def serve(self):
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.requests.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            for json_output in (True, False): # One generate() call per decoding mode
+                group = [request for request in batch if request[2] == json_output]
+                if group:
+                    self.generate(group, json_output)
+
+    def generate(self, batch, json_output):
+        import torch
+        from transformers import LogitsProcessorList
+        try:
+            texts = [self.tokenizer.apply_chat_template([{"role": "user", "content": prompt}], tokenize=False,
+                                                        add_generation_prompt=True)
+                     if self.tokenizer.chat_template else prompt for prompt, _, _, _ in batch]
+            inputs = self.tokenizer(texts, return_tensors="pt", padding=True)
+            prompt_length = inputs["input_ids"].shape[1]
+            processors = LogitsProcessorList([JSONLogitsProcessor(self.tokenizer, prompt_length, len(batch))]) if json_output else None
+            started = time.perf_counter()
+            with torch.inference_mode():
+                output = self.model.generate(**inputs, max_new_tokens=max(request[1] for request in batch), do_sample=False,
+                                             logits_processor=processors, pad_token_id=self.tokenizer.pad_token_id)
+            self.stats["generate_seconds"] += time.perf_counter() - started
+            self.stats["batches"] += 1
+            for (_, max_tokens, _, future), token_ids in zip(batch, output[:, prompt_length:]):
+                token_ids = token_ids[:max_tokens]
+                self.stats["requests"] += 1
+                self.stats["generated_tokens"] += int((token_ids != self.tokenizer.pad_token_id).sum())
+                future.set_result(self.tokenizer.decode(token_ids, skip_special_tokens=True))
+        except Exception as e:
+            for _, _, _, future in batch:
+                future.set_exception(e)
+
+@st.cache_resource(show_spinner=False)
+def get_local_model_server(model_name):
+    """Process-wide model server, so the weights are loaded once and every session's prompts share batches."""
+    return LocalModelServer(model_name)
+
+class LocalLLM(LLM):
+    """LangChain LLM that completes prompts on the process-wide local model server."""
+    model_name: str = LOCAL_LLM_MODEL
+    max_tokens: int = 4000
+    json_output: bool = False
 
-def generate_questions(test_type, topic, count=5, difficulty="Medium"):
+    @property
+    def _llm_type(self):
+        return "local"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        return get_local_model_server(self.model_name).complete(prompt, self.max_tokens, self.json_output, LOCAL_LLM_TIMEOUT)
+
+def initialize_groq_client(api_key, model_name="llama-3.3-70b-versatile", max_tokens=4000, timeout=60):
+    """Initializes the Groq LLM client with the API key."""
+    return ChatGroq(
+        groq_api_key=api_key,
+        groq_api_base=os.getenv("GROQ_API_BASE") or None, # Lets load tests point at a local mock server
+        model_name=model_name,
+        temperature=0.1, # Lower temperature for more consistent, less creative output
+        max_tokens=max_tokens, # Max tokens for the response
+        request_timeout=timeout
+    )
+
+# Provider name -> (builder, whether calls count against the shared Groq rate limit)
+LLM_PROVIDERS = {
+    "groq": (lambda model, profile, api_key: initialize_groq_client(api_key, model, profile["max_tokens"], profile["timeout"]), True),
+    "stub": (lambda model, profile, api_key: StubLLM(model_name=model, max_tokens=profile["max_tokens"]), False),
+    "local": (lambda model, profile, api_key: LocalLLM(model_name=model, max_tokens=profile["max_tokens"],
+                                                       json_output=profile.get("json_output", False)), False),
+}
+
+class LLMRouter:
+    """Picks a model per task from measured p50/p95 latencies and hedges slow requests."""
+    def __init__(self, profiles, max_workers=32):
+        self.profiles = profiles
+        self.latencies = {} # model spec -> recent latencies in seconds
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-router")
+        # Whole requests started in the background (see submit_llm_chain); separate so they never wait on themselves
+        self.request_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-request")
+
+    def candidates(self, task):
+        models = self.profiles[task]["models"]
+        if LLM_PROVIDER == "stub":
+            return ["stub:" + spec.split(":", 1)[1] for spec in models]
+        if LLM_PROVIDER == "local": # One local model serves every task; hedging to it again would only add load
+            return ["local:" + LOCAL_LLM_MODEL]
+        return models
+
+    def record(self, spec, seconds):
+        with self.lock:
+            self.latencies.setdefault(spec, deque(maxlen=200)).append(seconds)
+
+    def percentiles(self, spec):
+        """Returns (p50, p95) for `spec`, or None until a few samples exist."""
+        with self.lock:
+            samples = sorted(self.latencies.get(spec, ()))
+        if len(samples) < 3:
+            return None
+        return samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def rank(self, task):
+        """Candidates in serving order: preferred models within the SLO first, then the rest by p50."""
+        slo = self.profiles[task]["latency_slo"]
+        within_slo, over_slo = [], []
+        for spec in self.candidates(task):
+            stats = self.percentiles(spec)
+            if stats is None or stats[1] <= slo: # Unmeasured models are given the benefit of the doubt
+                within_slo.append(spec)
+            else:
+                over_slo.append((stats[0], spec))
+        return within_slo + [spec for _, spec in sorted(over_slo)]
+
+    def hedge_delay(self, task, spec):
+        """Waits for the primary's p95 (bounded by the profile's `hedge_after`) before hedging."""
+        hedge_after = self.profiles[task]["hedge_after"]
+        stats = self.percentiles(spec)
+        if hedge_after is None or stats is None:
+            return hedge_after
+        return min(hedge_after, stats[1])
+
+    def complete(self, task, call_model):
+        """
+        Runs `call_model(spec, on_admitted, deadline)` on the best candidate, firing the next candidate
+        as a hedge if the first has not answered in time (or fails). Returns the first successful result.
+        `call_model` calls `on_admitted()` once the rate limiter lets the request through; the hedge
+        delay counts from then, so time spent queued for capacity never triggers a hedge. `deadline`
+        (time.monotonic()) is when the profile's timeout runs out; requests not admitted by then are dropped.
+        """
+        profile = self.profiles[task]
+        ranked = self.rank(task)
+        deadline = time.monotonic() + profile["timeout"]
+        backups = deque(ranked[1:])
+        admitted = threading.Event()
+        primary = self.executor.submit(call_model, ranked[0], admitted.set, deadline)
+        primary.add_done_callback(lambda _: admitted.set()) # A primary that fails while queued must not block the hedge
+        pending = {primary}
+        hedge_delay = self.hedge_delay(task, ranked[0])
+        errors = []
+
+        if hedge_delay is not None and admitted.wait(timeout=max(0, deadline - time.monotonic())):
+            done, _ = wait(pending, timeout=hedge_delay)
+            if not done and backups:
+                pending.add(self.executor.submit(call_model, backups.popleft(), lambda: None, deadline))
+
+        while pending:
+            done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                errors.append(future.exception())
+                if backups and hedge_delay is not None: # Fail over to the next candidate straight away
+                    pending.add(self.executor.submit(call_model, backups.popleft(), lambda: None, deadline))
+        if errors:
+            raise errors[0]
+        raise TimeoutError(f"No model answered the '{task}' request within {profile['timeout']} seconds.")
+
+@st.cache_resource(show_spinner=False)
+def get_llm_router():
+    """Process-wide router, so latency measurements are shared by all sessions."""
+    if LLM_PROVIDER == "local": # CPU decoding takes far longer than the hosted models' SLOs allow
+        return LLMRouter({task: dict(profile, timeout=LOCAL_LLM_TIMEOUT, latency_slo=LOCAL_LLM_TIMEOUT)
+                          for task, profile in LLM_TASK_PROFILES.items()})
+    return LLMRouter(LLM_TASK_PROFILES)
+
+# --- Token Budgeting ---
+# Output budgets for question generation are sized from the requested count and the measured
+# completion tokens per generated question, instead of always reserving the profile maximum.
+
+DEFAULT_TOKENS_PER_QUESTION = 150 # Used until a test type has been measured
+QUESTION_TOKEN_HEADROOM = 1.3 # Margin so a slightly longer batch is not cut off mid-JSON
+
+class TokenUsageLedger:
+    """Per-test-type prompt/completion token totals, delivered question counts and measured tokens per question."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.usage = {}
+
+    def _entry(self, key):
+        return self.usage.setdefault(key, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "delivered": 0,
+                                           "corrected": 0, "rejected": 0, "tokens_per_question": None})
+
+    def record_call(self, key, prompt_tokens, completion_tokens):
+        with self.lock:
+            entry = self._entry(key)
+            entry["calls"] += 1
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+
+    def record_questions(self, key, response_tokens, generated, delivered):
+        """
+        Records questions parsed from one response. Tokens per question is a moving average of
+        per-response ratios, so coalesced sessions parsing the same response don't skew it.
+        """
+        with self.lock:
+            entry = self._entry(key)
+            entry["delivered"] += delivered
+            if generated:
+                measured = response_tokens / generated
+                previous = entry["tokens_per_question"]
+                entry["tokens_per_question"] = measured if previous is None else 0.8 * previous + 0.2 * measured
+
+    def record_verification(self, key, corrected, rejected):
+        """Records questions whose answer letter was fixed or that were dropped by answer verification."""
+        with self.lock:
+            entry = self._entry(key)
+            entry["corrected"] += corrected
+            entry["rejected"] += rejected
+
+    def tokens_per_question(self, key):
+        with self.lock:
+            entry = self.usage.get(key)
+            if not entry or entry["tokens_per_question"] is None:
+                return DEFAULT_TOKENS_PER_QUESTION
+            return entry["tokens_per_question"]
+
+    def report(self):
+        """DataFrame comparing prompt and completion tokens per delivered question across test types."""
+        with self.lock:
+            rows = [{"test_type": key, **entry} for key, entry in self.usage.items()]
+        df = pd.DataFrame(rows, columns=["test_type", "calls", "prompt_tokens", "completion_tokens", "delivered",
+                                         "corrected", "rejected"])
+        delivered = df["delivered"].where(df["delivered"] > 0)
+        df["prompt_tokens_per_question"] = (df["prompt_tokens"] / delivered).round(1)
+        df["completion_tokens_per_question"] = (df["completion_tokens"] / delivered).round(1)
+        return df
+
+@st.cache_resource(show_spinner=False)
+def get_token_usage_ledger():
+    """Process-wide token ledger shared by all sessions."""
+    return TokenUsageLedger()
+
+def question_output_budget(test_type, count):
+    """Max output tokens for a batch of `count` questions, capped by the task profile."""
+    tokens_per_question = get_token_usage_ledger().tokens_per_question(test_type)
+    budget = int(count * tokens_per_question * QUESTION_TOKEN_HEADROOM) + 100 # Room for the JSON array wrapper
+    return min(LLM_TASK_PROFILES["question_generation"]["max_tokens"], budget)
+
+# --- LLM Record/Replay ---
+# LLM_FIXTURE_MODE=record saves every LLM request/response pair under LLM_FIXTURE_DIR;
+# LLM_FIXTURE_MODE=replay answers from those files without network access. Together with a
+# fixed PREP_AI_SEED this makes test assembly fully deterministic for benchmarking.
+
+LLM_FIXTURE_MODE = os.getenv("LLM_FIXTURE_MODE", "off")
+LLM_FIXTURE_DIR = os.getenv("LLM_FIXTURE_DIR", "llm_fixtures")
+
+def llm_fixture_path(task, prompt_text):
+    """Fixture file for a request, keyed by a hash of the task and the exact prompt text."""
+    digest = hashlib.sha256(f"{task}\n{prompt_text}".encode("utf-8")).hexdigest()
+    return os.path.join(LLM_FIXTURE_DIR, task, f"{digest[:32]}.json")
+
+def save_llm_fixture(task, prompt_text, response):
+    path = llm_fixture_path(task, prompt_text)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"task": task, "prompt": prompt_text, "response": response}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path) # Atomic, so a concurrent replay never reads half a file
+
+def load_llm_fixture(task, prompt_text):
+    path = llm_fixture_path(task, prompt_text)
+    if not os.path.exists(path):
+        raise LookupError(f"No recorded LLM response for this '{task}' request in {LLM_FIXTURE_DIR}.")
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["response"]
+
+def new_attempt_seed():
+    """Seed for one test attempt; PREP_AI_SEED pins it so runs can be replayed exactly."""
+    if os.getenv("PREP_AI_SEED"):
+        return int(os.getenv("PREP_AI_SEED"))
+    return random.SystemRandom().randrange(2 ** 32)
+
+# --- Question Bank ---
+# Every validated generated question is kept in the shared state backend, per test type, topic and
+# difficulty, so any worker can serve real questions when the LLM is unavailable or rate-limited.
+
+QUESTION_BANK_MAX_PER_TOPIC = int(os.getenv("QUESTION_BANK_MAX_PER_TOPIC", "200")) # Oldest questions are dropped first
+
+def question_bank_key(test_type, topic, difficulty):
+    return json.dumps([test_type, topic, difficulty], ensure_ascii=False)
+
+def add_to_question_bank(test_type, topic, difficulty, questions):
     """
-    Generates multiple-choice questions using the Groq API.
-    Includes robust JSON parsing and falls back to sample questions on failure.
+    Adds questions not already in the bank (matched by question text) and queues them for search
+    indexing, along with the removal of any questions trimmed to make room. Returns how many were added.
     """
-    llm = initialize_groq_client()
-    if not llm:
-        st.warning(f"Using sample questions for {test_type} - {topic} ({difficulty}). Groq API key is missing or invalid.")
-        return create_sample_questions(test_type, topic, count, difficulty)
+    def merge(bank, now):
+        bank = bank or []
+        seen = {q["question"] for q in bank}
+        added = []
+        for q in questions:
+            if q["question"] not in seen:
+                seen.add(q["question"])
+                added.append(q)
+        if not added:
+            return None, ([], [])
+        merged = bank + added
+        return merged[-QUESTION_BANK_MAX_PER_TOPIC:], (added, merged[:-QUESTION_BANK_MAX_PER_TOPIC])
+    added, trimmed = get_state_backend().update("question_bank", question_bank_key(test_type, topic, difficulty), merge)
+    if added:
+        index = get_question_index()
+        index.add(test_type, topic, difficulty, added)
+        if trimmed:
+            index.remove([question_id(q) for q in trimmed])
+    return len(added)
+
+def fallback_questions(test_type, topic, count, difficulty="Medium", rng=None):
+    """Questions for when generation fails: a sample from the question bank if it holds enough, else samples."""
+    bank = get_state_backend().get("question_bank", question_bank_key(test_type, topic, difficulty), [])
+    if len(bank) >= count:
+        return (rng or random).sample(bank, count)
+    return create_sample_questions(test_type, topic, count, difficulty, rng)
+
+# --- Question Search ---
+# Bank questions are embedded once, when they are added, and appended to an on-disk vector index:
+# small npz segments per write, compacted (under a backend lease) into one part that also holds
+# k-means centroids once the index is large. Questions trimmed from the bank get deletion segments.
+# Writes are queued to one background thread per process, which batches whatever piled up into a
+# single segment, so question generation never waits on embedding or compaction. Searches probe the
+# nearest centroids' lists (IVF), or scan everything while the index is small. The default embedder
+# is feature hashing of words and character n-grams, which needs no model download;
+# QUESTION_EMBEDDER=huggingface uses a sentence model.
+
+QUESTION_EMBEDDER = os.getenv("QUESTION_EMBEDDER", "hashing") # "hashing" or "huggingface"
+QUESTION_EMBEDDING_MODEL = os.getenv("QUESTION_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+QUESTION_EMBEDDING_DIM = 512 # Dimensions of the hashing embedder
+QUESTION_INDEX_DIR = os.path.join(PREP_AI_DATA_DIR, "question_index",
+                                  re.sub(r"[^a-z0-9]+", "_", f"{QUESTION_EMBEDDER} {QUESTION_EMBEDDING_MODEL}".lower()
+                                         if QUESTION_EMBEDDER == "huggingface" else QUESTION_EMBEDDER))
+QUESTION_INDEX_COMPACT_SEGMENTS = int(os.getenv("QUESTION_INDEX_COMPACT_SEGMENTS", "20"))
+QUESTION_INDEX_IVF_MIN = 2000 # Below this many vectors a full scan is faster than probing clusters
+QUESTION_INDEX_NPROBE = int(os.getenv("QUESTION_INDEX_NPROBE", "8")) # Clusters searched per query
+QUESTION_SEARCH_TEST = "Question Search" # current_test of practice sessions built from search results
+SEARCH_STOPWORDS = frozenset("a an and are as at be by for from how in is it of on or that the this to what which with".split())
+
+def question_search_text(question_data):
+    """The text a question is embedded from: its stem, options and explanation."""
+    options = " ".join(re.sub(r"^\s*[A-D]\)\s*", "", str(option)) for option in question_data.get("options", []))
+    return f"{question_data['question']} {options} {question_data.get('explanation', '')}"
+
+def hashing_embeddings(texts):
+    """L2-normalized signed feature-hashing vectors of words, word pairs and character 4-grams."""
+    vectors = np.zeros((len(texts), QUESTION_EMBEDDING_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in SEARCH_STOPWORDS]
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])] + \
+                   [f"#{w[i:i + 4]}" for w in words if len(w) > 4 for i in range(len(w) - 3)]
+        for feature in features:
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vectors[row, h % QUESTION_EMBEDDING_DIM] += 1.0 if h >> 63 else -1.0
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+@st.cache_resource(show_spinner=False)
+def get_huggingface_embedder():
+    """Sentence-embedding model on CPU, loaded once per process."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=QUESTION_EMBEDDING_MODEL, model_kwargs={"device": "cpu"},
+                                 encode_kwargs={"normalize_embeddings": True})
+
+def embed_texts(texts):
+    if QUESTION_EMBEDDER == "huggingface":
+        return np.asarray(get_huggingface_embedder().embed_documents(list(texts)), dtype=np.float32)
+    return hashing_embeddings(texts)
+
+def kmeans(vectors, k, rng, iterations=10):
+    """Spherical k-means centroids of unit vectors."""
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)]
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = np.where(norms > 0, sums / np.where(norms > 0, norms, 1), centroids) # Empty clusters keep their centroid
+    return centroids.astype(np.float32)
+
+class QuestionIndexSnapshot:
+    """One loaded, immutable view of the question index, searched in memory."""
+    def __init__(self, vectors, ids, items, centroids=None, clusters=None):
+        self.vectors = vectors
+        self.ids = ids
+        self.items = items
+        self.row_of = {qid: row for row, qid in enumerate(ids)}
+        self.tests = np.array([item["test"] for item in items], dtype=object)
+        self.centroids = centroids
+        self.lists = []
+        if centroids is not None and len(vectors):
+            order = np.argsort(clusters, kind="stable")
+            bounds = np.searchsorted(clusters[order], np.arange(len(centroids) + 1))
+            self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(centroids))]
+
+    def search(self, vector, k, test_type=None, exclude=()):
+        """Top `k` items as (score, item) pairs, nearest first."""
+        if not len(self.ids):
+            return []
+        if self.centroids is None:
+            candidates = np.arange(len(self.ids))
+        else:
+            probes = np.argsort(-(self.centroids @ vector))[:QUESTION_INDEX_NPROBE]
+            candidates = np.concatenate([self.lists[c] for c in probes])
+        if test_type is not None:
+            candidates = candidates[self.tests[candidates] == test_type]
+        if exclude:
+            candidates = candidates[~np.isin(candidates, [self.row_of[qid] for qid in exclude if qid in self.row_of])]
+        scores = self.vectors[candidates] @ vector
+        top = np.argsort(-scores)[:k] if len(scores) <= k else np.argpartition(-scores, k)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.items[candidates[i]]) for i in top]
+
+class QuestionIndex:
+    """On-disk, append-only vector index of the question bank, shared by the workers using PREP_AI_DATA_DIR."""
+    def __init__(self, directory, compact_segments):
+        self.directory = directory
+        self.compact_segments = compact_segments
+        self.lock = threading.Lock()
+        self.queued = [] # ("add", items) and ("remove", ids), in the order they were requested
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="question-index")
+        os.makedirs(directory, exist_ok=True)
+
+    def add(self, test_type, topic, difficulty, questions):
+        """Queues `questions` to be embedded and written in the background."""
+        self._queue("add", [{"test": test_type, "topic": topic, "difficulty": difficulty, "question": q} for q in questions])
+
+    def remove(self, ids):
+        """Queues the removal of questions from the index (by question ID)."""
+        self._queue("remove", list(ids))
+
+    def _queue(self, kind, values):
+        with self.lock:
+            self.queued.append((kind, values))
+        self.executor.submit(self._flush)
+
+    def flush(self):
+        """Waits until every queued change has been written."""
+        self.executor.submit(self._flush).result()
+
+    def _flush(self):
+        """
+        Writes the queued changes, consecutive additions as one segment, then compacts when enough
+        segments have piled up.
+        """
+        with self.lock:
+            queued, self.queued = self.queued, []
+        batch = []
+        for kind, values in queued + [("end", None)]:
+            if kind == "add":
+                batch.extend(values)
+                continue
+            if batch:
+                self._write("segment", embed_texts([question_search_text(item["question"]) for item in batch]),
+                            [question_id(item["question"]) for item in batch], batch)
+                batch = []
+            if kind == "remove":
+                self._write("deleted", np.zeros((0, 1), dtype=np.float32), values, [])
+        if queued and len(self._files("segment-")) + len(self._files("deleted-")) >= self.compact_segments:
+            self.compact()
+
+    def _write(self, prefix, vectors, ids, items, **arrays):
+        path = os.path.join(self.directory, f"{prefix}-{time.time_ns()}-{uuid.uuid4().hex[:8]}.npz")
+        with open(f"{path}.tmp", "wb") as f:
+            np.savez(f, vectors=vectors, ids=np.array(ids, dtype=str),
+                     items=np.array([json.dumps(item, ensure_ascii=False) for item in items], dtype=str), **arrays)
+        os.replace(f"{path}.tmp", path)
+
+    def _files(self, prefix):
+        return sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                      if name.startswith(prefix) and name.endswith(".npz"))
+
+    def _load(self, path):
+        with np.load(path, allow_pickle=False) as arrays:
+            return dict(arrays)
+
+    def version(self):
+        """Changes whenever a segment or part is written or removed; used as a cache key."""
+        return tuple(sorted(name for name in os.listdir(self.directory) if name.endswith(".npz")))
+
+    def _changes(self):
+        """Segment and deletion files, oldest first (their names start with the time they were written)."""
+        return sorted(self._files("segment-") + self._files("deleted-"), key=lambda path: int(os.path.basename(path).split("-")[1]))
+
+    def _read(self):
+        """
+        (vectors, ids, items, centroids, clusters) of the part and every segment, newest copy of each
+        question kept and questions deleted after their last copy was written left out.
+        """
+        for _ in range(3):
+            try:
+                files = [self._load(path) for path in self._files("part-") + self._changes()]
+                break
+            except FileNotFoundError:
+                continue # A compaction replaced segments between listing and reading them
+        else:
+            raise RuntimeError("Question index kept changing while being read.")
+        deleted_at = {}
+        for position, f in enumerate(files):
+            if not len(f["items"]):
+                deleted_at.update((qid, position) for qid in f["ids"].tolist())
+        parts = [(position, f) for position, f in enumerate(files) if len(f["items"])]
+        if not parts:
+            return np.zeros((0, 1), dtype=np.float32), [], [], None, None
+        vectors = np.concatenate([p["vectors"] for _, p in parts])
+        ids = np.concatenate([p["ids"] for _, p in parts])
+        items = np.concatenate([p["items"] for _, p in parts])
+        written_at = np.concatenate([np.full(len(p["ids"]), position) for position, p in parts])
+        centroids = parts[0][1].get("centroids")
+        clusters = None
+        if centroids is not None: # Rows added since the last compaction join their nearest cluster
+            clusters = np.concatenate([parts[0][1]["clusters"]] +
+                                      [np.argmax(p["vectors"] @ centroids.T, axis=1) for _, p in parts[1:]])
+        _, first = np.unique(ids[::-1], return_index=True)
+        keep = np.sort(len(ids) - 1 - first)
+        keep = keep[[deleted_at.get(qid, -1) < position for qid, position in zip(ids[keep].tolist(), written_at[keep])]]
+        return (vectors[keep], ids[keep].tolist(), [json.loads(item) for item in items[keep]], centroids,
+                clusters[keep] if clusters is not None else None)
+
+    def snapshot(self):
+        return QuestionIndexSnapshot(*self._read())
+
+    def compact(self):
+        """
+        Merges the part and all segments into a new part, indexing any bank questions still missing
+        (e.g. after switching embedders) and retraining the IVF centroids for large indexes.
+        A lease in the state backend keeps it to one worker at a time.
+        """
+        def take_lease(expires, now):
+            if expires and expires > now:
+                return None, False
+            return now + 300, True
+
+        backend = get_state_backend()
+        if not backend.update("leases", "question_index_compaction", take_lease):
+            return
+        try:
+            merged = self._files("part-") + self._changes()
+            vectors, ids, items, _, _ = self._read()
+            known = set(ids)
+            missing = []
+            for key in backend.keys("question_bank"):
+                test_type, topic, difficulty = json.loads(key)
+                for q in backend.get("question_bank", key, []):
+                    if question_id(q) not in known:
+                        known.add(question_id(q))
+                        missing.append({"test": test_type, "topic": topic, "difficulty": difficulty, "question": q})
+            if missing:
+                new_vectors = embed_texts([question_search_text(item["question"]) for item in missing])
+                vectors = np.concatenate([vectors, new_vectors]) if ids else new_vectors
+                ids = ids + [question_id(item["question"]) for item in missing]
+                items = items + missing
+            if not ids:
+                return
+            arrays = {}
+            if len(ids) >= QUESTION_INDEX_IVF_MIN:
+                centroids = kmeans(vectors[:20000], int(np.sqrt(len(ids))), np.random.default_rng(0))
+                arrays = {"centroids": centroids, "clusters": np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)}
+            self._write("part", vectors, ids, items, **arrays)
+            for path in merged:
+                os.remove(path)
+        finally:
+            backend.put("leases", "question_index_compaction", 0)
+
+@st.cache_resource(show_spinner=False)
+def get_question_index():
+    """Process-wide question index; the first use indexes any bank questions not yet in it, in the background."""
+    index = QuestionIndex(QUESTION_INDEX_DIR, QUESTION_INDEX_COMPACT_SEGMENTS)
+    if not index._files("part-"):
+        index.executor.submit(index.compact)
+    return index
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def load_question_index(version):
+    """The question index loaded for searching, reloaded when `version` changes."""
+    return get_question_index().snapshot()
+
+def search_questions(query, k=10, test_type=None, exclude=()):
+    """
+    Bank questions nearest to `query` (free text, or a question dict to find similar ones) as
+    (score, item) pairs, where an item holds the question and its test, topic and difficulty.
+    """
+    text = question_search_text(query) if isinstance(query, dict) else query
+    index = get_question_index()
+    return load_question_index(index.version()).search(embed_texts([text])[0], k, test_type, exclude)
+
+def search_result_questions(results):
+    """Questions from search results, tagged for a practice session."""
+    return [{**item["question"], "test": item["test"], "topic": item["topic"],
+             "difficulty": item["question"].get("difficulty", item["difficulty"])} for _, item in results]
+
+# --- Groq API and Question Generation Functions ---
+
+def llm_available():
+    """True when LLM calls can be made: a Groq API key is set, or the stub or local provider or fixture replay is selected."""
+    return LLM_PROVIDER in ("stub", "local") or LLM_FIXTURE_MODE == "replay" or bool(st.session_state.groq_api_key)
 
+def run_llm_chain(task, prompt, variables, coalesce_key=None, max_tokens=None, usage_key=None):
+    """
+    Runs `prompt` through the model the router picks for `task` and returns the response text.
+    Groq calls go through the shared rate limit, and concurrent calls with the same
+    `coalesce_key` are merged into a single LLM request. `max_tokens` lowers the profile's
+    output budget; `usage_key` records the call's token counts in the usage ledger.
+    """
+    return prepare_llm_call(task, prompt, variables, coalesce_key, max_tokens, usage_key)()
+
+def submit_llm_chain(task, prompt, variables, coalesce_key=None, max_tokens=None, usage_key=None):
+    """Like `run_llm_chain`, but starts the request in the background and returns a Future of the response text."""
+    call = prepare_llm_call(task, prompt, variables, coalesce_key, max_tokens, usage_key)
+    return get_llm_router().request_executor.submit(call)
+
+def prepare_llm_call(task, prompt, variables, coalesce_key=None, max_tokens=None, usage_key=None):
+    """Returns a function that makes the request described in `run_llm_chain` and returns the response text."""
+    # Read session state here: the model calls below run on router worker threads
+    session_id = st.session_state.get("session_id", "default")
+    api_key = st.session_state.get("groq_api_key", "")
+    profile = LLM_TASK_PROFILES[task]
+    if max_tokens is not None:
+        profile = dict(profile, max_tokens=min(max_tokens, profile["max_tokens"]))
+    router = get_llm_router()
+    prompt_text = prompt.format(**variables)
+    prompt_tokens = estimate_tokens(prompt_text) # Counted once, before anything is sent
+
+    def call_model(spec, on_admitted, deadline):
+        provider, model = spec.split(":", 1)
+        build_llm, rate_limited = LLM_PROVIDERS[provider]
+        llm = build_llm(model, profile, api_key)
+        limiter = get_llm_rate_limiter()
+        reserved_tokens = prompt_tokens + profile["max_tokens"] # Reserve the worst case, refund the rest afterwards
+        if rate_limited:
+            # Queue no longer than the router waits for an answer, so abandoned requests do not hold a place in line
+            limiter.acquire(session_id, reserved_tokens, max_wait=min(LLM_MAX_QUEUE_WAIT, max(0, deadline - time.monotonic())))
+            if time.monotonic() >= deadline: # Admitted too late: nobody is waiting for the answer any more
+                limiter.refund(reserved_tokens)
+                raise TimeoutError(f"The '{task}' request was not admitted by the rate limiter within {profile['timeout']} seconds.")
+        on_admitted()
+        response = ""
+        started = time.monotonic()
+        try:
+            response = LLMChain(llm=llm, prompt=prompt).invoke(variables)['text']
+            router.record(spec, time.monotonic() - started)
+            if usage_key is not None:
+                get_token_usage_ledger().record_call(usage_key, prompt_tokens, estimate_tokens(response))
+            return response
+        except Exception:
+            router.record(spec, profile["timeout"]) # Count failures as worst-case latency
+            raise
+        finally:
+            if rate_limited:
+                limiter.refund(reserved_tokens - prompt_tokens - estimate_tokens(response))
+
+    def call():
+        if LLM_FIXTURE_MODE == "replay":
+            return load_llm_fixture(task, prompt_text)
+        response = router.complete(task, call_model)
+        if LLM_FIXTURE_MODE == "record":
+            save_llm_fixture(task, prompt_text, response)
+        return response
+
+    if coalesce_key is None:
+        return call
+    return lambda: get_request_coalescer().run(coalesce_key, call)
+
+def is_valid_mcq(q_data):
+    """True if a generated question has every field the test interface needs, with 4 options and answer A-D."""
+    return isinstance(q_data, dict) and \
+           all(key in q_data for key in ['question', 'options', 'correct_answer', 'explanation']) and \
+           isinstance(q_data.get('options'), list) and len(q_data.get('options', [])) == 4 and \
+           q_data.get('correct_answer') in ['A', 'B', 'C', 'D']
+
+def is_valid_coding_problem(p_data):
+    """True if a generated coding problem has every field the coding interface displays."""
+    return isinstance(p_data, dict) and all(key in p_data for key in ['title', 'description', 'difficulty', 'example'])
+
+def paper_variant_instruction(variant):
+    """Prompt text asking for content specific to paper `variant`, so bulk-provisioned papers differ ("" for live tests)."""
+    if variant is None:
+        return ""
+    return f"\n    This is paper variant {variant} of a set; make its content different from every other variant.\n"
+
+def question_prompt(test_type, include_examples=True, variant=None):
+    """The question-generation PromptTemplate for `test_type`, or None if the test has no MCQ prompt."""
     # Define prompt templates based on test type for tailored question generation
     # Each prompt specifies the desired JSON format and content
     # The key change in the prompt is explicitly asking for a SINGLE JSON ARRAY.
@@ -197,7 +1498,8 @@ def generate_questions(test_type, topic, count=5, difficulty="Medium"):
         **Format your entire response as a single JSON array of objects. Do not include any text before or after the JSON.**
         Each object must have 'question', 'options' (an array of strings), 'correct_answer' (a single letter 'A','B','C','D'), and 'explanation' keys.
         Ensure options are distinct and plausible. Avoid repeating questions.
-        Example format:
+    """
+    base_example = """    Example format:
         [
             {{
                 "question": "Which of the following is an example of an article?",
@@ -214,25 +1516,25 @@ def generate_questions(test_type, topic, count=5, difficulty="Medium"):
         ]
     """
 
+    # Per-type additions are split into instructions (always sent) and an example (first request only)
+    type_example = ""
     if test_type == "English Usage Test":
-        # Pass variables to format method of the string
-        prompt_template = base_prompt_template
+        type_instructions = ""
     elif test_type == "Analytical Reasoning Test":
-        prompt_template = base_prompt_template + \
-            """
+        type_instructions = """
             \nInstructions:
             - Each question must test logical thinking, deductions, sequences, or patterns.
             - Strictly avoid questions involving flowcharts, visual reasoning diagrams, or complex geometric figures. Focus on text-based logical puzzles, series, coding-decoding, or critical thinking scenarios.
             - For each question, include: 'question', 'options', 'correct_answer', 'explanation'.
             - Ensure questions are unique and do not repeat previous questions within the generated set."""
     elif test_type == "Quantitative Ability Test":
-        prompt_template = base_prompt_template + \
-            """
+        type_instructions = """
             \nInclude numerical problems with clear mathematical solutions.
             **Ensure the correct answer is always present and clearly identifiable among the options.**
             Focus on problems involving logical reasoning with numbers, percentages, ratios, time & work, profit & loss, basic algebra, and data interpretation.
             Avoid overly complex calculations; emphasize conceptual understanding and problem-solving approach.
-            Example for Quantitative Ability Test:
+            """
+        type_example = """Example for Quantitative Ability Test:
             {{
                 "question": "A person invests ₹1500 in a scheme that offers 10% interest per annum compounded annually. What will be the amount after 2 years?",
                 "options": ["A) ₹1750", "B) ₹1800", "C) ₹1815", "D) ₹1850"],
@@ -241,24 +1543,175 @@ def generate_questions(test_type, topic, count=5, difficulty="Medium"):
             }}
             """
     elif test_type == "Domain Test (DSA)":
-        prompt_template = base_prompt_template + \
-            "\nFocus on practical DSA concepts and implementation."
+        type_instructions = "\nFocus on practical DSA concepts and implementation."
     else:
-        st.error(f"Question generation not implemented for {test_type}.")
-        return []
+        return None
+
+    if include_examples:
+        prompt_template = base_prompt_template + base_example + type_instructions + type_example
+    else:
+        prompt_template = base_prompt_template + type_instructions
 
     # Define the PromptTemplate with the correct input variables
-    prompt = PromptTemplate(
+    return PromptTemplate(
         input_variables=["count", "topic", "difficulty"],
-        template=prompt_template
+        template=prompt_template + paper_variant_instruction(variant)
     )
 
+def question_llm_request(test_type, topic, count, difficulty, prompt, coalesce=True, include_examples=True, variant=None):
+    """
+    Keyword arguments of the LLM request behind `generate_questions`, for `run_llm_chain` or `submit_llm_chain`.
+    `include_examples` and `variant` must be the ones `prompt` was built with.
+    """
+    # Identical in-flight requests from other sessions share one LLM call; the key covers everything that shapes the prompt
+    return dict(task="question_generation", prompt=prompt, variables={"count": count, "topic": topic, "difficulty": difficulty},
+                coalesce_key=(test_type, topic, difficulty, count, include_examples, variant) if coalesce else None,
+                max_tokens=question_output_budget(test_type, count), usage_key=test_type)
+
+# --- Quantitative Answer Verification ---
+# Generated Quantitative items are checked locally before they are served or banked. The explanation's
+# final result (the arithmetic after its last "=") is evaluated by a whitelisting AST evaluator and
+# compared with the number in every option; extraction is per item, the comparison runs once per batch
+# on (items x 4) arrays. Intermediate values never count as evidence. An item whose claimed value the
+# explanation doesn't mention at all is corrected when its final result is a lone number matching
+# exactly one option, and rejected otherwise. Ambiguous items and items without arithmetic are kept.
+
+VERIFY_REL_TOLERANCE = 0.002 # Explanations round intermediate results, e.g. 33.33 for 100/3
+VERIFY_ABS_TOLERANCE = 0.01
+VERIFY_MAX_EXPONENT = 100
+SAFE_OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+                  ast.Pow: operator.pow, ast.USub: operator.neg, ast.UAdd: operator.pos}
+
+def safe_eval(expression):
+    """Value of an expression of numbers, + - * / ** and parentheses, or None if it is anything else."""
+    def evaluate(node):
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            return node.value
+        if isinstance(node, ast.BinOp) and type(node.op) in SAFE_OPERATORS:
+            left, right = evaluate(node.left), evaluate(node.right)
+            if isinstance(node.op, ast.Pow) and abs(right) > VERIFY_MAX_EXPONENT:
+                raise ValueError("exponent too large")
+            return SAFE_OPERATORS[type(node.op)](left, right)
+        if isinstance(node, ast.UnaryOp) and type(node.op) in SAFE_OPERATORS:
+            return SAFE_OPERATORS[type(node.op)](evaluate(node.operand))
+        raise ValueError("not arithmetic")
+
     try:
-        chain = LLMChain(llm=llm, prompt=prompt)
-        # Pass the variables as a dictionary to chain.invoke()
-        # This is the correct way to pass input variables to LLMChain
-        response_obj = chain.invoke({"count": count, "topic": topic, "difficulty": difficulty})
-        response = response_obj['text'] # Extract the string response from the dictionary
+        value = float(evaluate(ast.parse(expression, mode="eval").body))
+    except (SyntaxError, ValueError, TypeError, ArithmeticError):
+        return None
+    return value if math.isfinite(value) else None
+
+def arithmetic_values(text):
+    """Values of the arithmetic runs in `text`, with currency, thousands separators and % dropped."""
+    text = re.sub(r"(?<=\d),(?=\d{3}\b)", "", text)
+    text = re.sub(r"₹|\$|\bRs\.?|\bINR\b|%", "", text)
+    text = text.replace("×", "*").replace("÷", "/").replace("−", "-").replace("^", "**")
+    text = re.sub(r"(?<=[\d)])\s*[xX]\s*(?=[\d(])", "*", text) # "60 x 2"
+    values = []
+    for run in re.findall(r"[-+(]*\d[\d\s.+\-*/()]*", text):
+        run = run.strip().rstrip(".+-*/( ")
+        value = safe_eval(run) if len(run) <= 200 else None
+        if value is not None:
+            values.append(value)
+    return values
+
+def option_value(option):
+    """The number an option states ("C) ₹1815" -> 1815.0), or NaN if it states none or several."""
+    values = arithmetic_values(re.sub(r"^\s*[A-Da-d][).:]\s*", "", option))
+    return values[0] if len(values) == 1 else np.nan
+
+def verify_quantitative_questions(questions):
+    """
+    Checks each question's answer letter against the final result of its explanation. Returns
+    (kept questions, with corrected letters, counts of "verified", "corrected", "rejected" and "unchecked").
+    """
+    if not questions:
+        return [], {"verified": 0, "corrected": 0, "rejected": 0, "unchecked": 0}
+    explanations = [str(q["explanation"]).replace("≈", "=") for q in questions]
+    final_results = [arithmetic_values(text.split("=")[-1]) if "=" in text else [] for text in explanations]
+    mentioned = [arithmetic_values(text) for text in explanations]
+    width = max(1, max(len(values) for values in mentioned))
+    mentioned_values = np.full((len(questions), width), np.nan)
+    for i, values in enumerate(mentioned):
+        mentioned_values[i, :len(values)] = values
+    options = np.array([[option_value(str(option)) for option in q["options"]] for q in questions])
+    claimed = np.array(["ABCD".index(q["correct_answer"]) for q in questions])
+    final = np.array([values[0] if values else np.nan for values in final_results])
+    lone_final = np.array([len(values) == 1 for values in final_results]) # "= 210", not "= 100. The total is 1100"
+
+    rows = np.arange(len(questions))
+    claimed_value = options[rows, claimed]
+    final_matches = np.isclose(options, final[:, None], rtol=VERIFY_REL_TOLERANCE, atol=VERIFY_ABS_TOLERANCE)
+    claim_mentioned = np.isclose(mentioned_values, claimed_value[:, None], rtol=VERIFY_REL_TOLERANCE,
+                                 atol=VERIFY_ABS_TOLERANCE).any(axis=1)
+    checkable = ~np.isnan(claimed_value) & ~np.isnan(final)
+    verified = checkable & final_matches[rows, claimed]
+    contradicted = checkable & ~verified & ~claim_mentioned
+    correctable = contradicted & lone_final & (final_matches.sum(axis=1) == 1)
+    rejected = contradicted & ~correctable
+    corrected_letters = np.array(list("ABCD"))[final_matches.argmax(axis=1)]
+
+    kept = []
+    for i, q in enumerate(questions):
+        if correctable[i]:
+            kept.append({**q, "correct_answer": str(corrected_letters[i])})
+        elif not rejected[i]:
+            kept.append(q)
+    return kept, {"verified": int(verified.sum()), "corrected": int(correctable.sum()), "rejected": int(rejected.sum()),
+                  "unchecked": int((~verified & ~contradicted).sum())}
+
+def extract_llm_json(response, first_key):
+    """
+    The items of an LLM response: the JSON array in it if there is one, otherwise every JSON object
+    whose first key is `first_key` (models sometimes concatenate objects without an array). Returns
+    (items, [(object text, error)] for objects that did not parse); raises json.JSONDecodeError if
+    the array is malformed and ValueError if neither an array nor an object is found.
+    """
+    # re.DOTALL makes '.' match newlines, so the array may span many lines
+    json_array_match = re.search(r'\[\s*\{.*\}\s*\]', response, re.DOTALL)
+    if json_array_match:
+        return json.loads(json_array_match.group(0)), []
+    items, unparsable = [], []
+    for obj_str in re.findall(r'\{\s*"' + re.escape(first_key) + r'":\s*".*?"(?:,\s*".*?":\s*.*?)*?\s*\}', response, re.DOTALL):
+        try:
+            items.append(json.loads(obj_str))
+        except json.JSONDecodeError as e:
+            unparsable.append((obj_str, e))
+    if not items and not unparsable:
+        raise ValueError("no JSON array or object found")
+    return items, unparsable
+
+def generate_questions(test_type, topic, count=5, difficulty="Medium", include_examples=True, rng=None, coalesce=True,
+                       pending_response=None, variant=None):
+    """
+    Generates multiple-choice questions using the Groq API.
+    Includes robust JSON parsing. Valid questions are added to the shared question bank; on
+    failure, previously generated bank questions (or sample questions) are used instead.
+    `include_examples=False` drops the worked examples from the prompt; test assembly only
+    sends them with the first topic of a batch. `rng` (a seeded random.Random) makes the
+    sampling reproducible; the global RNG is used when it is omitted. `coalesce=False` always makes
+    its own LLM call instead of sharing a concurrent identical request (bulk provisioning wants
+    distinct questions for every paper). `pending_response`, a Future from `submit_llm_chain`, supplies
+    a response requested ahead of time instead of making the call here. `variant` (a provisioned
+    paper's seed) asks for content specific to that paper.
+    """
+    rng = rng or random
+    if not llm_available():
+        st.warning(f"Using sample questions for {test_type} - {topic} ({difficulty}). Groq API key is missing or invalid.")
+        return fallback_questions(test_type, topic, count, difficulty, rng)
+
+    prompt = question_prompt(test_type, include_examples, variant)
+    if prompt is None:
+        st.error(f"Question generation not implemented for {test_type}.")
+        return []
+
+    try:
+        if pending_response is not None:
+            response = pending_response.result()
+        else:
+            response = run_llm_chain(**question_llm_request(test_type, topic, count, difficulty, prompt, coalesce,
+                                                                include_examples, variant))
 
         # --- DEBUGGING STEP: Print the raw AI response ---
         st.write("--- Debugging AI Response ---")
@@ -267,60 +1720,47 @@ def generate_questions(test_type, topic, count=5, difficulty="Medium"):
         # --- END DEBUGGING STEP ---
 
         # Robust JSON parsing using regex to find the array
-        questions_data = []
-        # Look for a JSON array pattern [ ... ]
-        # re.DOTALL makes '.' match newlines, re.S is an alias for re.DOTALL
-        json_array_match = re.search(r'\[\s*\{.*\}\s*\]', response, re.DOTALL)
-
-        if json_array_match:
-            json_string = json_array_match.group(0)
-            try:
-                questions_data = json.loads(json_string)
-            except json.JSONDecodeError as e:
-                st.warning(f"JSON parsing error after regex extraction: {e}. AI response might still be malformed inside the array. Using sample questions.")
-                return create_sample_questions(test_type, topic, count, difficulty)
-        else:
-            # If a single array isn't found, try to find individual JSON objects
-            # This is to handle the exact scenario you provided where multiple objects are concatenated
-            json_objects_matches = re.findall(r'\{\s*"question":\s*".*?"(?:,\s*".*?":\s*.*?)*?\s*\}', response, re.DOTALL)
-            if json_objects_matches:
-                for obj_str in json_objects_matches:
-                    try:
-                        questions_data.append(json.loads(obj_str))
-                    except json.JSONDecodeError as e:
-                        st.warning(f"Could not parse individual JSON object: {obj_str[:100]}... Error: {e}")
-                        # Continue to try other objects even if one fails
-            else:
-                st.warning("No valid JSON structure (array or individual objects) found in AI response. Using sample questions.")
-                return create_sample_questions(test_type, topic, count, difficulty)
+        try:
+            questions_data, unparsable = extract_llm_json(response, "question")
+        except json.JSONDecodeError as e:
+            st.warning(f"JSON parsing error after regex extraction: {e}. AI response might still be malformed inside the array. Using sample questions.")
+            return fallback_questions(test_type, topic, count, difficulty, rng)
+        except ValueError:
+            st.warning("No valid JSON structure (array or individual objects) found in AI response. Using sample questions.")
+            return fallback_questions(test_type, topic, count, difficulty, rng)
+        for obj_str, e in unparsable: # Other objects are still used when one fails
+            st.warning(f"Could not parse individual JSON object: {obj_str[:100]}... Error: {e}")
 
         # Validate the structure of each question object
-        valid_questions = []
-        for q_data in questions_data:
-            if all(key in q_data for key in ['question', 'options', 'correct_answer', 'explanation']) and \
-               isinstance(q_data.get('options'), list) and len(q_data.get('options', [])) == 4 and \
-               q_data.get('correct_answer') in ['A', 'B', 'C', 'D']:
-                valid_questions.append(q_data)
+        valid_questions = [q_data for q_data in questions_data if is_valid_mcq(q_data)]
+        if test_type == "Quantitative Ability Test":
+            # Fix or drop items whose answer letter contradicts their own arithmetic, before they are served or banked
+            valid_questions, verdicts = verify_quantitative_questions(valid_questions)
+            get_token_usage_ledger().record_verification(test_type, verdicts["corrected"], verdicts["rejected"])
+        get_token_usage_ledger().record_questions(test_type, estimate_tokens(response), len(questions_data),
+                                                  min(len(valid_questions), count))
+        add_to_question_bank(test_type, topic, difficulty, valid_questions)
 
         if valid_questions:
             # Randomly sample 'count' questions if more were generated
             if len(valid_questions) > count:
-                return random.sample(valid_questions, count)
+                return rng.sample(valid_questions, count)
             return valid_questions
         else:
             st.warning("AI generated questions were malformed or empty after validation. Using sample questions.")
-            return create_sample_questions(test_type, topic, count, difficulty)
+            return fallback_questions(test_type, topic, count, difficulty, rng)
 
     except Exception as e:
         st.error(f"Error generating questions from Groq: {str(e)}. Using sample questions.")
         print(f"Exception details: {e}")  # Log the exception for debugging
-        return create_sample_questions(test_type, topic, count, difficulty)
+        return fallback_questions(test_type, topic, count, difficulty, rng)
 
-def create_sample_questions(test_type, topic, count, difficulty="Medium"):
+def create_sample_questions(test_type, topic, count, difficulty="Medium", rng=None):
     """
     Provides fallback sample questions if AI generation fails or API key is missing.
     Ensures 'count' questions are returned, even by repeating existing samples if needed.
     """
+    rng = rng or random
     all_sample_q = []
 
     # Define a comprehensive set of sample questions for each test type and difficulty
@@ -386,57 +1826,51 @@ def create_sample_questions(test_type, topic, count, difficulty="Medium"):
     if len(all_sample_q) < count:
         # If fewer unique samples than requested, repeat and shuffle
         repeated_samples = (all_sample_q * ((count // len(all_sample_q)) + 1))[:count]
-        random.shuffle(repeated_samples)
+        rng.shuffle(repeated_samples)
         return repeated_samples
     else:
         # Otherwise, pick a random sample of the desired count
-        return random.sample(all_sample_q, count)
-
-
-def generate_essay_topic():
-    """Generates an essay topic using the Groq API or falls back to a sample."""
-    llm = initialize_groq_client()
-    if not llm:
-        return random.choice([
-            "The Impact of Artificial Intelligence on Future Software Development",
-            "Cybersecurity Challenges in the Digital Age",
-            "The Role of Cloud Computing in Modern Business",
-            "Ethical Considerations in Software Engineering",
-            "The Future of Remote Work in the Tech Industry"
-        ])
+        return rng.sample(all_sample_q, count)
+
+
+SAMPLE_ESSAY_TOPICS = [
+    "The Impact of Artificial Intelligence on Future Software Development",
+    "Cybersecurity Challenges in the Digital Age",
+    "The Role of Cloud Computing in Modern Business",
+    "Ethical Considerations in Software Engineering",
+    "The Future of Remote Work in the Tech Industry"
+]
+
+def generate_essay_topic(rng=None, variant=None):
+    """Generates an essay topic using the Groq API or falls back to a sample. `variant` as in `generate_questions`."""
+    rng = rng or random
+    if not llm_available():
+        return rng.choice(SAMPLE_ESSAY_TOPICS)
 
     prompt = PromptTemplate(
         input_variables=[],
         template="""Generate a concise and thought-provoking essay topic for CSE students' employability test.
         The topic should be related to technology, engineering, or professional development.
         Return only the topic title, without any introductory or concluding remarks. Ensure the topic is unique and not generic.
-        """
+        """ + paper_variant_instruction(variant)
     )
 
     try:
-        chain = LLMChain(llm=llm, prompt=prompt)
-        response = chain.run()
+        response = run_llm_chain("essay_topic", prompt, {})
         return response.strip().replace('"', '')
     except Exception as e:
         st.error(f"Error generating essay topic: {str(e)}. Using a sample topic.")
-        return random.choice([
-            "The Impact of Artificial Intelligence on Future Software Development",
-            "Cybersecurity Challenges in the Digital Age",
-            "The Role of Cloud Computing in Modern Business",
-            "Ethical Considerations in Software Engineering",
-            "The Future of Remote Work in the Tech Industry"
-        ])
+        return rng.choice(SAMPLE_ESSAY_TOPICS)
     
 
-def generate_coding_problems():
+def generate_coding_problems(rng=None, variant=None):
     """
     Generates coding problems using the Groq API.
-    Includes robust JSON parsing and falls back to sample problems on failure.
+    Includes robust JSON parsing and falls back to sample problems on failure. `variant` as in `generate_questions`.
     """
-    llm = initialize_groq_client()
-    if not llm:
+    if not llm_available():
         st.warning("Using sample coding problems. Groq API key is missing or invalid.")
-        return generate_coding_problems_fallback()
+        return generate_coding_problems_fallback(rng)
 
     # The key change in the prompt is explicitly asking for a SINGLE JSON ARRAY.
     # We will still use regex to be extra safe.
@@ -464,13 +1898,11 @@ def generate_coding_problems():
             "example": "Input: s = 'babad'\\nOutput: 'bab' (or 'aba')"
         }}
     ]
-    """
+    """ + paper_variant_instruction(variant)
 )
 
     try:
-        chain = LLMChain(llm=llm, prompt=prompt)
-        response_obj = chain.invoke({}) # Pass an empty dictionary as no variables are in the prompt
-        response = response_obj['text'] # Extract the string response
+        response = run_llm_chain("coding_problems", prompt, {}) # No variables are in the prompt
 
         # --- DEBUGGING STEP: Print the raw AI response ---
         st.write("--- Debugging AI Coding Response ---")
@@ -480,79 +1912,1986 @@ def generate_coding_problems():
 
 
         # Robust JSON parsing for coding problems using regex
-        problems_data = []
-        json_array_match = re.search(r'\[\s*\{.*\}\s*\]', response, re.DOTALL)
-
-        if json_array_match:
-            json_string = json_array_match.group(0)
-            try:
-                problems_data = json.loads(json_string)
-            except json.JSONDecodeError as e:
-                st.warning(f"JSON parsing error for coding problems after regex extraction: {e}. AI response might still be malformed inside the array. Using sample problems.")
-                return generate_coding_problems_fallback()
-        else:
-            # If a single array isn't found, try to find individual JSON objects
-            json_objects_matches = re.findall(r'\{\s*"title":\s*".*?"(?:,\s*".*?":\s*.*?)*?\s*\}', response, re.DOTALL)
-            if json_objects_matches:
-                for obj_str in json_objects_matches:
-                    try:
-                        problems_data.append(json.loads(obj_str))
-                    except json.JSONDecodeError as e:
-                        st.warning(f"Could not parse individual coding problem JSON object: {obj_str[:100]}... Error: {e}")
-            else:
-                st.warning("No valid JSON structure (array or individual objects) found in AI response for coding problems. Using sample problems.")
-                return generate_coding_problems_fallback()
+        try:
+            problems_data, unparsable = extract_llm_json(response, "title")
+        except json.JSONDecodeError as e:
+            st.warning(f"JSON parsing error for coding problems after regex extraction: {e}. AI response might still be malformed inside the array. Using sample problems.")
+            return generate_coding_problems_fallback(rng)
+        except ValueError:
+            st.warning("No valid JSON structure (array or individual objects) found in AI response for coding problems. Using sample problems.")
+            return generate_coding_problems_fallback(rng)
+        for obj_str, e in unparsable:
+            st.warning(f"Could not parse individual coding problem JSON object: {obj_str[:100]}... Error: {e}")
 
         # Basic validation for coding problems
-        valid_problems = []
-        for p_data in problems_data:
-            if all(key in p_data for key in ['title', 'description', 'difficulty', 'example']):
-                valid_problems.append(p_data)
-
-        if len(valid_problems) >= 2: # Ensure at least 2 problems are returned, take first two
-            return valid_problems[:2]
+        valid_problems = [p_data for p_data in problems_data if is_valid_coding_problem(p_data)]
+
+        # Keep problems whose judge fixtures could be built, so every submission can be graded
+        gradable_problems = [p for p in map(prepare_coding_problem, valid_problems[:2]) if p is not None]
+        if len(gradable_problems) >= 2: # Ensure at least 2 problems are returned, take first two
+            return gradable_problems
+        elif len(valid_problems) >= 2:
+            st.warning("A judge could not be built for every AI generated coding problem. Using sample problems for the rest.")
+            return (gradable_problems + generate_coding_problems_fallback(rng))[:2]
         else:
             st.warning("AI generated coding problems were malformed or less than 2. Using sample problems.")
-            return generate_coding_problems_fallback()
+            return generate_coding_problems_fallback(rng)
 
     except Exception as e:
         st.error(f"Error generating coding problems from Groq: {str(e)}. Using sample problems.")
-        return generate_coding_problems_fallback()
-
-def generate_coding_problems_fallback():
-    """Provides fallback sample coding problems."""
-    sample_problems = [
-        {
-            "title": "Two Sum",
-            "description": "Given an array of integers `nums` and an integer `target`, return indices of the two numbers such as they add up to `target`.",
-            "difficulty": "Easy",
-            "example": "Input: nums = [2,7,11,15], target = 9\nOutput: [0,1] (Because nums[0] + nums[1] = 2 + 7 = 9)"
-        },
-        {
-            "title": "Palindrome Check",
-            "description": "Write a function to check if a given string is a palindrome. A palindrome reads the same forwards and backwards, ignoring case and non-alphanumeric characters.",
-            "difficulty": "Medium",
-            "example": "Input: 'Racecar'\nOutput: True\n\nInput: 'hello'\nOutput: False"
-        },
-        {
-            "title": "Fibonacci Sequence",
-            "description": "Write a function that generates the first `n` numbers in the Fibonacci sequence. The sequence starts with 0 and 1, and each subsequent number is the sum of the two preceding ones.",
-            "difficulty": "Easy",
-            "example": "Input: n = 5\nOutput: [0, 1, 1, 2, 3]"
-        },
-        {
-            "title": "Factorial Calculation",
-            "description": "Write a recursive function to calculate the factorial of a non-negative integer `n`. The factorial of a number `n` is the product of all integers from 1 to `n`.",
-            "difficulty": "Easy",
-            "example": "Input: n = 4\nOutput: 24 (Because 4 * 3 * 2 * 1 = 24)"
-        }
-    ]
+        return generate_coding_problems_fallback(rng)
+
+SAMPLE_CODING_PROBLEMS = [
+    {
+        "title": "Two Sum",
+        "description": "Given an array of integers `nums` and an integer `target`, return indices of the two numbers such as they add up to `target`.",
+        "difficulty": "Easy",
+        "example": "Input: nums = [2,7,11,15], target = 9\nOutput: [0,1] (Because nums[0] + nums[1] = 2 + 7 = 9)"
+    },
+    {
+        "title": "Palindrome Check",
+        "description": "Write a function to check if a given string is a palindrome. A palindrome reads the same forwards and backwards, ignoring case and non-alphanumeric characters.",
+        "difficulty": "Medium",
+        "example": "Input: 'Racecar'\nOutput: True\n\nInput: 'hello'\nOutput: False"
+    },
+    {
+        "title": "Fibonacci Sequence",
+        "description": "Write a function that generates the first `n` numbers in the Fibonacci sequence. The sequence starts with 0 and 1, and each subsequent number is the sum of the two preceding ones.",
+        "difficulty": "Easy",
+        "example": "Input: n = 5\nOutput: [0, 1, 1, 2, 3]"
+    },
+    {
+        "title": "Factorial Calculation",
+        "description": "Write a recursive function to calculate the factorial of a non-negative integer `n`. The factorial of a number `n` is the product of all integers from 1 to `n`.",
+        "difficulty": "Easy",
+        "example": "Input: n = 4\nOutput: 24 (Because 4 * 3 * 2 * 1 = 24)"
+    }
+]
+
+def generate_coding_problems_fallback(rng=None):
+    """Provides fallback sample coding problems, with their judges' I/O format and sample."""
+    rng = rng or random
     # Ensure exactly 2 problems are returned
-    if len(sample_problems) >= 2:
-        return random.sample(sample_problems, 2)
+    if len(SAMPLE_CODING_PROBLEMS) >= 2:
+        problems = rng.sample(SAMPLE_CODING_PROBLEMS, 2)
     else:
         # If somehow fewer than 2 samples are available, repeat to get 2
-        return (sample_problems * 2)[:2]
+        problems = (SAMPLE_CODING_PROBLEMS * 2)[:2]
+    return [prepare_coding_problem(p) or p for p in problems]
+
+# --- Judge Runners ---
+# Judged programs (submissions, reference solutions and input generators) run in Python, C, C++ or
+# Java, wherever the toolchain is installed. Build artifacts are cached on disk by a hash of the
+# language and source, so re-submissions and repeated test runs never recompile. Interpreted and JVM
+# languages run in warm processes started ahead of time: each waits for one job line (program and
+# arguments) on stdin, runs that program once and exits, and the pool starts a replacement. A warm
+# process sees only its own working directory, into which the one program it runs is copied.
+# Compilers and programs run in a sandbox (bwrap, nsjail, or unshare when the server runs as root):
+# an unprivileged uid, no network, no environment, and a read-only view of the toolchains with only
+# their own working directory writable. Without a sandbox, no code is judged.
+
+JUDGE_BUILD_DIR = os.path.join(PREP_AI_DATA_DIR, "judge_builds")
+JUDGE_WARM_POOL_SIZE = int(os.getenv("JUDGE_WARM_POOL_SIZE", "2")) # Warm processes kept per language
+JUDGE_COMPILE_TIMEOUT = 30.0
+JUDGE_MEMORY_MB = 512
+JUDGE_MAX_CPU_SECONDS = 11 # CPU cap of every judged process; wall-clock time limits are enforced per test
+JUDGE_SANDBOX = os.getenv("JUDGE_SANDBOX", "auto") # "bwrap", "nsjail", "unshare", "auto" (first one installed) or "none" (local development only)
+JUDGE_SANDBOX_UID = int(os.getenv("JUDGE_SANDBOX_UID", "65534")) # Unprivileged uid and gid judged code runs as ("nobody")
+JUDGE_SANDBOX_ROOT = os.path.join(tempfile.gettempdir(), "prep_ai_jail") # Where the "unshare" sandbox mounts its empty root
+# Host paths the sandbox shows (read-only): toolchains, shared libraries and the Python runtime. The app
+# directory, its .env and data directory, home directories and the rest of the host are not mounted.
+JUDGE_SANDBOX_SYSTEM_PATHS = ["/usr", "/bin", "/sbin", "/lib", "/lib32", "/lib64", "/etc", sys.base_prefix, sys.prefix,
+                              os.getenv("JAVA_HOME", "")]
+JUDGE_ENV = {"PATH": "/usr/local/bin:/usr/bin:/bin", "LANG": "C.UTF-8", "HOME": "/tmp"} # The whole environment of judged processes
+
+# Warm bootstraps read the job line unbuffered, so the program's own stdin starts at its first input byte
+PYTHON_WARM_BOOTSTRAP = """import os, runpy, sys
+line = b""
+while not line.endswith(b"\\n"):
+    byte = os.read(0, 1)
+    if not byte:
+        sys.exit(0)
+    line += byte
+program, *args = line.decode("utf-8").rstrip("\\n").split("\\t")
+sys.argv = [program] + args
+runpy.run_path(program, run_name="__main__")
+"""
+JAVA_WARM_BOOTSTRAP = """import java.io.*;
+import java.lang.reflect.*;
+import java.net.*;
+import java.nio.charset.StandardCharsets;
+import java.util.Arrays;
+
+public class WarmRunner {
+    public static void main(String[] unused) throws Exception {
+        InputStream raw = new FileInputStream(FileDescriptor.in);
+        ByteArrayOutputStream line = new ByteArrayOutputStream();
+        for (int b = raw.read(); b != '\\n'; b = raw.read()) {
+            if (b == -1) return;
+            line.write(b);
+        }
+        String[] job = line.toString(StandardCharsets.UTF_8).split("\\t", -1);
+        URLClassLoader loader = new URLClassLoader(new URL[] {new File(job[0]).toURI().toURL()}, ClassLoader.getPlatformClassLoader());
+        Method main = loader.loadClass("Main").getMethod("main", String[].class);
+        try {
+            main.invoke(null, (Object) Arrays.copyOfRange(job, 1, job.length));
+        } catch (InvocationTargetException e) {
+            e.getCause().printStackTrace();
+            System.exit(1);
+        }
+        System.out.flush();
+    }
+}
+"""
+
+# "{python}" is this interpreter, "{dir}" the build directory, "{source}" the source file name and
+# "{warm}" the build directory of the language's warm bootstrap.
+JUDGE_LANGUAGES = {
+    "python": {
+        "label": "Python 3", "source": "main.py", "highlight": "python", "limit_memory": True,
+        "compile": ["{python}", "-I", "-c", "import py_compile, sys; py_compile.compile(sys.argv[1], cfile='main.pyc', doraise=True)", "{source}"],
+        "run": ["{python}", "-I", "{dir}/main.pyc"],
+        "warm": ["{python}", "-I", "-c", PYTHON_WARM_BOOTSTRAP], "warm_program": "{dir}/main.pyc",
+        "empty_program": "pass\n",
+    },
+    "c": {
+        "label": "C (gcc, C17)", "source": "main.c", "highlight": "c", "limit_memory": True,
+        "compile": ["gcc", "-O2", "-std=c17", "-o", "main", "{source}", "-lm"],
+        "run": ["{dir}/main"],
+        "empty_program": "int main(void) { return 0; }\n",
+    },
+    "cpp": {
+        "label": "C++ (g++, C++17)", "source": "main.cpp", "highlight": "cpp", "limit_memory": True,
+        "compile": ["g++", "-O2", "-std=c++17", "-o", "main", "{source}"],
+        "run": ["{dir}/main"],
+        "empty_program": "int main() { return 0; }\n",
+    },
+    "java": {
+        "label": "Java (class Main)", "source": "Main.java", "highlight": "java",
+        "limit_memory": False, # The JVM reserves more address space than it uses; its heap is capped with -Xmx instead
+        "compile": ["javac", "-encoding", "UTF-8", "{source}"],
+        "run": ["java", f"-Xmx{JUDGE_MEMORY_MB}m", "-Xss64m", "-cp", "{dir}", "Main"],
+        "warm": ["java", f"-Xmx{JUDGE_MEMORY_MB}m", "-Xss64m", "-cp", "{warm}", "WarmRunner"], "warm_program": "{dir}",
+        "warm_bootstrap": ("WarmRunner.java", JAVA_WARM_BOOTSTRAP),
+        "empty_program": "public class Main { public static void main(String[] args) {} }\n",
+    },
+}
+
+def limit_judged_process(cpu_seconds, limit_memory=True):
+    """preexec_fn capping a judged process's CPU time, memory and file writes (POSIX only)."""
+    def apply_limits():
+        import resource
+        resource.setrlimit(resource.RLIMIT_CPU, (int(math.ceil(cpu_seconds)),) * 2)
+        resource.setrlimit(resource.RLIMIT_FSIZE, (16 * 2 ** 20,) * 2)
+        if limit_memory:
+            resource.setrlimit(resource.RLIMIT_AS, (JUDGE_MEMORY_MB * 2 ** 20,) * 2)
+    return apply_limits if os.name == "posix" else None
+
+# Builds the "unshare" sandbox's root from an empty tmpfs, then drops to the sandbox uid inside it.
+# Arguments: root, uid, working directory, then "ro"/"rw" and a path for each mount, then "--" and the command.
+JUDGE_UNSHARE_SCRIPT = """
+root=$1 uid=$2 cwd=$3
+shift 3
+PATH=$PATH:/usr/sbin:/sbin
+mount -t tmpfs -o mode=755 jail "$root"
+mkdir -p "$root/proc" "$root/tmp" "$root/dev"
+mount -t proc proc "$root/proc"
+mount -t tmpfs -o mode=1777 tmp "$root/tmp"
+for device in null zero random urandom; do
+    touch "$root/dev/$device"
+    mount --bind "/dev/$device" "$root/dev/$device"
+done
+while [ "$1" != "--" ]; do
+    if [ -L "$2" ]; then
+        mkdir -p "$root${2%/*}"
+        ln -s "$(readlink "$2")" "$root$2"
+    elif [ -d "$2" ]; then
+        mkdir -p "$root$2"
+    else
+        mkdir -p "$root${2%/*}"
+        touch "$root$2"
+    fi
+    if [ ! -L "$2" ]; then
+        mount --rbind "$2" "$root$2"
+        if [ "$1" = ro ]; then mount -o remount,bind,ro "$root$2"; fi
+    fi
+    shift 2
+done
+shift
+exec chroot "$root" setpriv --reuid="$uid" --regid="$uid" --clear-groups --no-new-privs --inh-caps=-all \\
+    --bounding-set=-all sh -c 'cd "$0" && exec "$@"' "$cwd" "$@"
+"""
+
+def judge_sandbox_kind():
+    """The sandbox judged code runs in: JUDGE_SANDBOX, or for "auto" the first one installed. None if there is none."""
+    if JUDGE_SANDBOX != "auto":
+        return JUDGE_SANDBOX if JUDGE_SANDBOX in ("bwrap", "nsjail", "unshare", "none") else None
+    if shutil.which("bwrap"):
+        return "bwrap"
+    if shutil.which("nsjail"):
+        return "nsjail"
+    if os.name == "posix" and os.geteuid() == 0 and shutil.which("unshare") and shutil.which("setpriv"):
+        return "unshare"
+    return None
+
+def sandbox_command(kind, command, workdir, readable=()):
+    """
+    `command` wrapped to run in `workdir` inside the `kind` sandbox: as JUDGE_SANDBOX_UID, without network,
+    seeing only the system paths and `readable` (read-only), `workdir` and a private /tmp.
+    """
+    if kind == "none":
+        return command
+    mounts = [("ro", path) for path in dict.fromkeys(JUDGE_SANDBOX_SYSTEM_PATHS) if path and os.path.lexists(path)]
+    mounts += [("ro", os.path.abspath(path)) for path in readable] + [("rw", os.path.abspath(workdir))]
+    uid = str(JUDGE_SANDBOX_UID)
+    if kind == "bwrap":
+        args = ["bwrap", "--unshare-all", "--die-with-parent", "--new-session", "--cap-drop", "ALL", "--uid", uid, "--gid", uid,
+                "--dev", "/dev", "--proc", "/proc", "--tmpfs", "/tmp"]
+        for mode, path in mounts:
+            if os.path.islink(path):
+                args += ["--symlink", os.readlink(path), path]
+            else:
+                args += ["--ro-bind" if mode == "ro" else "--bind", path, path]
+        return args + ["--chdir", os.path.abspath(workdir), "--"] + command
+    if kind == "nsjail":
+        args = ["nsjail", "--mode", "o", "--quiet", "--user", uid, "--group", uid, "--time_limit", "0", "--disable_rlimits",
+                "--keep_env", "--tmpfsmount", "/tmp", "-R", "/dev/null", "-R", "/dev/urandom", "-R", "/dev/zero"]
+        for mode, path in mounts:
+            args += ["-R" if mode == "ro" else "-B", path]
+        return args + ["--cwd", os.path.abspath(workdir), "--"] + command
+    args = ["unshare", "--mount", "--net", "--ipc", "--uts", "--pid", "--fork", "--kill-child", "--",
+            "sh", "-euc", JUDGE_UNSHARE_SCRIPT, "sh", JUDGE_SANDBOX_ROOT, uid, os.path.abspath(workdir)]
+    for mode, path in mounts:
+        args += [mode, path]
+    return args + ["--"] + command
+
+def judge_command(template, **values):
+    """Fills the "{name}" placeholders of a JUDGE_LANGUAGES command (bootstrap code is left untouched)."""
+    values = {"python": sys.executable, **values}
+    command = []
+    for part in template:
+        for name, value in values.items():
+            part = part.replace("{" + name + "}", str(value))
+        command.append(part)
+    return command
+
+def judge_workdir(prefix, sandbox):
+    """A fresh working directory for one judged process, writable by the sandbox uid."""
+    workdir = tempfile.mkdtemp(prefix=prefix)
+    if sandbox == "unshare": # Real uid switch; the user-namespace sandboxes map the sandbox uid to ours
+        os.chown(workdir, JUDGE_SANDBOX_UID, JUDGE_SANDBOX_UID)
+    return workdir
+
+def start_judged_process(sandbox, command, workdir, readable=(), limit_memory=True, cpu_seconds=JUDGE_MAX_CPU_SECONDS):
+    """Starts `command` in the sandbox with piped stdio, the judge's environment and its resource limits."""
+    return subprocess.Popen(sandbox_command(sandbox, command, workdir, readable), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, cwd=workdir, env=JUDGE_ENV, start_new_session=os.name == "posix",
+                            preexec_fn=limit_judged_process(cpu_seconds, limit_memory))
+
+def kill_judged_process(process):
+    """Kills a judged process with everything it started (the sandboxed program outlives its launcher otherwise)."""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (AttributeError, OSError):
+        process.kill()
+    process.communicate()
+
+class WarmProcessPool:
+    """Processes started ahead of time that each wait for one job line on stdin."""
+    def __init__(self, sandbox, command, readable, limit_memory, size):
+        self.sandbox = sandbox
+        self.command = command
+        self.readable = readable
+        self.limit_memory = limit_memory
+        self.idle = queue.Queue()
+        for _ in range(size):
+            self._spawn()
+
+    def _spawn(self):
+        workdir = judge_workdir("prep_ai_warm_", self.sandbox)
+        process = start_judged_process(self.sandbox, self.command, workdir, self.readable, self.limit_memory)
+        self.idle.put((process, workdir))
+
+    def take(self):
+        """An idle process (started cold if none is left), replaced in the background."""
+        try:
+            process, workdir = self.idle.get_nowait()
+            if process.poll() is not None: # Died while idle
+                shutil.rmtree(workdir, ignore_errors=True)
+                raise queue.Empty
+        except queue.Empty:
+            self._spawn()
+            process, workdir = self.idle.get()
+        threading.Thread(target=self._spawn, daemon=True).start()
+        return process, workdir
+
+class JudgeRunner:
+    """Builds judged programs (cached by source hash) and runs them, in warm processes where the language allows."""
+    def __init__(self, build_dir, warm_pool_size):
+        self.build_dir = os.path.abspath(build_dir) # Programs run in their own temporary directories
+        self.warm_pool_size = warm_pool_size
+        self.sandbox = judge_sandbox_kind()
+        if self.sandbox == "unshare":
+            os.makedirs(JUDGE_SANDBOX_ROOT, exist_ok=True)
+        self.lock = threading.Lock()
+        self.pools = {}
+        self.stats = {language: {"builds": 0, "build_cache_hits": 0, "build_seconds": 0.0, "runs": 0, "run_seconds": 0.0}
+                      for language in JUDGE_LANGUAGES}
+        self.overhead_report = None
+        os.makedirs(build_dir, exist_ok=True)
+
+    def available(self, language):
+        """True if the language's compiler and runtime are installed and judged code can be sandboxed."""
+        if self.sandbox is None:
+            return False
+        config = JUDGE_LANGUAGES[language]
+        programs = judge_command([config["compile"][0], config["run"][0]])
+        return all(shutil.which(program) for program in programs if not program.startswith("{dir}")) # Compiled binaries run directly
+
+    def build(self, language, source, source_name=None):
+        """
+        Compiles `source` once per distinct source; later calls (from any worker) reuse the artifact.
+        Returns (build directory, None) or (None, compiler message).
+        """
+        if self.sandbox is None:
+            return None, "No judge sandbox is installed on this server."
+        config = JUDGE_LANGUAGES[language]
+        source_name = source_name or config["source"]
+        digest = hashlib.sha256(f"{language}\n{source_name}\n{source}".encode("utf-8")).hexdigest()[:32]
+        path = os.path.join(self.build_dir, f"{language}-{digest}")
+
+        def compile_source():
+            if not os.path.exists(path):
+                tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+                os.makedirs(tmp_path)
+                if self.sandbox == "unshare":
+                    os.chown(tmp_path, JUDGE_SANDBOX_UID, JUDGE_SANDBOX_UID)
+                with open(os.path.join(tmp_path, source_name), "w", encoding="utf-8") as f:
+                    f.write(source)
+                started = time.perf_counter()
+                process = start_judged_process(self.sandbox, judge_command(config["compile"], source=source_name), tmp_path,
+                                               limit_memory=False, cpu_seconds=JUDGE_COMPILE_TIMEOUT)
+                try:
+                    stdout, stderr = process.communicate(timeout=JUDGE_COMPILE_TIMEOUT)
+                    output = (stderr or stdout).decode("utf-8", errors="replace")
+                    error = output.strip()[-2000:] if process.returncode != 0 else None
+                except subprocess.TimeoutExpired:
+                    kill_judged_process(process)
+                    error = f"Compilation took longer than {JUDGE_COMPILE_TIMEOUT:.0f} seconds."
+                seconds = time.perf_counter() - started
+                with open(os.path.join(tmp_path, "BUILD_ERROR" if error else "BUILD_OK"), "w", encoding="utf-8") as f:
+                    f.write(error or f"{seconds:.6f}")
+                with self.lock:
+                    self.stats[language]["builds"] += 1
+                    self.stats[language]["build_seconds"] += seconds
+                try:
+                    os.rename(tmp_path, path)
+                except OSError: # Another worker finished the same build first
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+            else:
+                with self.lock:
+                    self.stats[language]["build_cache_hits"] += 1
+            if os.path.exists(os.path.join(path, "BUILD_ERROR")):
+                with open(os.path.join(path, "BUILD_ERROR"), encoding="utf-8") as f:
+                    return None, f.read()
+            return path, None
+
+        return get_request_coalescer().run(("judge_build", path), compile_source)
+
+    def pool(self, language):
+        """The language's warm pool, started on first use; None for languages that run without one."""
+        config = JUDGE_LANGUAGES[language]
+        if "warm" not in config:
+            return None
+        with self.lock:
+            if language in self.pools:
+                return self.pools[language]
+        warm = ""
+        if "warm_bootstrap" in config:
+            bootstrap_name, bootstrap_source = config["warm_bootstrap"]
+            warm, error = self.build(language, bootstrap_source, bootstrap_name)
+            if error:
+                raise RuntimeError(f"Could not build the {config['label']} warm runner: {error}")
+        pool = WarmProcessPool(self.sandbox, judge_command(config["warm"], warm=warm), [warm] if warm else [],
+                               config["limit_memory"], self.warm_pool_size)
+        with self.lock:
+            return self.pools.setdefault(language, pool)
+
+    def run(self, language, source, stdin_text, time_limit, args=(), warm=True):
+        """
+        Builds and runs a program on `stdin_text`. Returns (status, stdout, seconds), with status "ok",
+        "timeout", "compile error: <message>" or "error: <last stderr line>". Seconds exclude compiling
+        and, for warm runs, the runtime's startup.
+        """
+        build_path, error = self.build(language, source)
+        if error:
+            return "compile error: " + error, "", 0.0
+        config = JUDGE_LANGUAGES[language]
+        pool = self.pool(language) if warm else None
+        if pool is not None:
+            process, workdir = pool.take()
+            program_path = shutil.copytree(build_path, os.path.join(workdir, "program")) # Not the shared build directory
+            job = "\t".join(judge_command([config["warm_program"], *map(str, args)], dir=program_path)) + "\n"
+            stdin_text = job + stdin_text
+        else:
+            workdir = judge_workdir("prep_ai_judge_", self.sandbox)
+            process = start_judged_process(self.sandbox, judge_command(config["run"], dir=build_path) + [str(arg) for arg in args],
+                                           workdir, [build_path], config["limit_memory"])
+        started = time.perf_counter()
+        try:
+            stdout, stderr = process.communicate(stdin_text.encode("utf-8"), timeout=time_limit)
+        except subprocess.TimeoutExpired:
+            kill_judged_process(process)
+            return "timeout", "", time.perf_counter() - started
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        seconds = time.perf_counter() - started
+        with self.lock:
+            self.stats[language]["runs"] += 1
+            self.stats[language]["run_seconds"] += seconds
+        stdout = stdout.decode("utf-8", errors="replace")
+        if process.returncode != 0:
+            stderr_lines = stderr.decode("utf-8", errors="replace").strip().splitlines()
+            return "error: " + (stderr_lines[-1] if stderr_lines else f"exit code {process.returncode}"), stdout, seconds
+        return "ok", stdout, seconds
+
+    def measure_overhead(self, samples=5):
+        """
+        Per-language startup overhead: compile time of an empty program and median seconds to run it
+        in a fresh process and in a warm one. Measured once per process; slow (it starts every runtime
+        many times), so it is run by `python bench.py --judge-overhead`, never while rendering a page.
+        """
+        with self.lock:
+            if self.overhead_report is not None:
+                return self.overhead_report
+        rows = []
+        for language, config in JUDGE_LANGUAGES.items():
+            row = {"language": config["label"], "available": self.available(language)}
+            if row["available"]:
+                build_path, _ = self.build(language, config["empty_program"])
+                with open(os.path.join(build_path, "BUILD_OK"), encoding="utf-8") as f:
+                    row["compile_ms"] = round(float(f.read()) * 1000, 1)
+                for mode, warm in (("cold_start_ms", False), ("warm_start_ms", True)):
+                    if warm and "warm" not in config:
+                        continue
+                    timings = []
+                    for _ in range(samples):
+                        started = time.perf_counter()
+                        self.run(language, config["empty_program"], "", JUDGE_MAX_CPU_SECONDS, warm=warm)
+                        timings.append(time.perf_counter() - started)
+                    row[mode] = round(float(np.median(timings)) * 1000, 1)
+            rows.append(row)
+        report = pd.DataFrame(rows, columns=["language", "available", "compile_ms", "cold_start_ms", "warm_start_ms"])
+        with self.lock:
+            self.overhead_report = report
+        return report
+
+    def report(self):
+        """Builds, cache hits and runs per language since the process started."""
+        with self.lock:
+            rows = [{"language": JUDGE_LANGUAGES[language]["label"], **stats} for language, stats in self.stats.items()]
+        df = pd.DataFrame(rows)
+        df["mean_build_ms"] = (1000 * df["build_seconds"] / df["builds"].where(df["builds"] > 0)).round(1)
+        df["mean_run_ms"] = (1000 * df["run_seconds"] / df["runs"].where(df["runs"] > 0)).round(1)
+        return df[["language", "builds", "build_cache_hits", "mean_build_ms", "runs", "mean_run_ms"]]
+
+@st.cache_resource(show_spinner=False)
+def get_judge_runner():
+    """Process-wide judge runner, so build stats and warm pools are shared by all sessions."""
+    return JudgeRunner(JUDGE_BUILD_DIR, JUDGE_WARM_POOL_SIZE)
+
+def available_judge_languages():
+    runner = get_judge_runner()
+    return [language for language in JUDGE_LANGUAGES if runner.available(language)]
+
+# --- Coding Judge ---
+# Every coding problem gets a judge once: a reference solution and an input generator (hand-written
+# for the sample problems, requested from the LLM for generated ones). The reference must reproduce
+# the sample output; it is then run locally on random and stress inputs, and the expected outputs are
+# stored with the inputs as the problem's fixtures, keyed by a hash of the problem. Every candidate
+# who gets the problem is graded by running their program on those inputs and diffing its output.
+
+JUDGE_FIXTURES_DIR = os.path.join(PREP_AI_DATA_DIR, "judge_fixtures")
+JUDGE_RANDOM_SIZES = [1, 2, 5, 10, 20, 50, 100, 1000] # Generator sizes for the random tests
+JUDGE_STRESS_SIZES = [100000, 10000] # Largest size the reference finishes in time is kept as the stress test
+JUDGE_REFERENCE_TIME_LIMIT = 10.0 # Seconds the reference solution (or generator) may take per input
+JUDGE_TIME_FACTOR = 3.0 # A submission may take this many times the reference's slowest run...
+JUDGE_MIN_TIME_LIMIT = 1.0 # ...but never less than this many seconds per test
+JUDGE_MAX_TIMEOUTS = 2 # After this many time-outs on one problem, its remaining tests are skipped
+
+SAMPLE_CODING_JUDGES = {
+    "Two Sum": {
+        "io_format": "Input: the integers of `nums` on one line, separated by spaces, then `target` on the next line. "
+                     "Exactly one pair adds up to `target`. Output: the two indices in increasing order, separated by a space.",
+        "sample_input": "2 7 11 15\n9\n",
+        "sample_output": "0 1\n",
+        "reference": "import sys\ndata = sys.stdin.read().split()\nnums, target = list(map(int, data[:-1])), int(data[-1])\n"
+                     "seen = {}\nfor i, x in enumerate(nums):\n    if target - x in seen:\n        print(seen[target - x], i)\n"
+                     "        break\n    seen[x] = i\n",
+        # Other numbers are multiples of 4 and the pair is 1 mod 4, so only the pair sums to target (2 mod 4)
+        "generator": "def generate(rng, n):\n    others = [4 * x for x in rng.sample(range(-10 ** 6, 10 ** 6), max(0, n - 2))]\n"
+                     "    a, b = (4 * rng.randrange(-10 ** 6, 10 ** 6) + 1 for _ in range(2))\n    nums = others + [a, b]\n"
+                     "    rng.shuffle(nums)\n    return ' '.join(map(str, nums)) + f'\\n{a + b}\\n'\n",
+    },
+    "Palindrome Check": {
+        "io_format": "Input: one line of text. Output: `True` if it reads the same forwards and backwards when only "
+                     "letters and digits are compared, ignoring case; otherwise `False`.",
+        "sample_input": "Racecar\n",
+        "sample_output": "True\n",
+        "reference": "import sys\nline = sys.stdin.readline().rstrip('\\n')\n"
+                     "chars = [c.lower() for c in line if c.isascii() and c.isalnum()]\nprint(chars == chars[::-1])\n",
+        "generator": "def generate(rng, n):\n    alphabet = 'abcAB c,1!'\n"
+                     "    half = ''.join(rng.choice(alphabet) for _ in range(max(1, n // 2)))\n"
+                     "    tail = half[::-1] if rng.random() < 0.5 else ''.join(rng.choice(alphabet) for _ in half)\n"
+                     "    return ''.join(c.swapcase() if rng.random() < 0.3 else c for c in half + tail) + '\\n'\n",
+    },
+    "Fibonacci Sequence": {
+        "io_format": "Input: `n` (0 <= n <= 90). Output: the first `n` Fibonacci numbers on one line, separated by spaces.",
+        "sample_input": "5\n",
+        "sample_output": "0 1 1 2 3\n",
+        "reference": "n = int(input())\nseq, a, b = [], 0, 1\nfor _ in range(n):\n    seq.append(a)\n    a, b = b, a + b\n"
+                     "print(' '.join(map(str, seq)))\n",
+        "generator": "def generate(rng, n):\n    return f'{rng.randint(0, min(n, 90))}\\n'\n",
+    },
+    "Factorial Calculation": {
+        "io_format": "Input: `n` (0 <= n <= 20). Output: `n!`.",
+        "sample_input": "4\n",
+        "sample_output": "24\n",
+        "reference": "import math\nprint(math.factorial(int(input())))\n",
+        "generator": "def generate(rng, n):\n    return f'{rng.randint(0, min(n, 20))}\\n'\n",
+    },
+}
+
+def coding_problem_id(problem):
+    """Stable ID of a coding problem: a short hash of its title and description."""
+    return hashlib.blake2b(f"{problem['title']}\n{problem['description']}".encode("utf-8"), digest_size=8).hexdigest()
+
+def normalize_output(text):
+    """Output as compared by the judge: trailing spaces on each line and trailing blank lines are ignored."""
+    return "\n".join(line.rstrip() for line in text.rstrip().splitlines())
+
+def generate_coding_judge(problem):
+    """Asks the LLM for a judge (I/O format, sample, reference solution and input generator) for a generated problem."""
+    prompt = PromptTemplate(
+        input_variables=["title", "description", "example"],
+        template="""Write a judge for a stdin/stdout grader for the coding problem below.
+    Title: {title}
+    Description: {description}
+    Example: {example}
+    **Format your entire response as a JSON array holding exactly one object. Do not include any text before or after the JSON.**
+    The object must have these keys:
+    'io_format': how the input is laid out on stdin and exactly what the program must print,
+    'sample_input': the example above as stdin text, 'sample_output': the exact stdout expected for it,
+    'reference': a correct, efficient Python 3 program that reads stdin and prints the answer,
+    'generator': Python 3 source defining generate(rng, n), which returns the stdin text of a valid random test of size about n (rng is a random.Random). The expected output must be unique for every generated input.
+    """
+    )
+    try:
+        response = run_llm_chain("coding_judge", prompt, {key: problem[key] for key in ("title", "description", "example")},
+                                 coalesce_key=("coding_judge", coding_problem_id(problem)))
+        match = re.search(r'\[\s*\{.*\}\s*\]', response, re.DOTALL)
+        judge = json.loads(match.group(0))[0] if match else None
+    except Exception as e:
+        st.warning(f"Could not generate a judge for '{problem['title']}': {e}")
+        return None
+    keys = ("io_format", "sample_input", "sample_output", "reference", "generator")
+    if not isinstance(judge, dict) or not all(isinstance(judge.get(key), str) for key in keys):
+        return None
+    return {key: judge[key] for key in keys}
+
+def build_judge_fixtures(problem, judge):
+    """
+    Verifies the judge's reference solution on the sample and computes expected outputs for random
+    and stress inputs. Returns the fixtures, with an "error" and no tests if the judge is unusable.
+    """
+    fixtures = {"problem_id": coding_problem_id(problem), "title": problem["title"], "io_format": judge["io_format"],
+                "sample_input": judge["sample_input"], "sample_output": judge["sample_output"],
+                "reference": judge["reference"], "tests": [], "time_limit": None, "error": None}
+    runner = get_judge_runner()
+    status, output, seconds = runner.run("python", judge["reference"], judge["sample_input"], JUDGE_REFERENCE_TIME_LIMIT)
+    if status != "ok" or normalize_output(output) != normalize_output(judge["sample_output"]):
+        fixtures["error"] = f"reference solution fails the sample ({status})"
+        return fixtures
+    tests, slowest = [{"kind": "sample", "input": judge["sample_input"], "output": output}], seconds
+    generator = judge["generator"] + "\nimport random, sys\nsys.stdout.write(generate(random.Random(int(sys.argv[1])), int(sys.argv[2])))\n"
+
+    def add_test(kind, seed, size):
+        nonlocal slowest
+        status, test_input, _ = runner.run("python", generator, "", JUDGE_REFERENCE_TIME_LIMIT, (seed, size))
+        if status != "ok":
+            return f"input generator failed ({status})"
+        status, output, seconds = runner.run("python", judge["reference"], test_input, JUDGE_REFERENCE_TIME_LIMIT)
+        if status != "ok":
+            return f"reference solution failed on a size {size} input ({status})"
+        tests.append({"kind": kind, "input": test_input, "output": output})
+        slowest = max(slowest, seconds)
+        return None
+
+    for seed, size in enumerate(JUDGE_RANDOM_SIZES):
+        error = add_test("random", seed, size)
+        if error:
+            fixtures["error"] = error
+            return fixtures
+    for size in JUDGE_STRESS_SIZES:
+        if add_test("stress", len(tests), size) is None:
+            break
+    fixtures["tests"] = tests
+    fixtures["time_limit"] = round(max(JUDGE_MIN_TIME_LIMIT, JUDGE_TIME_FACTOR * slowest), 2)
+    return fixtures
+
+def judge_fixtures_path(problem_id):
+    return os.path.join(JUDGE_FIXTURES_DIR, f"{problem_id}.json.gz")
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def load_judge_fixtures(path, mtime):
+    """A problem's fixtures, cached per file version (the mtime is part of the cache key)."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+def coding_fixtures(problem):
+    """
+    The problem's judge fixtures, building and storing them on first use (concurrent first uses
+    share one build). Problems without a usable judge get fixtures with an "error" and no tests.
+    """
+    path = judge_fixtures_path(coding_problem_id(problem))
+    if get_judge_runner().sandbox is None and not os.path.exists(path): # Not stored, so a server with a sandbox builds them later
+        return {"problem_id": coding_problem_id(problem), "title": problem["title"], "tests": [],
+                "error": "no judge sandbox is installed"}
+
+    def build():
+        if os.path.exists(path):
+            return load_judge_fixtures(path, os.path.getmtime(path))
+        judge = SAMPLE_CODING_JUDGES.get(problem["title"]) or generate_coding_judge(problem)
+        if judge is None:
+            fixtures = {"problem_id": coding_problem_id(problem), "title": problem["title"], "tests": [],
+                        "error": "no judge could be generated"}
+        else:
+            fixtures = build_judge_fixtures(problem, judge)
+        os.makedirs(JUDGE_FIXTURES_DIR, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(fixtures, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return fixtures
+
+    if os.path.exists(path):
+        return load_judge_fixtures(path, os.path.getmtime(path))
+    return get_request_coalescer().run(("judge_fixtures", path), build)
+
+def prepare_coding_problem(problem):
+    """The problem with its judge's I/O format and sample added, or None if it cannot be graded."""
+    fixtures = coding_fixtures(problem)
+    if not fixtures["tests"]:
+        return None
+    return {**problem, "problem_id": fixtures["problem_id"], "io_format": fixtures["io_format"],
+            "sample_input": fixtures["sample_input"], "sample_output": fixtures["sample_output"]}
+
+def grade_coding_solution(problem, source, language="python"):
+    """
+    Runs a solution on the problem's fixtures. Returns one verdict per test ("Accepted", "Wrong Answer",
+    "Time Limit Exceeded", "Runtime Error", "Compilation Error" or "Skipped") with its kind and seconds.
+    """
+    fixtures = coding_fixtures(problem)
+    runner = get_judge_runner()
+    verdicts, timeouts = [], 0
+    for test in fixtures["tests"]:
+        if timeouts >= JUDGE_MAX_TIMEOUTS:
+            verdicts.append({"kind": test["kind"], "verdict": "Skipped", "seconds": None})
+            continue
+        status, output, seconds = runner.run(language, source, test["input"], fixtures["time_limit"])
+        if status.startswith("compile error"):
+            return [{"kind": t["kind"], "verdict": "Compilation Error", "seconds": None} for t in fixtures["tests"]]
+        if status == "timeout":
+            timeouts += 1
+            verdict = "Time Limit Exceeded"
+        elif status != "ok":
+            verdict = "Runtime Error"
+        else:
+            verdict = "Accepted" if normalize_output(output) == normalize_output(test["output"]) else "Wrong Answer"
+        verdicts.append({"kind": test["kind"], "verdict": verdict, "seconds": round(seconds, 3)})
+    return verdicts
+
+def with_topic(questions, topic, difficulty):
+    """Copies of `questions` tagged with the topic and difficulty they were generated for (used by analytics)."""
+    return [{**q, "topic": topic, "difficulty": q.get("difficulty", difficulty)} for q in questions]
+
+def generate_test_questions(test_name, difficulty, rng=None, coalesce=True, topic_stats=None, variant=None):
+    """
+    Assembles the MCQ paper for `test_name`, distributing its question count among topics: evenly, or
+    weighted toward the candidate's weaker topics when their `topic_stats` are given.
+    Worked examples are only sent in the first generated topic's prompt to save prompt tokens.
+    `variant` as in `generate_questions`.
+    """
+    rng = rng or random
+    config = TEST_CONFIGS[test_name]
+    all_questions = []
+    q_counts = allocate_questions(config['topics'], config['question_count'], topic_stats)
+    # Weighting can leave the first topic without questions, so the examples go with the first one that has some
+    examples_topic = next((topic for topic, q_count in zip(config['topics'], q_counts) if q_count), None)
+
+    # Send every topic's request up front: they are generated concurrently (and batched by the local model)
+    pending = {}
+    if llm_available():
+        for topic, q_count in zip(config['topics'], q_counts):
+            include_examples = topic == examples_topic
+            prompt = question_prompt(test_name, include_examples=include_examples, variant=variant)
+            if q_count and prompt is not None:
+                pending[topic] = submit_llm_chain(**question_llm_request(test_name, topic, q_count, difficulty, prompt, coalesce,
+                                                                         include_examples, variant))
+
+    for topic, q_count in zip(config['topics'], q_counts):
+        if q_count == 0:
+            continue
+        questions = generate_questions(test_name, topic, q_count, difficulty, include_examples=(topic == examples_topic), rng=rng,
+                                       coalesce=coalesce, pending_response=pending.get(topic), variant=variant)
+        all_questions.extend(with_topic(questions, topic, difficulty))
+
+    # Shuffle and select to ensure randomness and target count
+    rng.shuffle(all_questions)
+    return all_questions[:config['question_count']]
+
+# --- Topic Accuracy ---
+# Per-candidate answered/correct counts for every test topic, one record in the shared state backend
+# bumped once per finished attempt, so assembling a paper reads them in a single lookup instead of
+# replaying answer history. Live-generated papers give weaker topics more of the question budget.
+
+TOPIC_WEIGHTING = os.getenv("TOPIC_WEIGHTING", "weakness") # "weakness" or "even" split of a paper's questions
+TOPIC_PRIOR_ANSWERS = 4 # Pseudo-answers at 50% accuracy, so a topic's first few answers do not swing its weight
+
+def load_topic_stats(candidate_id, test_name):
+    """{topic: [answered, correct]} for the candidate's answers in `test_name`, including practice."""
+    return (get_state_backend().get("topic_stats", candidate_id) or {}).get(test_name, {})
+
+def update_topic_stats(questions, answers):
+    """Adds a finished attempt's MCQ answers to the candidate's per-topic counts."""
+    counts = {}
+    for record in answers:
+        if is_mcq_record(record):
+            question_data = questions[record[ANSWER_INDEX]]
+            test_name = question_data.get("test", st.session_state.current_test)
+            if question_data.get("topic") and test_name in TEST_CONFIGS:
+                topic_counts = counts.setdefault((test_name, question_data["topic"]), [0, 0])
+                topic_counts[0] += 1
+                topic_counts[1] += bool(record[ANSWER_CORRECT])
+    if not counts:
+        return
+
+    def apply(stats, now):
+        stats = stats or {}
+        for (test_name, topic), (answered, correct) in counts.items():
+            topic_stats = stats.setdefault(test_name, {}).setdefault(topic, [0, 0])
+            topic_stats[0] += answered
+            topic_stats[1] += correct
+        return stats, None
+
+    get_state_backend().update("topic_stats", st.session_state.candidate_id, apply)
+
+def topic_weakness(counts):
+    """Estimated chance of missing a question on the topic, from its [answered, correct] counts."""
+    answered, correct = counts or (0, 0)
+    return 1 - (correct + TOPIC_PRIOR_ANSWERS / 2) / (answered + TOPIC_PRIOR_ANSWERS)
+
+def allocate_questions(topics, total, topic_stats=None):
+    """
+    Splits `total` questions among `topics` in proportion to their weakness (evenly without stats).
+    When `total` >= len(topics), every topic first gets one question however strong the candidate is
+    on it, and only the rest is split by weight; a smaller `total` is split by weight alone, so some
+    topics get none. Leftover questions go by largest remainder, ties to earlier topics.
+    """
+    if topic_stats and TOPIC_WEIGHTING == "weakness":
+        weights = [topic_weakness(topic_stats.get(topic)) for topic in topics]
+    else:
+        weights = [1.0] * len(topics)
+    counts = [1 if total >= len(topics) else 0] * len(topics)
+    spare = total - sum(counts)
+    shares = [spare * w / sum(weights) for w in weights]
+    counts = [c + int(share) for c, share in zip(counts, shares)]
+    by_remainder = sorted(range(len(topics)), key=lambda i: (-(shares[i] - int(shares[i])), i))
+    for i in by_remainder[:total - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+# --- Provisioned Papers ---
+# Papers pre-generated in bulk by provision.py, one gzip-compressed JSON file per test and difficulty.
+# Items (questions, coding problems or the essay topic) shared by several papers are stored once and
+# papers refer to them by index. Each test start claims the next unused paper, atomically across
+# workers; once a set is used up, papers are generated live again.
+
+PAPERS_DIR = os.getenv("PAPERS_DIR", os.path.join(PREP_AI_DATA_DIR, "papers"))
+
+def paper_set_difficulty(test_name, difficulty):
+    """Difficulty a paper set is filed under; essay topics and coding problems are not generated per difficulty."""
+    return "any" if test_name in ("Written English Test", "Coding Test") else difficulty.lower()
+
+def paper_set_path(test_name, difficulty):
+    slug = re.sub(r"[^a-z0-9]+", "_", test_name.lower()).strip("_")
+    return os.path.join(PAPERS_DIR, f"{slug}__{paper_set_difficulty(test_name, difficulty)}.json.gz")
+
+def write_paper_set(test_name, difficulty, papers):
+    """
+    Writes provisioned papers, each a dict with the "seed" it was generated from and its "items",
+    replacing any previous set for the test and difficulty. Returns the file path.
+    """
+    items, item_index, records = [], {}, []
+    for paper in papers:
+        refs = []
+        for item in paper["items"]:
+            key = json.dumps(item, sort_keys=True, ensure_ascii=False)
+            if key not in item_index:
+                item_index[key] = len(items)
+                items.append(item)
+            refs.append(item_index[key])
+        records.append({"seed": paper["seed"], "items": refs})
+    paper_set = {"set_id": uuid.uuid4().hex, "test": test_name, "difficulty": difficulty,
+                 "created": time.time(), "items": items, "papers": records}
+    path = paper_set_path(test_name, difficulty)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(f"{path}.tmp", "wt", encoding="utf-8") as f:
+        json.dump(paper_set, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(f"{path}.tmp", path) # Workers never see a half-written set
+    return path
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def load_paper_set(path, mtime):
+    """Decompressed paper set, cached per process; `mtime` is in the key so a re-provisioned file is reloaded."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+def claim_provisioned_paper(test_name, difficulty):
+    """Takes the next unused provisioned paper as (seed, items), or None if there is none left."""
+    path = paper_set_path(test_name, difficulty)
+    try:
+        paper_set = load_paper_set(path, os.path.getmtime(path))
+    except OSError:
+        return None
+    papers = paper_set["papers"]
+
+    def claim(cursor, now):
+        cursor = cursor or 0
+        if cursor >= len(papers):
+            return None, None
+        return cursor + 1, cursor
+
+    claimed = get_state_backend().update("paper_claims", paper_set["set_id"], claim)
+    if claimed is None:
+        return None
+    paper = papers[claimed]
+    return paper["seed"], copy.deepcopy([paper_set["items"][i] for i in paper["items"]]) # The cached set stays pristine
+
+def use_provisioned_paper(test_name, difficulty):
+    """Loads the next provisioned paper into session state. Returns False if none is available."""
+    claimed = claim_provisioned_paper(test_name, difficulty)
+    if claimed is None:
+        return False
+    seed, items = claimed
+    st.session_state.attempt_seed = seed
+    if test_name == "Written English Test":
+        st.session_state.essay_topic = items[0]
+    elif test_name == "Coding Test":
+        st.session_state.coding_problems = items
+    else:
+        st.session_state.questions = items
+    return True
+
+# --- Answer Records ---
+# MCQ answers are stored as compact tuples that reference their question by index instead of
+# copying the question, options and explanation into every entry. Plain tuples (rather than a
+# class defined in this script) survive Streamlit reruns and pickle cleanly.
+
+ANSWER_INDEX, ANSWER_LETTER, ANSWER_CORRECT, ANSWER_TIME, ANSWER_SECONDS = range(5)
+
+def make_answer_record(question_index, letter, is_correct, seconds=None):
+    """
+    (question index, chosen letter or None when skipped, correctness, answered-at timestamp,
+    seconds spent on the question rounded to 0.1 s, or None if unknown)
+    """
+    return (question_index, letter, is_correct, time.time(), round(seconds, 1) if seconds is not None else None)
+
+def answer_seconds(record):
+    """Seconds spent on an answered question; None for records without timing (e.g. older journals)."""
+    return record[ANSWER_SECONDS] if len(record) > ANSWER_SECONDS else None
+
+def is_mcq_record(answer):
+    return isinstance(answer, tuple)
+
+def option_for_letter(options, letter):
+    """Option text for an answer letter; options are normally listed in A-D order."""
+    index = ord(letter) - ord("A")
+    if 0 <= index < len(options) and options[index].startswith(letter + ")"):
+        return options[index]
+    return next((opt for opt in options if opt.startswith(letter + ")")), letter)
+
+def answer_view(record, questions):
+    """Rebuilds the full review entry for a compact answer by joining it with its question."""
+    question_data = questions[record[ANSWER_INDEX]]
+    letter = record[ANSWER_LETTER]
+    return {
+        "question": question_data["question"],
+        "options": question_data["options"],
+        "user_answer_letter": letter if letter else "Skipped",
+        "user_answer_text": option_for_letter(question_data["options"], letter) if letter else "Skipped",
+        "correct_answer_letter": question_data["correct_answer"],
+        "correct_answer_text": option_for_letter(question_data["options"], question_data["correct_answer"]),
+        "is_correct": record[ANSWER_CORRECT],
+        "explanation": question_data["explanation"]
+    }
+
+def count_correct_answers(answers):
+    return sum(1 for ans in answers if is_mcq_record(ans) and ans[ANSWER_CORRECT])
+
+# --- Review Pagination ---
+# The detailed review renders one page of answers at a time, so its cost is bounded by the page
+# size rather than the attempt length. A finished attempt's counts, filter positions and time
+# report are computed once and memoized in session state; reruns (page flips, filter changes,
+# any other click) reuse them until the session moves on to another attempt.
+
+REVIEW_PAGE_SIZE = int(os.getenv("REVIEW_PAGE_SIZE", "10")) # Answers per page of the detailed review
+REVIEW_FILTERS = ["All", "Incorrect only", "Skipped only"]
+
+def attempt_summary(questions, answers):
+    """Counts of a finished attempt and the answer positions each review filter shows."""
+    positions = {name: [] for name in REVIEW_FILTERS}
+    for i, record in enumerate(answers):
+        if not is_mcq_record(record):
+            continue
+        positions["All"].append(i)
+        if record[ANSWER_LETTER] is None:
+            positions["Skipped only"].append(i)
+        elif not record[ANSWER_CORRECT]:
+            positions["Incorrect only"].append(i)
+    correct = len(positions["All"]) - len(positions["Incorrect only"]) - len(positions["Skipped only"])
+    return {
+        "total": len(questions),
+        "correct": correct,
+        "incorrect": len(positions["Incorrect only"]),
+        "skipped": len(positions["Skipped only"]),
+        "percentage": correct / len(questions) * 100 if questions else 0,
+        "positions": positions,
+        "time_reports": {}, # Time limit -> attempt_time_report, filled on first use
+    }
+
+def review_page(positions, page):
+    """The answer positions shown on 1-based `page` of a filtered review."""
+    start = (page - 1) * REVIEW_PAGE_SIZE
+    return positions[start:start + REVIEW_PAGE_SIZE]
+
+def current_attempt_summary(time_limit_minutes=None):
+    """
+    `attempt_summary` of the session's attempt, computed on the first call and memoized for later reruns.
+    With `time_limit_minutes`, its "time_report" is the attempt's time report against that limit.
+    """
+    answers = st.session_state.answers
+    key = (st.session_state.attempt_seed, st.session_state.current_test, id(answers), len(answers))
+    memo = st.session_state.review_summary
+    if memo is None or memo[0] != key:
+        memo = st.session_state.review_summary = (key, attempt_summary(st.session_state.questions, answers))
+    summary = memo[1]
+    if time_limit_minutes and time_limit_minutes not in summary["time_reports"]:
+        summary["time_reports"][time_limit_minutes] = attempt_time_report(st.session_state.questions, answers, time_limit_minutes)
+    return {**summary, "time_report": summary["time_reports"].get(time_limit_minutes)}
+
+# --- Session Memory Governor ---
+# Bulky per-session fields of idle sessions are pickled to disk and replaced by empty values,
+# then restored transparently when the session next runs any code: a full rerun, a widget
+# callback (which Streamlit runs before the script body) or a fragment rerun (which never reaches
+# main). A global ceiling on the resident size of those fields evicts least-recently-used sessions
+# first. A session's size is re-measured only when one of its fields was replaced or resized.
+
+SESSION_IDLE_SPILL_SECONDS = float(os.getenv("SESSION_IDLE_SPILL_SECONDS", "600"))
+SESSION_MEMORY_CEILING_MB = float(os.getenv("SESSION_MEMORY_CEILING_MB", "256"))
+SESSION_SPILL_DIR = os.path.join(PREP_AI_DATA_DIR, "spilled_sessions")
+# Field -> empty value left in session state while the field is spilled
+SPILLABLE_SESSION_FIELDS = {"questions": list, "answers": list, "coding_problems": list, "essay_topic": str, "progress_data": list}
+SESSION_SIZE_REFRESH_SECONDS = 60 # Re-measure an unchanged session at most this often (catches in-place edits)
+
+def session_fields_fingerprint(state):
+    """Cheap change marker of the spillable fields: which objects they are and how long."""
+    return tuple((id(state[field]), len(state[field])) if field in state else None for field in SPILLABLE_SESSION_FIELDS)
+
+class SessionGovernor:
+    """Tracks every session's bulky state, spilling idle or least-recently-used sessions to disk."""
+    def __init__(self, spill_dir, idle_seconds, ceiling_bytes):
+        self.spill_dir = spill_dir
+        self.idle_seconds = idle_seconds
+        self.ceiling_bytes = ceiling_bytes
+        self.lock = threading.RLock()
+        self.sessions = OrderedDict() # session_id -> entry, least recently used first
+        os.makedirs(spill_dir, exist_ok=True)
+
+    def _spill_path(self, session_id):
+        return os.path.join(self.spill_dir, f"{session_id}.pkl")
+
+    def touch(self, session_id, state):
+        """Marks the session as running and restores its fields if they were spilled. Calls may nest."""
+        with self.lock:
+            entry = self.sessions.pop(session_id, None) or {"bytes": 0, "spilled": False, "running": 0,
+                                                            "fingerprint": None, "measured_at": 0.0}
+            entry.update(state=weakref.ref(state), last_seen=time.time(), running=entry["running"] + 1)
+            self.sessions[session_id] = entry # Most recently used goes last
+            if entry["spilled"]:
+                self._restore(session_id, entry, state)
+
+    def release(self, session_id, state):
+        """
+        Ends one `touch`. When the outermost one ends, re-measures the session if its fields changed and
+        enforces the idle and memory limits.
+        """
+        with self.lock:
+            entry = self.sessions.get(session_id)
+            if entry is None:
+                return
+            entry["running"] = max(0, entry["running"] - 1)
+            entry["last_seen"] = time.time()
+            if entry["running"]:
+                return
+            fingerprint = session_fields_fingerprint(state)
+            remeasure = fingerprint != entry["fingerprint"] or time.time() - entry["measured_at"] > SESSION_SIZE_REFRESH_SECONDS
+        if remeasure:
+            size = len(pickle.dumps({field: state[field] for field in SPILLABLE_SESSION_FIELDS if field in state}))
+            with self.lock:
+                entry.update(bytes=size, fingerprint=fingerprint, measured_at=time.time())
+        self.enforce()
+
+    def enforce(self):
+        with self.lock:
+            now = time.time()
+            for session_id, entry in list(self.sessions.items()):
+                state = entry["state"]()
+                if state is None: # Session has ended; drop its entry and any spill file
+                    self.sessions.pop(session_id)
+                    if entry["spilled"] and os.path.exists(self._spill_path(session_id)):
+                        os.remove(self._spill_path(session_id))
+                elif not entry["spilled"] and not entry["running"] and now - entry["last_seen"] > self.idle_seconds:
+                    self._spill(session_id, entry, state)
+
+            resident = sum(e["bytes"] for e in self.sessions.values() if not e["spilled"])
+            for session_id, entry in list(self.sessions.items()):
+                if resident <= self.ceiling_bytes:
+                    break
+                state = entry["state"]()
+                if state is not None and not entry["spilled"] and not entry["running"]:
+                    self._spill(session_id, entry, state)
+                    resident -= entry["bytes"]
+
+    def _spill(self, session_id, entry, state):
+        fields = {field: state[field] for field in SPILLABLE_SESSION_FIELDS if field in state}
+        tmp_path = f"{self._spill_path(session_id)}.tmp" # Only idle or over-ceiling sessions are ever written
+        with open(tmp_path, "wb") as f:
+            pickle.dump(fields, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._spill_path(session_id))
+        for field in fields:
+            state[field] = SPILLABLE_SESSION_FIELDS[field]()
+        entry["spilled"] = True
+
+    def _restore(self, session_id, entry, state):
+        with open(self._spill_path(session_id), "rb") as f:
+            fields = pickle.load(f)
+        for field, value in fields.items():
+            state[field] = value
+        os.remove(self._spill_path(session_id))
+        entry.update(spilled=False, fingerprint=session_fields_fingerprint(state))
+
+    def metrics(self):
+        """Per-session size, idle time and spill status, most recently used first."""
+        with self.lock:
+            now = time.time()
+            return [{"session_id": session_id[:8], "kb": round(entry["bytes"] / 1024, 1),
+                     "idle_seconds": round(now - entry["last_seen"]), "spilled": entry["spilled"]}
+                    for session_id, entry in reversed(self.sessions.items())]
+
+@st.cache_resource(show_spinner=False)
+def get_session_governor():
+    """Process-wide governor shared by all sessions."""
+    return SessionGovernor(SESSION_SPILL_DIR, SESSION_IDLE_SPILL_SECONDS, SESSION_MEMORY_CEILING_MB * 2 ** 20)
+
+@contextmanager
+def governed_session():
+    """
+    Wraps code that runs for a session (a script run, callback or fragment): restores spilled state
+    before it and measures the session after it.
+    """
+    ctx = get_script_run_ctx()
+    if ctx is None: # Imported outside `streamlit run` (e.g. by the CLI); nothing to govern
+        yield
+        return
+    governor = get_session_governor()
+    session_id = st.session_state.session_id
+    governor.touch(session_id, ctx.session_state)
+    try:
+        yield
+    finally:
+        governor.release(session_id, ctx.session_state)
+
+def governed(fn):
+    """Runs a widget callback or fragment body inside `governed_session`, so it never sees spilled fields."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with governed_session():
+            return fn(*args, **kwargs)
+    return wrapper
+
+# --- Content-Addressed Blobs ---
+# Question, coding-problem, essay and code payloads are stored once in the shared state backend,
+# keyed by the SHA-256 of their canonical JSON, and attempt journals hold {"blob": key} references
+# instead of copies. Payloads are compressed with zstd and a dictionary trained on the app's own
+# content: they are too small for a plain compressor, but share most of their structure and wording.
+# Dictionaries are immutable and stored under their own hash, so retraining never invalidates older
+# blobs. Without the optional `zstandard` package, zlib with a preset dictionary is used instead.
+
+BLOB_CODEC = os.getenv("BLOB_CODEC", "zstd") # "zstd" (needs zstandard) or "zlib"
+BLOB_COMPRESSION_LEVEL = 9
+BLOB_DICT_SIZE = 16 * 1024 # Bytes of trained dictionary (zlib uses at most 32 KB of it)
+BLOB_DICT_SAMPLES = 2000 # Recently written payloads kept to retrain the dictionary on
+BLOB_DICT_RETRAIN_AFTER = int(os.getenv("BLOB_DICT_RETRAIN_AFTER", "2000")) # New blobs a worker writes before retraining
+BLOB_KNOWN_KEYS = 100000 # Keys remembered as already stored, to skip the backend lookup on repeats
+
+def canonical_json(payload):
+    """The bytes a payload is hashed and stored as: key order and whitespace never change its key."""
+    return json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+def is_blob_ref(value):
+    return isinstance(value, dict) and set(value) == {"blob"}
+
+def seed_blob_corpus():
+    """Payloads the first dictionary is trained on: the built-in sample content and the question bank."""
+    payloads = [q for test_name in TEST_CONFIGS for q in create_sample_questions(test_name, "", 100, "Any")]
+    payloads += SAMPLE_CODING_PROBLEMS + SAMPLE_ESSAY_TOPICS
+    backend = get_state_backend()
+    for key in backend.keys("question_bank"):
+        payloads += backend.get("question_bank", key, [])
+    return list(dict.fromkeys(canonical_json(payload) for payload in payloads)) # Samples repeat to fill a count
+
+class BlobStore:
+    """Content-addressed, dictionary-compressed payloads in the shared state backend."""
+    def __init__(self, backend, codec=BLOB_CODEC):
+        if codec == "zstd":
+            try:
+                import zstandard # Optional dependency; zlib is the fallback
+                self.zstd = zstandard
+            except ImportError:
+                codec = "zlib"
+        self.backend = backend
+        self.codec = codec
+        self.lock = threading.Lock()
+        self.local = threading.local() # zstandard (de)compressors must not be shared between threads
+        self.dictionaries = {} # dictionary ID -> bytes
+        self.active = None # ID of the dictionary new blobs are compressed with ("" for none), loaded lazily
+        self.known = OrderedDict() # Recently stored or seen keys, LRU
+        self.samples = deque(maxlen=BLOB_DICT_SAMPLES)
+        self.written_since_training = 0
+        self.stats = {"puts": 0, "written": 0, "raw_bytes": 0, "written_raw_bytes": 0, "stored_bytes": 0,
+                      "reads": 0, "read_seconds": 0.0, "decompress_seconds": 0.0}
+
+    def train(self, samples):
+        """Trains a dictionary on `samples` (bytes), stores it and makes it the active one. Returns its ID."""
+        if self.codec == "zstd":
+            try:
+                data = self.zstd.train_dictionary(BLOB_DICT_SIZE, samples, level=BLOB_COMPRESSION_LEVEL).as_bytes()
+            except self.zstd.ZstdError: # Too few or too small samples; compress without a dictionary for now
+                data = b""
+        else:
+            data = b"".join(samples)[-BLOB_DICT_SIZE:] # zlib matches against the end of its preset dictionary first
+        dict_id = f"{self.codec}:{hashlib.sha256(data).hexdigest()[:16]}" if data else ""
+        if data:
+            self.backend.put("blob_dicts", dict_id, base64.b64encode(data).decode("ascii"))
+        self.backend.put("blob_dicts", f"active:{self.codec}", dict_id) # Workers training at once each store a valid dictionary
+        with self.lock:
+            self.dictionaries[dict_id] = data
+            self.active = dict_id
+        return dict_id
+
+    def _active_dictionary(self):
+        if self.active is None:
+            dict_id = self.backend.get("blob_dicts", f"active:{self.codec}")
+            if dict_id is None:
+                dict_id = self.train(seed_blob_corpus())
+            self.active = dict_id
+        return self.active
+
+    def _dictionary(self, dict_id):
+        if dict_id not in self.dictionaries:
+            data = self.backend.get("blob_dicts", dict_id) if dict_id else ""
+            if data is None:
+                raise KeyError(f"compression dictionary {dict_id} is missing")
+            self.dictionaries[dict_id] = base64.b64decode(data)
+        return self.dictionaries[dict_id]
+
+    def _zstd(self, kind, dict_id):
+        """This thread's zstd compressor or decompressor for a dictionary."""
+        cache = self.local.__dict__.setdefault("zstd", {})
+        if (kind, dict_id) not in cache:
+            data = self._dictionary(dict_id)
+            dictionary = self.zstd.ZstdCompressionDict(data) if data else None
+            cache[(kind, dict_id)] = (self.zstd.ZstdCompressor(level=BLOB_COMPRESSION_LEVEL, dict_data=dictionary)
+                                      if kind == "compress" else self.zstd.ZstdDecompressor(dict_data=dictionary))
+        return cache[(kind, dict_id)]
+
+    def _compress(self, data, dict_id):
+        if self.codec == "zstd":
+            return self._zstd("compress", dict_id).compress(data)
+        zdict = self._dictionary(dict_id)
+        compressor = zlib.compressobj(BLOB_COMPRESSION_LEVEL, zdict=zdict) if zdict else zlib.compressobj(BLOB_COMPRESSION_LEVEL)
+        return compressor.compress(data) + compressor.flush()
+
+    def _decompress(self, record):
+        if record["codec"] == "none":
+            return record["data"].encode("utf-8")
+        data = base64.b64decode(record["data"])
+        dict_id = record["dict"] or ""
+        if record["codec"] == "zstd":
+            return self._zstd("decompress", dict_id).decompress(data)
+        zdict = self._dictionary(dict_id)
+        decompressor = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+        return decompressor.decompress(data) + decompressor.flush()
+
+    def _remember(self, key):
+        with self.lock:
+            self.known[key] = True
+            self.known.move_to_end(key)
+            if len(self.known) > BLOB_KNOWN_KEYS:
+                self.known.popitem(last=False)
+
+    def put(self, payload):
+        """Stores a payload unless an identical one is stored already. Returns its {"blob": key} reference."""
+        data = canonical_json(payload)
+        key = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            self.stats["puts"] += 1
+            self.stats["raw_bytes"] += len(data) # What a verbatim JSON copy would have cost
+            known = key in self.known
+        if not known and self.backend.get("blobs", key) is None:
+            dict_id = self._active_dictionary()
+            record = {"codec": self.codec, "dict": dict_id or None,
+                      "data": base64.b64encode(self._compress(data, dict_id)).decode("ascii")}
+            if len(record["data"]) >= len(data): # Compression (after base64) does not pay for this payload
+                record = {"codec": "none", "dict": None, "data": data.decode("utf-8")}
+            self.backend.put("blobs", key, record) # Racing writers store identical content, so no lock is needed
+            with self.lock:
+                self.stats["written"] += 1
+                self.stats["written_raw_bytes"] += len(data)
+                self.stats["stored_bytes"] += len(record["data"])
+                self.samples.append(data)
+                self.written_since_training += 1
+                retrain = self.written_since_training >= BLOB_DICT_RETRAIN_AFTER
+                if retrain:
+                    self.written_since_training = 0
+                    samples = list(self.samples)
+            if retrain:
+                self.train(samples)
+        self._remember(key)
+        return {"blob": key}
+
+    def get(self, ref):
+        """The payload a reference points to."""
+        started = time.perf_counter()
+        record = self.backend.get("blobs", ref["blob"])
+        if record is None:
+            raise KeyError(f"blob {ref['blob']} is missing")
+        decompress_started = time.perf_counter()
+        data = self._decompress(record)
+        decompress_seconds = time.perf_counter() - decompress_started
+        payload = json.loads(data)
+        with self.lock:
+            self.stats["reads"] += 1
+            self.stats["read_seconds"] += time.perf_counter() - started
+            self.stats["decompress_seconds"] += decompress_seconds
+        return payload
+
+    def report(self):
+        """Storage saved against verbatim JSON copies, and what reading a blob back costs."""
+        with self.lock:
+            stats = dict(self.stats)
+        reads = stats["reads"] or None
+        return {
+            "codec": self.codec,
+            "dictionary": self.active or "none",
+            "references": stats["puts"],
+            "blobs_written": stats["written"],
+            "raw_json_kb": round(stats["raw_bytes"] / 1024, 1),
+            "stored_kb": round(stats["stored_bytes"] / 1024, 1),
+            "compression_ratio": round(stats["stored_bytes"] / stats["written_raw_bytes"], 3) if stats["written"] else None,
+            "reduction": round(1 - stats["stored_bytes"] / stats["raw_bytes"], 3) if stats["raw_bytes"] else None,
+            "reads": stats["reads"],
+            "mean_read_ms": round(1000 * stats["read_seconds"] / reads, 3) if reads else None,
+            "mean_decompress_ms": round(1000 * stats["decompress_seconds"] / reads, 3) if reads else None,
+        }
+
+@st.cache_resource(show_spinner=False)
+def get_blob_store():
+    """Process-wide blob store, so dictionaries, known keys and stats are shared by all sessions."""
+    return BlobStore(get_state_backend())
+
+def resolve_blob(value):
+    """A referenced payload, or the value itself (journals written before blobs hold payloads inline)."""
+    return get_blob_store().get(value) if is_blob_ref(value) else value
+
+# --- Attempt Checkpoints ---
+# Each attempt is journaled to an append-only stream in the shared state backend: the generated
+# paper once at the start, then one small entry per answer, code edit or essay edit. A reconnecting
+# browser (on this or any other worker) replays the journal to resume without regenerating anything.
+
+def is_state_id(value):
+    """True for IDs in the format this app generates (uuid4 hex); IDs from the URL are untrusted."""
+    return bool(value) and re.fullmatch(r"[0-9a-f]{32}", value) is not None
+
+def attempt_stream(attempt_id):
+    """Journal stream name for an attempt ID, or None if the ID is malformed."""
+    return f"attempt:{attempt_id}" if is_state_id(attempt_id) else None
+
+def record_attempt_event(event, **fields):
+    """Appends one event to the current attempt's journal (a no-op outside an attempt)."""
+    stream = attempt_stream(st.session_state.get("attempt_id"))
+    if stream is None:
+        return
+    get_state_backend().append(stream, {"event": event, "at": time.time(), **fields})
+
+def start_attempt():
+    """Opens a journal for the attempt just generated in session state and tags the URL with its ID."""
+    st.session_state.attempt_id = uuid.uuid4().hex
+    st.session_state.editor_autosave = {}
+    start_time = st.session_state.test_start_time
+    record_attempt_event(
+        "start",
+        candidate_id=st.session_state.candidate_id,
+        test=st.session_state.current_test,
+        mode=st.session_state.mode,
+        seed=st.session_state.attempt_seed,
+        test_start_time=start_time.timestamp() if start_time else None,
+        questions=[get_blob_store().put(q) for q in st.session_state.questions],
+        essay_topic=st.session_state.essay_topic,
+        coding_problems=[get_blob_store().put(p) for p in st.session_state.coding_problems],
+    )
+    st.query_params["attempt"] = st.session_state.attempt_id
+
+def finish_attempt():
+    """Closes the current attempt's journal so it can no longer be resumed, and feeds its answers to review and topic stats."""
+    record_attempt_event("finish")
+    update_review_deck(st.session_state.questions, st.session_state.answers)
+    update_topic_stats(st.session_state.questions, st.session_state.answers)
+    st.session_state.attempt_id = None
+    if "attempt" in st.query_params:
+        del st.query_params["attempt"]
+
+def load_attempt(attempt_id):
+    """Replays an attempt's journal. Returns its state, or None if missing, finished or malformed."""
+    stream = attempt_stream(attempt_id)
+    if stream is None:
+        return None
+    state = None
+    for event in get_state_backend().read(stream):
+        if event["event"] == "start":
+            state = {**event, "answers": {}, "code": {}, "languages": {}, "essay_text": None,
+                     "questions": [resolve_blob(q) for q in event["questions"]],
+                     "coding_problems": [resolve_blob(p) for p in event["coding_problems"]]}
+        elif state is None:
+            continue
+        elif event["event"] == "answer":
+            state["answers"][event["index"]] = tuple(event["record"])
+        elif event["event"] == "code":
+            state["code"][event["problem"]] = resolve_blob(event["code"])
+        elif event["event"] == "code_language":
+            state["languages"][event["problem"]] = event["language"]
+        elif event["event"] == "essay":
+            state["essay_text"] = resolve_blob(event["text"])
+        elif event["event"] == "finish":
+            return None
+    return state
+
+def resume_attempt(attempt_id):
+    """
+    Restores an unfinished attempt into session state, keeping its original deadline. Only the
+    candidate who started it may resume it: attempt IDs travel in URLs, which get shared.
+    """
+    state = load_attempt(attempt_id)
+    if state is None or state.get("candidate_id") != st.session_state.candidate_id:
+        return False
+    reset_session_state_for_dashboard()
+    st.session_state.current_test = state["test"]
+    st.session_state.mode = state["mode"]
+    st.session_state.attempt_seed = state["seed"]
+    st.session_state.attempt_id = attempt_id
+    if state["test_start_time"] is not None:
+        st.session_state.test_start_time = datetime.fromtimestamp(state["test_start_time"])
+    st.session_state.questions = state["questions"]
+    st.session_state.essay_topic = state["essay_topic"]
+    st.session_state.coding_problems = state["coding_problems"]
+    if state["coding_problems"]:
+        st.session_state.answers = [{"type": "coding_test", "problems_solved": [
+            {"problem_title": p["title"], "user_code": state["code"].get(i, ""), "language": state["languages"].get(i, "python")}
+            for i, p in enumerate(state["coding_problems"])]}]
+    elif state["essay_text"] is not None:
+        st.session_state.answers = [{"essay_topic": state["essay_topic"], "essay_text": state["essay_text"]}]
+    else:
+        st.session_state.answers = [state["answers"][i] for i in sorted(state["answers"])]
+        st.session_state.current_question = len(st.session_state.answers)
+        st.session_state.score = count_correct_answers(st.session_state.answers)
+    st.query_params["attempt"] = attempt_id
+    return True
+
+# --- Progress History ---
+# Completed-test scores are appended to a per-candidate stream in the shared state backend.
+
+def load_progress_history(candidate_id):
+    """All recorded results of a candidate, oldest first."""
+    return get_state_backend().read(f"progress:{candidate_id}")
+
+def record_progress(test_name, score):
+    """Records a completed test for the dashboard charts, in the backend and in this session."""
+    entry = {"date": datetime.now().strftime("%Y-%m-%d"), "test_type": test_name, "score": score}
+    get_state_backend().append(f"progress:{st.session_state.candidate_id}", entry)
+    st.session_state.progress_data.append(entry)
+    get_leaderboards().record(test_name, st.session_state.cohort, st.session_state.candidate_id, score)
+
+# --- Live Leaderboard ---
+# Every committed test result is appended to one "leaderboard" stream in the shared state backend;
+# appends never contend with each other the way read-modify-write records would. Each worker
+# process tails that stream and keeps a sorted board per test and cohort (plus one across cohorts)
+# holding every candidate's best score, so a new result costs O(log n) and rank and percentile
+# queries need no sorting. Viewers read the top rows from a snapshot the process republishes at
+# most every LEADERBOARD_REFRESH_SECONDS, so any number of viewers costs one stream read per interval.
+
+LEADERBOARD_REFRESH_SECONDS = float(os.getenv("LEADERBOARD_REFRESH_SECONDS", "5")) # Max staleness of a published snapshot
+LEADERBOARD_TOP_N = 20 # Rows shown on a board
+LEADERBOARD_ALL_COHORTS = "All cohorts"
+
+class Leaderboard:
+    """Best score per candidate, kept in rank order (higher score first, earlier result first on ties)."""
+    def __init__(self):
+        self.ranked = SortedList() # (-score, committed_at, candidate_id)
+        self.entries = {} # candidate_id -> its tuple in `ranked`
+
+    def update(self, candidate_id, score, committed_at):
+        """Records a result if it beats the candidate's best; re-applying a result is a no-op. O(log n)."""
+        entry = (-score, committed_at, candidate_id)
+        current = self.entries.get(candidate_id)
+        if current is not None and current <= entry:
+            return False
+        if current is not None:
+            self.ranked.remove(current)
+        self.ranked.add(entry)
+        self.entries[candidate_id] = entry
+        return True
+
+    def rank(self, candidate_id):
+        """(rank, best score, percentile) of a candidate, or None if they have no result. Tied scores share a rank."""
+        entry = self.entries.get(candidate_id)
+        if entry is None:
+            return None
+        higher = self.ranked.bisect_left((entry[0],)) # Tuples starting with a smaller -score, i.e. better scores
+        lower = len(self.ranked) - self.ranked.bisect_left((entry[0], math.inf))
+        return higher + 1, -entry[0], 100 * lower / len(self.ranked)
+
+    def top(self, n):
+        """The first `n` rows as (rank, candidate ID, score)."""
+        rows, rank = [], 0
+        for position, (negative_score, _, candidate_id) in enumerate(self.ranked.islice(0, n)):
+            if not rows or -negative_score != rows[-1][2]:
+                rank = position + 1
+            rows.append((rank, candidate_id, -negative_score))
+        return rows
+
+class LeaderboardService:
+    """Per-process boards fed from the leaderboard stream, with periodically republished snapshots."""
+    def __init__(self, backend, refresh_seconds=LEADERBOARD_REFRESH_SECONDS, top_n=LEADERBOARD_TOP_N):
+        self.backend = backend
+        self.refresh_seconds = refresh_seconds
+        self.top_n = top_n
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.boards = {} # (test, cohort) -> Leaderboard
+        self.snapshots = {} # (test, cohort) -> {"top": rows, "size": candidates, "published_at": time}
+        self.changed = set() # Boards updated since their snapshot was published
+        self.applied = 0 # Stream entries applied so far
+        self.refreshed_at = 0.0
+
+    def _apply(self, event):
+        for cohort in (event["cohort"], LEADERBOARD_ALL_COHORTS):
+            key = (event["test"], cohort)
+            board = self.boards.setdefault(key, Leaderboard())
+            if board.update(event["candidate_id"], event["score"], event["at"]):
+                self.changed.add(key)
+
+    def record(self, test_name, cohort, candidate_id, score):
+        """Commits a result to the shared stream and applies it here at once, so its viewer sees it without waiting."""
+        event = {"test": test_name, "cohort": cohort, "candidate_id": candidate_id, "score": round(float(score), 2),
+                 "at": time.time()}
+        self.backend.append("leaderboard", event)
+        with self.lock:
+            self._apply(event) # Reading it back from the stream later is harmless: updates are idempotent
+            self._publish()
+
+    def refresh(self):
+        """Applies results other workers committed since the last refresh, at most once per interval."""
+        if time.time() - self.refreshed_at < self.refresh_seconds or not self.refresh_lock.acquire(blocking=False):
+            return # Fresh enough, or another thread is refreshing: viewers keep the current snapshot
+        try:
+            events = self.backend.read("leaderboard", self.applied)
+            with self.lock:
+                for event in events:
+                    self._apply(event)
+                self.applied += len(events)
+                self._publish()
+            self.refreshed_at = time.time()
+        finally:
+            self.refresh_lock.release()
+
+    def _publish(self):
+        now = time.time()
+        for key in self.changed:
+            board = self.boards[key]
+            self.snapshots[key] = {"top": board.top(self.top_n), "size": len(board.ranked), "published_at": now}
+        self.changed.clear()
+
+    def snapshot(self, test_name, cohort):
+        """The latest published top rows of a board (refreshing first if the interval has passed)."""
+        self.refresh()
+        return self.snapshots.get((test_name, cohort), {"top": [], "size": 0, "published_at": self.refreshed_at})
+
+    def rank(self, test_name, cohort, candidate_id):
+        """(rank, best score, percentile) from this process's board, or None."""
+        with self.lock:
+            board = self.boards.get((test_name, cohort))
+            return board.rank(candidate_id) if board else None
+
+    def cohorts(self, test_name):
+        with self.lock:
+            return sorted(cohort for test, cohort in self.boards if test == test_name and cohort != LEADERBOARD_ALL_COHORTS)
+
+@st.cache_resource(show_spinner=False)
+def get_leaderboards():
+    """Process-wide leaderboard service shared by every session on this worker."""
+    return LeaderboardService(get_state_backend())
+
+def leaderboard_label(candidate_id):
+    """Short anonymous name shown on boards; the viewer's own row says "You"."""
+    return "You" if candidate_id == st.session_state.candidate_id else f"Candidate {candidate_id[:6]}"
+
+# --- Spaced Repetition ---
+# Questions a candidate got wrong or skipped become review cards scheduled with SM-2. Each
+# candidate's deck is one record in the shared state backend: the cards plus a heap of
+# [due time, question ID] entries, so due cards are found in O(log n) each without scanning
+# the deck. Rescheduling pushes a new heap entry; the outdated one is skipped when it surfaces.
+
+REVIEW_SESSION_SIZE = int(os.getenv("REVIEW_SESSION_SIZE", "10"))
+REVIEW_DAY_SECONDS = float(os.getenv("REVIEW_DAY_SECONDS", "86400")) # Length of an SM-2 day; shorten to try the schedule out
+REVIEW_QUALITY = {"correct": 4, "incorrect": 1, "skipped": 0} # SM-2 grade (0-5) for each answer outcome
+REVIEW_SESSION_TEST = "Spaced Review" # current_test of review sessions, which mix questions from several tests
+
+def sm2_schedule(card, quality, now):
+    """Applies one SM-2 repetition graded `quality` (0-5) to a card and sets its next due time."""
+    if quality < 3:
+        card["reps"] = 0
+        card["interval"] = 1
+        card["lapses"] += 1
+    else:
+        card["reps"] += 1
+        card["interval"] = 1 if card["reps"] == 1 else 6 if card["reps"] == 2 else round(card["interval"] * card["ef"])
+    card["ef"] = max(1.3, card["ef"] + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    card["due"] = now + card["interval"] * REVIEW_DAY_SECONDS
+
+def load_review_deck(candidate_id):
+    return get_state_backend().get("review_decks", candidate_id) or {"cards": {}, "heap": []}
+
+def update_review_deck(questions, answers):
+    """
+    Schedules a finished attempt's MCQ answers: misses add a card due immediately (or lapse an
+    existing one), and answers to questions already in the deck advance their card. A question
+    answered more than once in the attempt is scheduled once, by its worst answer.
+    """
+    outcomes = {} # qid -> (question, worst outcome); the sample fallback can repeat a question within one attempt
+    for record in answers:
+        if is_mcq_record(record):
+            question_data = questions[record[ANSWER_INDEX]]
+            outcome = "skipped" if record[ANSWER_LETTER] is None else "correct" if record[ANSWER_CORRECT] else "incorrect"
+            qid = question_id(question_data)
+            if qid not in outcomes or REVIEW_QUALITY[outcome] < REVIEW_QUALITY[outcomes[qid][1]]:
+                outcomes[qid] = (question_data, outcome)
+    if not outcomes:
+        return
+    test_name = st.session_state.current_test
+
+    def apply(deck, now):
+        deck = deck or {"cards": {}, "heap": []}
+        for qid, (question_data, outcome) in outcomes.items():
+            card = deck["cards"].get(qid)
+            if card is None:
+                if outcome == "correct":
+                    continue
+                card = deck["cards"][qid] = {"question": {"test": test_name, **question_data},
+                                             "ef": 2.5, "reps": 0, "interval": 0, "lapses": 1, "due": now}
+            else:
+                sm2_schedule(card, REVIEW_QUALITY[outcome], now)
+            heapq.heappush(deck["heap"], [card["due"], qid])
+        if len(deck["heap"]) > 2 * len(deck["cards"]): # Mostly outdated entries; rebuild
+            deck["heap"] = [[card["due"], qid] for qid, card in deck["cards"].items()]
+            heapq.heapify(deck["heap"])
+        return deck, None
+
+    get_state_backend().update("review_decks", st.session_state.candidate_id, apply)
+
+def pop_due_cards(deck, now, limit):
+    """Up to `limit` due cards, most overdue first. Pops from `deck`'s heap, so pass a freshly loaded deck."""
+    heap, due = deck["heap"], []
+    while heap and heap[0][0] <= now and len(due) < limit:
+        due_at, qid = heapq.heappop(heap)
+        card = deck["cards"].get(qid)
+        if card is not None and card["due"] == due_at: # Otherwise the card was rescheduled since
+            due.append(card)
+    return due
+
+def weak_review_topics(deck, limit=3):
+    """(test, topic) pairs with the most lapses across the deck, weakest first."""
+    lapses = {}
+    for card in deck["cards"].values():
+        key = (card["question"].get("test"), card["question"].get("topic"))
+        if None not in key and key[0] in TEST_CONFIGS:
+            lapses[key] = lapses.get(key, 0) + card["lapses"]
+    return sorted(lapses, key=lapses.get, reverse=True)[:limit]
+
+# --- Answer Analytics ---
+# Every MCQ answer is logged as one row for cohort reports. Rows are buffered per process and
+# flushed to small Arrow IPC segments; once enough segments pile up, they are compacted into one
+# zstd-compressed Parquet part. String columns are dictionary-encoded, so repeated tests, topics
+# and questions cost a few bytes per row.
+
+ANALYTICS_DIR = os.path.join(PREP_AI_DATA_DIR, "analytics")
+ANALYTICS_FLUSH_ROWS = int(os.getenv("ANALYTICS_FLUSH_ROWS", "500"))
+ANALYTICS_FLUSH_SECONDS = float(os.getenv("ANALYTICS_FLUSH_SECONDS", "30"))
+ANALYTICS_COMPACT_SEGMENTS = int(os.getenv("ANALYTICS_COMPACT_SEGMENTS", "50"))
+ANALYTICS_PART_MB = 64 # Parquet parts smaller than this are merged again by the next compaction
+ANALYTICS_MIN_ITEM_ANSWERS = 5 # Items answered fewer times are left out of the item statistics
+ANALYTICS_STRING = pa.dictionary(pa.int32(), pa.string())
+ANSWER_EVENT_SCHEMA = pa.schema([
+    ("answered_at", pa.timestamp("ms")),
+    ("cohort", ANALYTICS_STRING),
+    ("candidate_id", ANALYTICS_STRING),
+    ("attempt_id", ANALYTICS_STRING),
+    ("test", ANALYTICS_STRING),
+    ("topic", ANALYTICS_STRING),
+    ("difficulty", ANALYTICS_STRING),
+    ("practice", pa.bool_()),
+    ("question_id", ANALYTICS_STRING),
+    ("question", ANALYTICS_STRING),
+    ("question_index", pa.int16()),
+    ("answer", ANALYTICS_STRING), # Null when skipped
+    ("is_correct", pa.bool_()),
+    ("seconds", pa.float32()), # Time spent on the question
+])
+
+class AnswerEventLog:
+    """Append-only columnar log of answer events, shared by the sessions of this process."""
+    def __init__(self, directory, flush_rows, flush_seconds, compact_segments):
+        self.directory = directory
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.compact_segments = compact_segments
+        self.lock = threading.Lock()
+        self.columns = {name: [] for name in ANSWER_EVENT_SCHEMA.names}
+        self.buffered_since = None
+        os.makedirs(directory, exist_ok=True)
+
+    def record(self, **row):
+        """Buffers one event; flushes when the buffer is large or old enough."""
+        with self.lock:
+            for name, values in self.columns.items():
+                values.append(row.get(name))
+            self.buffered_since = self.buffered_since or time.time()
+            due = len(self.columns["answered_at"]) >= self.flush_rows or \
+                  time.time() - self.buffered_since >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered events as a new segment, compacting when enough segments have piled up."""
+        with self.lock:
+            if not self.columns["answered_at"]:
+                return
+            columns = self.columns
+            self.columns = {name: [] for name in ANSWER_EVENT_SCHEMA.names}
+            self.buffered_since = None
+        table = pa.table(columns).cast(ANSWER_EVENT_SCHEMA, safe=False) # Timestamps are truncated to milliseconds
+        path = os.path.join(self.directory, f"segment-{time.time_ns()}-{uuid.uuid4().hex[:8]}.arrow")
+        with pa.OSFile(f"{path}.tmp", "wb") as sink, pa.ipc.new_file(sink, ANSWER_EVENT_SCHEMA) as writer:
+            writer.write_table(table)
+        os.replace(f"{path}.tmp", path)
+        if len(self._files(".arrow")) >= self.compact_segments:
+            self.compact()
+
+    def compact(self):
+        """
+        Merges every segment, and any Parquet part still below ANALYTICS_PART_MB, into one new part.
+        A lease in the state backend keeps it to one worker at a time.
+        """
+        def take_lease(expires, now):
+            if expires and expires > now:
+                return None, False
+            return now + 300, True
+
+        backend = get_state_backend()
+        if not backend.update("leases", "analytics_compaction", take_lease):
+            return
+        try:
+            segments = self._files(".arrow")
+            if not segments:
+                return
+            small_parts = [path for path in self._files(".parquet") if os.path.getsize(path) < ANALYTICS_PART_MB * 2 ** 20]
+            table = pa.concat_tables([pq.read_table(path) for path in small_parts] +
+                                     [self._read_segment(path) for path in segments])
+            path = os.path.join(self.directory, f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet")
+            pq.write_table(table, f"{path}.tmp", compression="zstd")
+            os.replace(f"{path}.tmp", path)
+            for merged in small_parts + segments:
+                os.remove(merged)
+        finally:
+            backend.put("leases", "analytics_compaction", 0)
+
+    def _files(self, suffix):
+        return sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(suffix))
+
+    def _read_segment(self, path):
+        with pa.OSFile(path) as source:
+            return pa.ipc.open_file(source).read_all()
+
+    def version(self):
+        """Changes whenever a segment or part is written or removed; used as a cache key."""
+        return tuple((name, os.path.getsize(os.path.join(self.directory, name)))
+                     for name in sorted(os.listdir(self.directory)) if name.endswith((".arrow", ".parquet")))
+
+    def read(self, columns=None):
+        """Every flushed event as one Arrow table, optionally only the named columns."""
+        for _ in range(3):
+            try:
+                tables = [pq.read_table(path, columns=columns) for path in self._files(".parquet")] + \
+                         [self._read_segment(path).select(columns or ANSWER_EVENT_SCHEMA.names) for path in self._files(".arrow")]
+                break
+            except FileNotFoundError:
+                continue # A compaction replaced segments between listing and reading them
+        else:
+            raise RuntimeError("Answer log kept changing while being read.")
+        if not tables:
+            tables = [ANSWER_EVENT_SCHEMA.empty_table().select(columns or ANSWER_EVENT_SCHEMA.names)]
+        return pa.concat_tables(tables)
+
+@st.cache_resource(show_spinner=False)
+def get_answer_event_log():
+    """Process-wide answer event log."""
+    return AnswerEventLog(ANALYTICS_DIR, ANALYTICS_FLUSH_ROWS, ANALYTICS_FLUSH_SECONDS, ANALYTICS_COMPACT_SEGMENTS)
+
+# Columns the cohort report reads; the rest are left on disk
+REPORT_COLUMNS = ["cohort", "attempt_id", "test", "topic", "practice", "question_id", "question", "answer", "is_correct", "seconds"]
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def load_answer_events(version):
+    """Logged answers (REPORT_COLUMNS) as a DataFrame with categorical string columns, reloaded when `version` changes."""
+    return get_answer_event_log().read(REPORT_COLUMNS).to_pandas()
+
+def question_id(question_data):
+    """Stable ID of a question across papers and sessions: a short hash of its text."""
+    return hashlib.blake2b(question_data["question"].encode("utf-8"), digest_size=8).hexdigest()
+
+def log_answer(question_data, record, is_practice_mode):
+    """Adds one answered or skipped question of the current attempt to the answer log."""
+    get_answer_event_log().record(
+        answered_at=datetime.fromtimestamp(record[ANSWER_TIME]),
+        cohort=st.session_state.cohort,
+        candidate_id=st.session_state.candidate_id,
+        attempt_id=st.session_state.attempt_id,
+        test=question_data.get("test", st.session_state.current_test),
+        topic=question_data.get("topic"),
+        difficulty=question_data.get("difficulty"),
+        practice=is_practice_mode,
+        question_id=question_id(question_data),
+        question=question_data["question"],
+        question_index=record[ANSWER_INDEX],
+        answer=record[ANSWER_LETTER],
+        is_correct=record[ANSWER_CORRECT],
+        seconds=answer_seconds(record),
+    )
+
+def category_codes(column):
+    """Integer codes of a categorical column (-1 for missing values) and its categories as an array."""
+    return column.cat.codes.to_numpy(), column.cat.categories.to_numpy(dtype=object)
+
+def cohort_report(events):
+    """
+    Per-topic accuracy and per-item statistics from answer events, vectorized over category codes.
+    Item difficulty is the share of correct answers; discrimination is the point-biserial
+    correlation between answering the item correctly and the rest of the attempt's score.
+    """
+    correct = events["is_correct"].to_numpy(dtype=np.float64)
+    tests, test_names = category_codes(events["test"])
+    topics, topic_names = category_codes(events["topic"])
+    items, _ = category_codes(events["question_id"])
+    attempts, _ = category_codes(events["attempt_id"])
+    questions, question_texts = category_codes(events["question"])
+
+    # Topic statistics, grouped on one combined integer key per (test, topic)
+    groups = tests.astype(np.int64) * (len(topic_names) + 1) + (topics + 1)
+    keys = np.flatnonzero(np.bincount(groups))
+    group_index = np.zeros(keys[-1] + 1, dtype=np.int64)
+    group_index[keys] = np.arange(len(keys))
+    group_index = group_index[groups] # Dense group number per row
+    group_answers = np.bincount(group_index)
+    topic_stats = pd.DataFrame({
+        "test": test_names[keys // (len(topic_names) + 1)],
+        "topic": np.append(topic_names, None)[keys % (len(topic_names) + 1) - 1],
+        "answers": group_answers,
+        "accuracy": np.bincount(group_index, weights=correct) / group_answers,
+        "skip_rate": np.bincount(group_index, weights=events["answer"].isna().to_numpy()) / group_answers,
+        "median_seconds": pd.Series(events["seconds"].to_numpy()).groupby(group_index).median().to_numpy(),
+    })
+
+    # Rest score: share of the attempt's other questions answered correctly
+    others = np.bincount(attempts)[attempts] - 1
+    usable = others > 0
+    x = correct[usable]
+    y = (np.bincount(attempts, weights=correct)[attempts][usable] - x) / others[usable]
+    rows = items[usable]
+    item_count = items.max() + 1
+    n = np.bincount(rows, minlength=item_count)
+    sum_x = np.bincount(rows, weights=x, minlength=item_count)
+    sum_y = np.bincount(rows, weights=y, minlength=item_count)
+    sum_xy = np.bincount(rows, weights=x * y, minlength=item_count)
+    sum_yy = np.bincount(rows, weights=y * y, minlength=item_count)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        discrimination = (n * sum_xy - sum_x * sum_y) / np.sqrt((n * sum_x - sum_x ** 2) * (n * sum_yy - sum_y ** 2))
+
+    # One row per item; its first occurrence supplies the test, topic and text
+    answers = np.bincount(items, minlength=item_count)
+    present = np.flatnonzero(answers)
+    first = np.empty(item_count, dtype=np.int64)
+    first[items[::-1]] = np.arange(len(items) - 1, -1, -1) # Earlier rows are written last and win
+    first, answers = first[present], answers[present]
+    item_stats = pd.DataFrame({
+        "test": test_names[tests[first]],
+        "topic": np.append(topic_names, None)[topics[first]],
+        "question": question_texts[questions[first]],
+        "answers": answers,
+        "difficulty": np.bincount(items, weights=correct, minlength=item_count)[present] / answers,
+        "discrimination": discrimination[present],
+    })
+    item_stats = item_stats[item_stats["answers"] >= ANALYTICS_MIN_ITEM_ANSWERS]
+    return topic_stats, item_stats.sort_values("discrimination", na_position="last").reset_index(drop=True)
+
+# --- Time Management Analytics ---
+# Built from the seconds stored in each answer record, so timing stays on for every attempt at
+# the cost of one float per answer.
+
+SLOW_QUESTION_MADS = 3.0 # A question is slow when its time exceeds the median by this many (scaled) MADs
+RUSHED_QUESTION_SHARE = 0.25 # An incorrect answer is rushed when it took less than this share of the median
+
+def attempt_time_report(questions, answers, time_limit_minutes):
+    """
+    One row per timed answer: topic, outcome, seconds, cumulative time against the even pace
+    for the time limit, and an outlier flag ("slow" or "rushed").
+    """
+    records = [r for r in answers if is_mcq_record(r) and answer_seconds(r) is not None]
+    report = pd.DataFrame({
+        "question": [r[ANSWER_INDEX] + 1 for r in records],
+        "topic": [questions[r[ANSWER_INDEX]].get("topic", "Unknown") for r in records],
+        "outcome": ["Skipped" if r[ANSWER_LETTER] is None else "Correct" if r[ANSWER_CORRECT] else "Incorrect" for r in records],
+        "seconds": [answer_seconds(r) for r in records],
+    })
+    target = time_limit_minutes * 60 / max(1, len(questions))
+    report["cumulative_seconds"] = report["seconds"].cumsum()
+    report["target_cumulative_seconds"] = report["question"] * target
+
+    # Robust outliers: median absolute deviation is not dragged up by the outliers themselves
+    median = report["seconds"].median()
+    mad = 1.4826 * (report["seconds"] - median).abs().median()
+    report["flag"] = ""
+    report.loc[report["seconds"] > median + SLOW_QUESTION_MADS * max(mad, 1.0), "flag"] = "slow"
+    report.loc[(report["outcome"] == "Incorrect") & (report["seconds"] < RUSHED_QUESTION_SHARE * median), "flag"] = "rushed"
+    return report, target
+
+def time_by_outcome(report):
+    """Mean seconds per answer for each outcome of an `attempt_time_report`."""
+    return report.groupby("outcome")["seconds"].mean()
+
+def time_by_topic(report):
+    """Questions, median seconds and accuracy for each topic of an `attempt_time_report`."""
+    return report.groupby("topic").agg(
+        questions=("seconds", "size"),
+        median_seconds=("seconds", "median"),
+        accuracy=("outcome", lambda outcome: (outcome == "Correct").mean()),
+    ).reset_index()
+
+def show_time_analytics(time_report, time_limit_minutes):
+    """Displays time per question, per topic and by outcome, pace against the time limit, and outliers."""
+    report, target = time_report
+    if report.empty:
+        return
+    st.markdown("### ⏱️ Time Management")
+    used = report["seconds"].sum()
+    by_outcome = time_by_outcome(report)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Time Used", f"{used / 60:.1f} / {time_limit_minutes} min")
+    with col2:
+        st.metric("Average per Question", f"{report['seconds'].mean():.0f} s",
+                  delta=f"{report['seconds'].mean() - target:+.0f} s vs. target {target:.0f} s", delta_color="inverse")
+    with col3:
+        if "Correct" in by_outcome and "Incorrect" in by_outcome:
+            st.metric("Correct vs. Incorrect", f"{by_outcome['Correct']:.0f} s / {by_outcome['Incorrect']:.0f} s")
+
+    fig = px.bar(report, x="question", y="seconds", color="outcome", hover_data=["topic", "flag"],
+                 color_discrete_map={"Correct": "#4caf50", "Incorrect": "#f44336", "Skipped": "#ff9800"},
+                 labels={"question": "Question", "seconds": "Seconds"}, title="Time per Question")
+    fig.add_hline(y=target, line_dash="dash", annotation_text="Target pace")
+    st.plotly_chart(fig, use_container_width=True)
+
+    pace = go.Figure()
+    pace.add_trace(go.Scatter(x=report["question"], y=report["cumulative_seconds"] / 60, name="Your time", mode="lines+markers"))
+    pace.add_trace(go.Scatter(x=report["question"], y=report["target_cumulative_seconds"] / 60, name="Even pace", line={"dash": "dash"}))
+    pace.update_layout(title="Pace Against the Time Limit", xaxis_title="Question", yaxis_title="Minutes elapsed")
+    st.plotly_chart(pace, use_container_width=True)
+
+    st.dataframe(time_by_topic(report), hide_index=True)
+
+    outliers = report[report["flag"] != ""]
+    if not outliers.empty:
+        st.markdown("**Questions worth a second look:**")
+        for row in outliers.itertuples():
+            if row.flag == "slow":
+                st.warning(f"🐢 Q{row.question} ({row.topic}) took {row.seconds:.0f} s, far above your median of {report['seconds'].median():.0f} s.")
+            else:
+                st.warning(f"⚡ Q{row.question} ({row.topic}) was answered incorrectly in only {row.seconds:.0f} s; it may have been rushed.")
+
+EDITOR_AUTOSAVE_INTERVAL = float(os.getenv("EDITOR_AUTOSAVE_INTERVAL", "5")) # Min seconds between saves of one editor
+
+def autosave_editor(editor_id, content, persist, force=False):
+    """
+    Calls `persist(content)` only when the content hash differs from the last saved version,
+    and at most once per EDITOR_AUTOSAVE_INTERVAL seconds per editor. A change that arrives
+    too soon is kept as pending and saved by `flush_editor_autosaves` once the interval has
+    passed (or by the next edit or submission). Returns True if saved.
+    """
+    digest = hashlib.blake2b(content.encode("utf-8"), digest_size=16).digest()
+    saved = st.session_state.editor_autosave.setdefault(editor_id, {"hash": None, "saved_at": 0.0, "pending": None})
+    if digest == saved["hash"]:
+        saved["pending"] = None # Edited back to the saved version
+        return False
+    now = time.time()
+    if not force and now - saved["saved_at"] < EDITOR_AUTOSAVE_INTERVAL:
+        saved["pending"] = content
+        return False
+    persist(content)
+    saved.update(hash=digest, saved_at=now, pending=None)
+    return True
+
+def flush_editor_autosaves(persisters):
+    """Saves the pending content of each editor in `persisters` (editor ID -> persist) whose interval has passed."""
+    for editor_id, persist in persisters.items():
+        saved = st.session_state.editor_autosave.get(editor_id)
+        if saved and saved.get("pending") is not None:
+            autosave_editor(editor_id, saved["pending"], persist)
+
+@st.fragment(run_every=EDITOR_AUTOSAVE_INTERVAL)
+@governed
+def show_autosave_flusher(persisters):
+    """Renders nothing; reruns every autosave interval so an edit made just after a save is still journaled."""
+    flush_editor_autosaves(persisters)
 
 # --- Streamlit UI Functions ---
 
@@ -579,6 +3918,20 @@ def main():
             else:
                 st.warning("You can use the app with sample questions, but AI-generated content requires an API key. Please add it to a `.env` file as `GROQ_API_KEY='your_key'` or enter it above.")
 
+    # Progress history lives in the shared state backend, keyed by the candidate ID in the URL
+    if st.session_state.progress_data is None:
+        st.session_state.progress_data = load_progress_history(st.session_state.candidate_id)
+    if st.query_params.get("candidate") != st.session_state.candidate_id:
+        st.query_params["candidate"] = st.session_state.candidate_id
+
+    # Resume an unfinished attempt when the URL carries its ID (e.g. after a reconnect or redeploy)
+    url_attempt_id = st.query_params.get("attempt")
+    if url_attempt_id and url_attempt_id != st.session_state.attempt_id and st.session_state.mode == "dashboard":
+        if resume_attempt(url_attempt_id):
+            st.rerun()
+        else:
+            del st.query_params["attempt"]
+
     # Sidebar Navigation
     st.sidebar.title("📋 Test Menu")
 
@@ -592,6 +3945,20 @@ def main():
         st.session_state.mode = "practice"
         st.rerun()
 
+    if st.sidebar.button("📊 Cohort Analytics", key="analytics_btn"):
+        reset_session_state_for_dashboard()
+        st.session_state.mode = "analytics"
+        st.rerun()
+
+    if st.sidebar.button("🏆 Leaderboard", key="leaderboard_btn"):
+        reset_session_state_for_dashboard()
+        st.session_state.mode = "leaderboard"
+        st.rerun()
+
+    # Server-wide operator panels below cover every session, so only the admin view shows them
+    if st.session_state.is_admin:
+        show_admin_panels()
+
     # Render content based on the current mode
     if st.session_state.mode == "dashboard":
         show_dashboard()
@@ -605,6 +3972,41 @@ def main():
         show_results()
     elif st.session_state.mode == "practice_results_review":
         show_detailed_mcq_review(is_practice_mode=True)
+    elif st.session_state.mode == "analytics":
+        show_analytics()
+    elif st.session_state.mode == "leaderboard":
+        show_leaderboard()
+
+def show_admin_panels():
+    """Server-wide operator metrics in the sidebar; shown only to the admin view."""
+    # Token usage per delivered question, across all sessions on this server
+    token_report = get_token_usage_ledger().report()
+    if not token_report.empty:
+        with st.sidebar.expander("🔢 LLM Token Usage"):
+            st.dataframe(token_report[["test_type", "prompt_tokens_per_question", "completion_tokens_per_question", "delivered",
+                                       "corrected", "rejected"]], hide_index=True)
+
+    # Judge build cache and startup overhead, once a solution or fixture has been run
+    judge_report = get_judge_runner().report()
+    if judge_report["runs"].sum():
+        with st.sidebar.expander("⚙️ Judge Runners"):
+            st.dataframe(judge_report, hide_index=True)
+            st.caption("Startup overhead per language: `python bench.py --judge-overhead`")
+
+    blob_report = get_blob_store().report()
+    if blob_report["references"]:
+        with st.sidebar.expander("🗜️ Blob Storage"):
+            st.caption(f"Attempt payloads take {blob_report['stored_kb']} KB instead of {blob_report['raw_json_kb']} KB of JSON "
+                       f"({blob_report['reduction']:.0%} smaller)")
+            st.dataframe(pd.DataFrame([blob_report]).T.rename(columns={0: "value"}).astype(str))
+
+    session_metrics = get_session_governor().metrics()
+    if session_metrics:
+        with st.sidebar.expander("🧠 Session Memory"):
+            resident_kb = sum(m["kb"] for m in session_metrics if not m["spilled"])
+            st.caption(f"{len(session_metrics)} sessions, {resident_kb:.0f} KB resident, "
+                       f"{sum(m['spilled'] for m in session_metrics)} spilled to disk")
+            st.dataframe(pd.DataFrame(session_metrics), hide_index=True)
 
 def reset_session_state_for_dashboard():
     """Resets all relevant session state variables to default for a fresh start."""
@@ -616,6 +4018,13 @@ def reset_session_state_for_dashboard():
     st.session_state.test_start_time = None
     st.session_state.essay_topic = ""
     st.session_state.coding_problems = []
+    st.session_state.attempt_seed = None
+    st.session_state.attempt_id = None
+    st.session_state.editor_autosave = {}
+    st.session_state.question_shown = None
+    st.session_state.review_summary = None
+    if "attempt" in st.query_params:
+        del st.query_params["attempt"]
 
 # --- UI Display Functions ---
 
@@ -650,6 +4059,15 @@ def show_dashboard():
     else:
         st.info("Complete tests to see your progress here!")
 
+    # Resume an unfinished attempt by ID (the ID is also kept in the page URL during a test)
+    with st.expander("⏯️ Resume an unfinished attempt"):
+        resume_id = st.text_input("Attempt ID:", key="resume_attempt_id_input").strip()
+        if st.button("Resume", key="resume_attempt_btn") and resume_id:
+            if resume_attempt(resume_id):
+                st.rerun()
+            else:
+                st.error("No unfinished attempt found with that ID.")
+
     # Test Selection
     st.markdown("---")
     st.markdown("## 📚 Select a Test")
@@ -682,34 +4100,26 @@ def show_dashboard():
                     st.session_state.current_test = test_name
                     st.session_state.test_start_time = datetime.now()
                     st.session_state.mode = "test"
-
-                    with st.spinner(f"Generating {test_name} content... This may take a moment."):
-                        if test_name == "Written English Test":
-                            st.session_state.essay_topic = generate_essay_topic()
-                        elif test_name == "Coding Test":
-                            st.session_state.coding_problems = generate_coding_problems()
-                        else:
-                            all_questions = []
-                            # Distribute questions among topics
-                            questions_per_topic = config['question_count'] // len(config['topics'])
-                            remaining_questions = config['question_count'] % len(config['topics'])
-
-                            for topic in config['topics']:
-                                q_count = questions_per_topic
-                                if remaining_questions > 0:
-                                    q_count += 1
-                                    remaining_questions -= 1
-                                questions = generate_questions(test_name, topic, q_count, selected_difficulty_dashboard)
-                                all_questions.extend(questions)
-
-                            # Shuffle and select to ensure randomness and target count
-                            random.shuffle(all_questions)
-                            st.session_state.questions = all_questions[:config['question_count']]
-                            if not st.session_state.questions:
-                                st.error(f"Failed to generate questions for {test_name}. Please check your API key or try again.")
-                                st.session_state.mode = "dashboard" # Go back to dashboard on failure
-                                return
-
+                    st.session_state.attempt_seed = new_attempt_seed()
+                    rng = random.Random(st.session_state.attempt_seed)
+
+                    # A pre-generated paper (see provision.py) starts instantly; otherwise generate one now
+                    if not use_provisioned_paper(test_name, selected_difficulty_dashboard):
+                        with st.spinner(f"Generating {test_name} content... This may take a moment."):
+                            if test_name == "Written English Test":
+                                st.session_state.essay_topic = generate_essay_topic(rng)
+                            elif test_name == "Coding Test":
+                                st.session_state.coding_problems = generate_coding_problems(rng)
+                            else:
+                                st.session_state.questions = generate_test_questions(
+                                    test_name, selected_difficulty_dashboard, rng,
+                                    topic_stats=load_topic_stats(st.session_state.candidate_id, test_name))
+                                if not st.session_state.questions:
+                                    st.error(f"Failed to generate questions for {test_name}. Please check your API key or try again.")
+                                    st.session_state.mode = "dashboard" # Go back to dashboard on failure
+                                    return
+
+                    start_attempt()
                     st.rerun() # Rerun to start the test interface
 
 def show_test_interface():
@@ -734,6 +4144,13 @@ def show_test_interface():
         minutes, seconds = divmod(remaining_seconds, 60)
         st.markdown(f'<div class="timer">⏱️ Time Remaining: {minutes:02d}:{seconds:02d}</div>', unsafe_allow_html=True)
 
+        # Pace: time in hand (or lost) against spending the limit evenly, counting the question on screen
+        if st.session_state.questions:
+            target = config['time_limit'] * 60 / len(st.session_state.questions)
+            ahead = (len(st.session_state.answers) + 1) * target - elapsed.total_seconds()
+            st.caption(f"Target pace: {target:.0f} s per question · "
+                       f"{'ahead of' if ahead >= 0 else 'behind'} pace by {abs(ahead) / 60:.1f} min")
+
         # Delegate to specific test content based on type
         if test_name == "Written English Test":
             show_essay_interface()
@@ -782,21 +4199,25 @@ def show_mcq_interface(is_practice_mode=False):
 
     question_data = st.session_state.questions[current_q_index]
 
+    # Time the question from its first display; reruns while it stays on screen keep that timestamp
+    shown = st.session_state.question_shown
+    if shown is None or shown[:2] != (st.session_state.attempt_id, current_q_index):
+        shown = st.session_state.question_shown = (st.session_state.attempt_id, current_q_index, time.time())
+    seconds_on_question = time.time() - shown[2]
+
     progress = (current_q_index + 1) / total_questions
     st.progress(progress, text=f"Question {current_q_index + 1} of {total_questions}")
 
     st.markdown(f'<div class="question-box"><h4>{question_data["question"]}</h4></div>', unsafe_allow_html=True)
 
     # Pre-select user's previous answer if available (for navigation)
-    selected_option_value = None
+    initial_index = None
     if len(st.session_state.answers) > current_q_index:
         prev_answer = st.session_state.answers[current_q_index]
-        if prev_answer and prev_answer.get("user_answer_text") not in ["Skipped", "Not Answered"]:
-            selected_option_value = prev_answer.get("user_answer_text")
-
-    initial_index = None
-    if selected_option_value in question_data["options"]:
-        initial_index = question_data["options"].index(selected_option_value)
+        if is_mcq_record(prev_answer) and prev_answer[ANSWER_LETTER]:
+            selected_option_value = option_for_letter(question_data["options"], prev_answer[ANSWER_LETTER])
+            if selected_option_value in question_data["options"]:
+                initial_index = question_data["options"].index(selected_option_value)
 
     selected_option = st.radio(
         "Choose your answer:",
@@ -810,34 +4231,25 @@ def show_mcq_interface(is_practice_mode=False):
     with col1:
         if st.button("Submit Answer", key=f"submit_mcq_{current_q_index}_{st.session_state.current_test}"):
             answer_letter = selected_option[0] if selected_option else None
-            user_marked_option_text = selected_option if selected_option else "Not Answered"
 
             if answer_letter is None:
                 st.warning("Please select an answer before submitting.")
             else:
                 correct = (answer_letter == question_data["correct_answer"])
-
-                answer_entry = {
-                    "question": question_data["question"],
-                    "options": question_data["options"],
-                    "user_answer_letter": answer_letter,
-                    "user_answer_text": user_marked_option_text,
-                    "correct_answer_letter": question_data["correct_answer"],
-                    "correct_answer_text": next(opt for opt in question_data["options"] if opt.startswith(question_data["correct_answer"] + ")")),
-                    "is_correct": correct,
-                    "explanation": question_data["explanation"]
-                }
+                answer_entry = make_answer_record(current_q_index, answer_letter, correct, seconds_on_question)
 
                 # Update or append the answer
                 if len(st.session_state.answers) <= current_q_index:
                     st.session_state.answers.append(answer_entry)
                 else:
                     st.session_state.answers[current_q_index] = answer_entry
+                record_attempt_event("answer", index=current_q_index, record=answer_entry)
+                log_answer(question_data, answer_entry, is_practice_mode)
 
                 # Provide immediate feedback in practice mode
                 if is_practice_mode:
                     # Recalculate score for immediate display
-                    st.session_state.score = sum(1 for ans in st.session_state.answers if ans.get("is_correct"))
+                    st.session_state.score = count_correct_answers(st.session_state.answers)
                     if correct:
                         st.success("✅ Correct!")
                     else:
@@ -849,21 +4261,14 @@ def show_mcq_interface(is_practice_mode=False):
 
     with col2:
         if st.button("Skip Question", key=f"skip_mcq_{current_q_index}_{st.session_state.current_test}"):
-            answer_entry = {
-                "question": question_data["question"],
-                "options": question_data["options"],
-                "user_answer_letter": "Skipped",
-                "user_answer_text": "Skipped",
-                "correct_answer_letter": question_data["correct_answer"],
-                "correct_answer_text": next(opt for opt in question_data["options"] if opt.startswith(question_data["correct_answer"] + ")")),
-                "is_correct": False,
-                "explanation": question_data["explanation"]
-            }
+            answer_entry = make_answer_record(current_q_index, None, False, seconds_on_question)
             if len(st.session_state.answers) <= current_q_index:
                 st.session_state.answers.append(answer_entry)
             else:
                 st.session_state.answers[current_q_index] = answer_entry
-            
+            record_attempt_event("answer", index=current_q_index, record=answer_entry)
+            log_answer(question_data, answer_entry, is_practice_mode)
+
             st.session_state.current_question += 1
             st.rerun()
 
@@ -879,21 +4284,23 @@ def show_essay_interface():
     st.markdown(f"### Essay Topic: {st.session_state.essay_topic}")
     st.markdown("**Instructions:** Write a well-structured essay of at least 120 words on the given topic. Focus on clarity, coherence, and correct grammar.")
 
-    # Pre-fill if essay was already written (e.g., during rerun)
+    # Pre-fill if essay was already written (e.g., after resuming an attempt)
     current_essay_text = ""
     # Check if the answers list is not empty and the first element contains an essay_text (for written tests)
     if st.session_state.answers and len(st.session_state.answers) > 0 and \
        st.session_state.answers[0].get("essay_text") is not None:
         current_essay_text = st.session_state.answers[0]["essay_text"]
 
-    essay_text = st.text_area("Your Essay:", height=300, max_chars=2000, key="essay_input", value=current_essay_text)
-    word_count = len(essay_text.split()) if essay_text.strip() else 0 # Robust word count
-
-    st.markdown(f"**Word Count:** {word_count} / 120 (minimum)")
+    show_essay_editor(current_essay_text)
+    show_autosave_flusher({"essay": lambda text: record_attempt_event("essay", text=get_blob_store().put(text))})
 
     if st.button("Submit Essay", key="submit_essay_btn"):
+        # The editor's on_change callback has already stored the latest text
+        essay_text = st.session_state.answers[0]["essay_text"] if st.session_state.answers else ""
+        word_count = len(essay_text.split()) if essay_text.strip() else 0 # Robust word count
         if word_count >= 120:
             st.success("✅ Essay submitted successfully! Review your score and feedback below.")
+            autosave_editor("essay", essay_text, lambda text: record_attempt_event("essay", text=get_blob_store().put(text)), force=True)
 
             # Simple placeholder scoring for essay
             score = min(100, (word_count / 120) * 80 + 20)
@@ -917,6 +4324,22 @@ def show_essay_interface():
         else:
             st.error("❌ Essay must be at least 120 words long to submit.")
 
+@st.fragment
+@governed
+def show_essay_editor(current_essay_text):
+    """Essay text area and word count. Typing reruns only this fragment, not the whole page."""
+    essay_text = st.text_area("Your Essay:", height=300, max_chars=2000, key="essay_input", value=current_essay_text,
+                              on_change=on_essay_edited)
+    word_count = len(essay_text.split()) if essay_text.strip() else 0 # Robust word count
+    st.markdown(f"**Word Count:** {word_count} / 120 (minimum)")
+
+@governed
+def on_essay_edited():
+    """Stores the edited essay and autosaves it (only runs when the text actually changed)."""
+    essay_text = st.session_state.essay_input
+    st.session_state.answers = [{"essay_topic": st.session_state.essay_topic, "essay_text": essay_text}]
+    autosave_editor("essay", essay_text, lambda text: record_attempt_event("essay", text=get_blob_store().put(text)))
+
 def show_coding_interface():
     """Displays the coding test interface."""
     if not st.session_state.coding_problems:
@@ -927,71 +4350,95 @@ def show_coding_interface():
         return
 
     st.markdown("### Coding Problems")
-    st.markdown("**Instructions:** Solve the following programming problems. Write clean, efficient code. You can use any programming language you prefer, but focus on the logic.")
-
-    user_solutions_status = [] # To track if all problems have some input
-
-    # Initialize or retrieve user's solutions for persistence across reruns
-    # Ensures the answers list is set up correctly for coding problems
-    if not st.session_state.answers or \
-       not (len(st.session_state.answers) > 0 and st.session_state.answers[0].get("type") == "coding_test"):
-        st.session_state.answers = [
-            {"type": "coding_test", "problems_solved": []}
-        ]
-        # Populate problems_solved based on actual coding_problems
-        for p in st.session_state.coding_problems:
-            st.session_state.answers[0]["problems_solved"].append({"problem_title": p['title'], "user_code": ""})
-    
-    # Ensure problems_solved list aligns with the number of coding problems
-    # This handles cases where problems might be re-generated or changed
-    if len(st.session_state.answers[0]["problems_solved"]) != len(st.session_state.coding_problems):
-        new_problems_solved = []
-        for p in st.session_state.coding_problems:
-            found_existing = False
-            for existing_sol in st.session_state.answers[0]["problems_solved"]:
-                if existing_sol["problem_title"] == p['title']:
-                    new_problems_solved.append(existing_sol)
-                    found_existing = True
-                    break
-            if not found_existing:
-                new_problems_solved.append({"problem_title": p['title'], "user_code": ""})
-        st.session_state.answers[0]["problems_solved"] = new_problems_solved
-
+    languages = available_judge_languages()
+    if get_judge_runner().sandbox is None:
+        st.error("Solutions cannot be run on this server: no judge sandbox (bwrap, nsjail or unshare as root) is installed, "
+                 "so they will be saved but not scored.")
+        languages = ["python"]
+    elif get_judge_runner().sandbox == "none":
+        st.warning("Judged code runs without a sandbox (JUDGE_SANDBOX=none). Use this for local development only.")
+    st.markdown("**Instructions:** Solve the following programming problems. Write clean, efficient code. Each solution is a "
+                f"complete program in {', '.join(JUDGE_LANGUAGES[l]['label'] for l in languages)} that reads its input from "
+                "stdin and prints the answer to stdout; it is run against hidden test cases, including large inputs, when you submit.")
+
+    # Set up the answers list for coding problems once per attempt; edits then update it in place
+    if not st.session_state.answers or not isinstance(st.session_state.answers[0], dict) or \
+       st.session_state.answers[0].get("type") != "coding_test":
+        st.session_state.answers = [{"type": "coding_test", "problems_solved": [
+            {"problem_title": p['title'], "user_code": "", "language": "python"} for p in st.session_state.coding_problems]}]
 
     for i, problem in enumerate(st.session_state.coding_problems):
         st.markdown(f"---")
         st.markdown(f"#### Problem {i+1}: {problem['title']} ({problem['difficulty']})")
         st.markdown(f"**Description:** {problem['description']}")
         st.code(problem['example'], language="text")
+        if problem.get("io_format"):
+            st.markdown(f"**Input/Output:** {problem['io_format']}")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.caption("Sample input")
+                st.code(problem["sample_input"], language="text")
+            with col2:
+                st.caption("Sample output")
+                st.code(problem["sample_output"], language="text")
 
         st.markdown(f"**Your Solution (Problem {i+1}):**")
-        
-        # Get the current user's code for this specific problem from session state
-        current_solution_code = st.session_state.answers[0]["problems_solved"][i]["user_code"]
-
-        code = st.text_area(f"Write your code for '{problem['title']}' here:", height=200, key=f"code_{i}_{st.session_state.current_test}", value=current_solution_code)
-
-        # Update the session state immediately as the user types
-        st.session_state.answers[0]["problems_solved"][i]["user_code"] = code
-
-        user_solutions_status.append(bool(code.strip())) # Track if code was entered
+        show_code_editor(i, problem['title'], st.session_state.answers[0]["problems_solved"][i], languages)
 
+    show_autosave_flusher({f"code_{i}": lambda text, i=i: record_attempt_event("code", problem=i, code=get_blob_store().put(text))
+                           for i in range(len(st.session_state.coding_problems))})
     st.markdown("---")
 
     if st.button("Submit All Solutions", key="submit_all_code_btn"):
-        if not all(user_solutions_status):
+        problems_solved = st.session_state.answers[0]["problems_solved"]
+        if not all(solution["user_code"].strip() for solution in problems_solved):
             st.warning("Please provide solutions for all problems before submitting.")
         else:
+            for i, solution in enumerate(problems_solved):
+                autosave_editor(f"code_{i}", solution["user_code"],
+                                lambda text, i=i: record_attempt_event("code", problem=i, code=get_blob_store().put(text)), force=True)
+            with st.spinner("Running your solutions against the test cases..."):
+                pass_rates = []
+                for problem, solution in zip(st.session_state.coding_problems, problems_solved):
+                    solution["verdicts"] = grade_coding_solution(problem, solution["user_code"], solution.get("language", "python"))
+                    if solution["verdicts"]: # Problems without a judge are left out of the score
+                        pass_rates.append(sum(v["verdict"] == "Accepted" for v in solution["verdicts"]) / len(solution["verdicts"]))
             st.success("✅ All coding solutions submitted! Review your score and feedback below.")
-            st.info("💡 In a real test, your code would be run against hidden test cases for evaluation. For this simulation, a placeholder score is provided.")
 
-            # Placeholder score - in a real application, this would be determined by a backend judge
-            st.session_state.score = 85 # Example score
+            # Share of passed test cases, averaged over the problems
+            st.session_state.score = 100 * sum(pass_rates) / len(pass_rates) if pass_rates else 0
 
             st.session_state.test_start_time = None # End the timer
             st.session_state.mode = "results"
             st.rerun()
 
+@st.fragment
+@governed
+def show_code_editor(i, title, solution, languages):
+    """Language picker and code editor for problem `i`. Typing reruns only this fragment, not the whole page."""
+    language_key = f"code_language_{i}_{st.session_state.current_test}"
+    current_language = solution.get("language", "python")
+    st.selectbox("Language", languages, key=language_key, format_func=lambda l: JUDGE_LANGUAGES[l]["label"],
+                 index=languages.index(current_language) if current_language in languages else 0,
+                 on_change=on_code_language_changed, args=(i, language_key))
+    editor_key = f"code_{i}_{st.session_state.current_test}"
+    st.text_area(f"Write your code for '{title}' here:", height=200, key=editor_key, value=solution["user_code"],
+                 on_change=on_code_edited, args=(i, editor_key))
+
+@governed
+def on_code_language_changed(i, language_key):
+    """Stores and journals the language a solution is written in."""
+    language = st.session_state[language_key]
+    st.session_state.answers[0]["problems_solved"][i]["language"] = language
+    record_attempt_event("code_language", problem=i, language=language)
+
+@governed
+def on_code_edited(i, editor_key):
+    """Stores the edited solution and autosaves it (only runs when the code actually changed)."""
+    code = st.session_state[editor_key]
+    st.session_state.answers[0]["problems_solved"][i]["user_code"] = code
+    autosave_editor(f"code_{i}", code, lambda text: record_attempt_event("code", problem=i, code=get_blob_store().put(text)))
+
 def show_detailed_mcq_review(is_practice_mode=False):
     """
     Displays a detailed review for MCQ tests/practice sessions, showing questions,
@@ -1000,27 +4447,14 @@ def show_detailed_mcq_review(is_practice_mode=False):
     if is_practice_mode:
         st.markdown("---")
         st.markdown("## 📝 Detailed Practice Review")
+        if st.session_state.attempt_id:
+            finish_attempt()
     else:
         st.markdown("---")
         st.markdown("### 📝 Detailed Review")
 
     if st.session_state.answers:
-        for i, answer_data in enumerate(st.session_state.answers):
-            # Ensure it's an MCQ answer data structure
-            if "question" in answer_data and "options" in answer_data:
-                st.markdown(f"**Q{i+1}:** {answer_data['question']}")
-
-                user_answer_display = answer_data['user_answer_text']
-                if answer_data.get("is_correct", False):
-                    st.success(f"✅ Your Answer: {user_answer_display} (Correct)")
-                elif answer_data.get("user_answer_letter") == "Skipped":
-                    st.warning(f"⏭️ You Skipped this question.")
-                else:
-                    st.error(f"❌ Your Answer: {user_answer_display} (Incorrect)")
-
-                st.markdown(f"**Correct Answer:** {answer_data['correct_answer_text']}")
-                st.info(f"**Explanation:** {answer_data['explanation']}")
-                st.markdown("---")
+        show_review_page("practice" if is_practice_mode else "test")
     else:
         st.info("No questions were attempted in this session.")
 
@@ -1039,6 +4473,59 @@ def show_detailed_mcq_review(is_practice_mode=False):
                 st.session_state.mode = "dashboard"
                 st.rerun()
 
+@st.fragment
+@governed
+def show_review_page(view):
+    """
+    One page of the detailed review, under an outcome filter. Flipping pages or changing the filter
+    reruns only this fragment.
+    """
+    summary = current_attempt_summary()
+    page_key = f"review_page_{view}"
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        review_filter = st.radio("Show:", REVIEW_FILTERS, horizontal=True, key=f"review_filter_{view}",
+                                 format_func=lambda name: f"{name} ({len(summary['positions'][name])})",
+                                 on_change=lambda: st.session_state.update({page_key: 1}))
+    positions = summary["positions"][review_filter]
+    if not positions:
+        st.info(f"No answers match \"{review_filter}\".")
+        return
+    pages = math.ceil(len(positions) / REVIEW_PAGE_SIZE)
+    with col2:
+        page = st.number_input("Page:", 1, pages, key=page_key) if pages > 1 else 1
+    shown = review_page(positions, page)
+    start = (page - 1) * REVIEW_PAGE_SIZE
+    st.caption(f"Showing {start + 1}–{start + len(shown)} of {len(positions)}")
+
+    for i in shown:
+        show_review_entry(i, st.session_state.answers[i])
+
+def show_review_entry(i, record):
+    """Review of answer `i`: the question, the candidate's and the correct answer, and the explanation."""
+    answer_data = answer_view(record, st.session_state.questions)
+    st.markdown(f"**Q{i+1}:** {answer_data['question']}")
+
+    user_answer_display = answer_data['user_answer_text']
+    if answer_data.get("is_correct", False):
+        st.success(f"✅ Your Answer: {user_answer_display} (Correct)")
+    elif answer_data.get("user_answer_letter") == "Skipped":
+        st.warning(f"⏭️ You Skipped this question.")
+    else:
+        st.error(f"❌ Your Answer: {user_answer_display} (Incorrect)")
+
+    st.markdown(f"**Correct Answer:** {answer_data['correct_answer_text']}")
+    if answer_seconds(record) is not None:
+        st.caption(f"⏱️ {answer_seconds(record):.0f} s on this question")
+    st.info(f"**Explanation:** {answer_data['explanation']}")
+    if st.button("🔎 Practice similar questions", key=f"practice_similar_btn_{i}"):
+        question_data = st.session_state.questions[record[ANSWER_INDEX]]
+        similar = search_questions(question_data, REVIEW_SESSION_SIZE, exclude=(question_id(question_data),))
+        if similar:
+            start_practice_session(search_result_questions(similar), QUESTION_SEARCH_TEST)
+        st.info("No similar questions are in the question bank yet.")
+    st.markdown("---")
+
 def show_results():
     """Displays the final results for a completed test."""
     test_name = st.session_state.current_test
@@ -1047,6 +4534,11 @@ def show_results():
     st.markdown(f"---")
     st.markdown(f"## 🎯 {test_name} Results")
 
+    # The first run of the results page closes the attempt; later reruns (e.g. widget clicks) only redisplay it
+    newly_finished = bool(st.session_state.attempt_id)
+    if newly_finished:
+        finish_attempt()
+
     if test_name == "Written English Test":
         # Retrieve essay score
         if st.session_state.answers and st.session_state.answers[0].get("score_evaluated") is not None:
@@ -1088,15 +4580,24 @@ def show_results():
            st.session_state.answers[0].get("problems_solved"):
             for i, solved_problem in enumerate(st.session_state.answers[0]["problems_solved"]):
                 st.markdown(f"**Problem {i+1}:** {solved_problem['problem_title']}")
-                st.code(solved_problem['user_code'], language="python") # Display as Python code
+                language = JUDGE_LANGUAGES[solved_problem.get("language", "python")]
+                st.caption(language["label"])
+                st.code(solved_problem['user_code'], language=language["highlight"])
+                verdicts = solved_problem.get("verdicts")
+                if verdicts:
+                    passed = sum(v["verdict"] == "Accepted" for v in verdicts)
+                    st.caption(f"{passed}/{len(verdicts)} test cases passed")
+                    st.dataframe(pd.DataFrame(verdicts).rename(columns={"kind": "Test", "verdict": "Verdict", "seconds": "Seconds"}),
+                                 hide_index=True)
+                elif verdicts is not None:
+                    st.info("This problem could not be graded automatically.")
         else:
             st.info("No solutions were submitted or recorded.")
 
     else:
         # MCQ test results
-        total_questions = len(st.session_state.questions)
-        correct_answers = sum(1 for ans in st.session_state.answers if ans.get("is_correct"))
-        percentage = (correct_answers / total_questions) * 100 if total_questions > 0 else 0
+        summary = current_attempt_summary(config['time_limit'])
+        total_questions, correct_answers, percentage = summary["total"], summary["correct"], summary["percentage"]
         st.session_state.score = percentage # Update session score for progress tracking
 
         col1, col2, col3 = st.columns(3)
@@ -1120,16 +4621,14 @@ def show_results():
 
             st.markdown(f'<div class="score-card" style="background-color: {color}"><h3>Grade {grade}</h3><p>Performance</p></div>', unsafe_allow_html=True)
 
+        show_time_analytics(summary["time_report"], config['time_limit'])
+
         # Show detailed MCQ review
         show_detailed_mcq_review(is_practice_mode=False)
 
-    # Save progress data for the dashboard charts
-    if st.session_state.mode == "results":
-        st.session_state.progress_data.append({
-            "date": datetime.now().strftime("%Y-%m-%d"),
-            "test_type": test_name,
-            "score": st.session_state.score
-        })
+    # Save progress data for the dashboard charts, once per attempt
+    if st.session_state.mode == "results" and newly_finished:
+        record_progress(test_name, st.session_state.score)
 
     # Action buttons after test results
     st.markdown("---")
@@ -1142,33 +4641,27 @@ def show_results():
             st.session_state.current_test = current_test_name_for_retake
             st.session_state.test_start_time = datetime.now()
             st.session_state.mode = "test"
+            st.session_state.attempt_seed = new_attempt_seed()
+            rng = random.Random(st.session_state.attempt_seed)
+
+            # Use 'Medium' difficulty for retake by default, could be stored from original run
+            default_retake_difficulty = "Medium"
+            if not use_provisioned_paper(current_test_name_for_retake, default_retake_difficulty):
+                with st.spinner(f"Preparing {current_test_name_for_retake} for retake..."):
+                    if current_test_name_for_retake == "Written English Test":
+                        st.session_state.essay_topic = generate_essay_topic(rng)
+                    elif current_test_name_for_retake == "Coding Test":
+                        st.session_state.coding_problems = generate_coding_problems(rng)
+                    else:
+                        st.session_state.questions = generate_test_questions(
+                            current_test_name_for_retake, default_retake_difficulty, rng,
+                            topic_stats=load_topic_stats(st.session_state.candidate_id, current_test_name_for_retake))
+                        if not st.session_state.questions:
+                            st.error(f"Failed to generate questions for {current_test_name_for_retake}. Please check your API key or try again.")
+                            st.session_state.mode = "dashboard" # Fallback to dashboard
+                            st.rerun()
 
-            with st.spinner(f"Preparing {current_test_name_for_retake} for retake..."):
-                if current_test_name_for_retake == "Written English Test":
-                    st.session_state.essay_topic = generate_essay_topic()
-                elif current_test_name_for_retake == "Coding Test":
-                    st.session_state.coding_problems = generate_coding_problems()
-                else:
-                    config = TEST_CONFIGS[current_test_name_for_retake]
-                    all_questions = []
-                    questions_per_topic = config['question_count'] // len(config['topics'])
-                    remaining_questions = config['question_count'] % len(config['topics'])
-
-                    # Use 'Medium' difficulty for retake by default, could be stored from original run
-                    default_retake_difficulty = "Medium"
-                    for topic in config['topics']:
-                        q_count = questions_per_topic
-                        if remaining_questions > 0:
-                            q_count += 1
-                            remaining_questions -= 1
-                        questions = generate_questions(current_test_name_for_retake, topic, q_count, default_retake_difficulty)
-                        all_questions.extend(questions)
-                    random.shuffle(all_questions)
-                    st.session_state.questions = all_questions[:config['question_count']]
-                    if not st.session_state.questions:
-                        st.error(f"Failed to generate questions for {current_test_name_for_retake}. Please check your API key or try again.")
-                        st.session_state.mode = "dashboard" # Fallback to dashboard
-                        st.rerun()
+            start_attempt()
 
             st.rerun()
 
@@ -1188,6 +4681,9 @@ def show_practice_mode():
     practice_test_types = {k: v for k, v in TEST_CONFIGS.items() if k not in ["Written English Test", "Coding Test"]}
 
     if st.session_state.mode == "practice":
+        show_review_launcher()
+        show_question_search()
+        st.markdown("### 📚 Topic Practice")
         selected_test_type = st.selectbox("Select Test Type:", list(practice_test_types.keys()), key="practice_test_type_select")
 
         if selected_test_type:
@@ -1210,22 +4706,184 @@ def show_practice_mode():
                 st.session_state.current_question = 0
                 st.session_state.score = 0
                 st.session_state.current_test = selected_test_type # Store the test type for context
+                st.session_state.attempt_seed = new_attempt_seed()
 
                 with st.spinner(f"Generating practice questions for {selected_topic} ({selected_difficulty_practice})..."):
-                    st.session_state.questions = generate_questions(selected_test_type, selected_topic, num_questions, selected_difficulty_practice)
+                    st.session_state.questions = with_topic(
+                        generate_questions(selected_test_type, selected_topic, num_questions, selected_difficulty_practice,
+                                           rng=random.Random(st.session_state.attempt_seed)),
+                        selected_topic, selected_difficulty_practice)
                     if not st.session_state.questions:
                         st.error("Could not generate practice questions. Please try a different topic or check your API key.")
                         st.session_state.mode = "practice"
                         return
 
                 st.session_state.mode = "practice_questions"
+                start_attempt()
                 st.rerun()
     elif st.session_state.mode == "practice_questions":
         show_mcq_interface(is_practice_mode=True)
     elif st.session_state.mode == "practice_results_review":
         show_detailed_mcq_review(is_practice_mode=True)
 
+def show_review_launcher():
+    """Offers a spaced-review session of the candidate's due cards, topped up from their weakest topics."""
+    st.markdown("### 🔁 Spaced Review")
+    deck = load_review_deck(st.session_state.candidate_id)
+    if not deck["cards"]:
+        st.caption("Questions you answer incorrectly or skip are scheduled here for review.")
+        return
+
+    now = time.time()
+    due_count = sum(card["due"] <= now for card in deck["cards"].values())
+    weak_topics = weak_review_topics(deck)
+    col1, col2 = st.columns(2)
+    col1.metric("Review Cards", len(deck["cards"]))
+    col2.metric("Due Now", due_count)
+    if weak_topics:
+        st.caption("Weakest topics: " + ", ".join(f"{topic} ({test})" for test, topic in weak_topics))
+    top_up = st.checkbox(f"Fill the session up to {REVIEW_SESSION_SIZE} questions with new ones from my weakest topic",
+                         value=due_count == 0, key="review_top_up_checkbox")
+
+    if st.button("Start Review Session", key="start_review_session_btn", disabled=not due_count and not (top_up and weak_topics)):
+        questions = [card["question"] for card in pop_due_cards(deck, now, REVIEW_SESSION_SIZE)]
+        st.session_state.attempt_seed = new_attempt_seed()
+        if top_up and weak_topics and len(questions) < REVIEW_SESSION_SIZE:
+            test_type, topic = weak_topics[0]
+            with st.spinner(f"Generating new questions for {topic}..."):
+                questions += [{**q, "test": test_type} for q in with_topic(
+                    generate_questions(test_type, topic, REVIEW_SESSION_SIZE - len(questions), "Medium",
+                                       rng=random.Random(st.session_state.attempt_seed)),
+                    topic, "Medium")]
+        if not questions:
+            st.error("Could not generate review questions. Please try again.")
+            return
+        start_practice_session(questions, REVIEW_SESSION_TEST, st.session_state.attempt_seed)
+
+def start_practice_session(questions, test_name, attempt_seed=None):
+    """Starts a practice session over ready-made questions (tagged with their own "test"), without any LLM call."""
+    reset_session_state_for_dashboard()
+    st.session_state.attempt_seed = attempt_seed or new_attempt_seed()
+    st.session_state.questions = questions
+    st.session_state.current_test = test_name
+    st.session_state.mode = "practice_questions"
+    start_attempt()
+    st.rerun()
+
+def show_question_search():
+    """Searches the question bank by concept and offers the matches as a practice set."""
+    st.markdown("### 🔎 Question Bank Search")
+    col1, col2, col3 = st.columns([3, 2, 1])
+    with col1:
+        query = st.text_input("Find questions about:", placeholder="e.g. Dijkstra negative weights", key="question_search_input")
+    with col2:
+        test_filter = st.selectbox("In:", ["All tests"] + [t for t in TEST_CONFIGS if t not in ["Written English Test", "Coding Test"]],
+                                   key="question_search_test_select")
+    with col3:
+        k = st.number_input("Results:", 1, 30, 10, key="question_search_count_input")
+    if not query.strip():
+        return
+
+    started = time.perf_counter()
+    results = search_questions(query, int(k), None if test_filter == "All tests" else test_filter)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if not results:
+        st.info("The question bank is empty so far. Questions are added as they are generated.")
+        return
+    st.caption(f"{len(results)} matches in {elapsed_ms:.1f} ms")
+    st.dataframe(pd.DataFrame([{"Question": item["question"]["question"], "Test": item["test"], "Topic": item["topic"],
+                                "Difficulty": item["difficulty"], "Similarity": round(score, 2)} for score, item in results]),
+                 hide_index=True, use_container_width=True)
+    if st.button(f"Practice these {len(results)} questions", key="practice_search_results_btn"):
+        start_practice_session(search_result_questions(results), test_filter if test_filter in TEST_CONFIGS else QUESTION_SEARCH_TEST)
+
+def show_analytics():
+    """Displays cohort reports computed from every logged answer."""
+    st.markdown("---")
+    st.markdown("## 📊 Cohort Analytics")
+
+    answer_log = get_answer_event_log()
+    answer_log.flush() # Include this worker's most recent answers
+    events = load_answer_events(answer_log.version())
+    if events.empty:
+        st.info("No answers have been logged yet. Complete a test or practice session to see cohort reports.")
+        return
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        cohort = st.selectbox("Cohort:", ["All"] + sorted(events["cohort"].cat.categories), key="analytics_cohort_select")
+    with col2:
+        test_name = st.selectbox("Test:", ["All"] + sorted(events["test"].cat.categories), key="analytics_test_select")
+    with col3:
+        include_practice = st.checkbox("Include practice answers", value=False, key="analytics_practice_checkbox")
+
+    started = time.perf_counter()
+    mask = np.ones(len(events), dtype=bool)
+    if cohort != "All":
+        mask &= (events["cohort"] == cohort).to_numpy()
+    if test_name != "All":
+        mask &= (events["test"] == test_name).to_numpy()
+    if not include_practice:
+        mask &= ~events["practice"].to_numpy()
+    selected = events[mask]
+    if selected.empty:
+        st.info("No answers match these filters.")
+        return
+    topic_stats, item_stats = cohort_report(selected)
+    st.caption(f"{len(selected):,} answers from {selected['attempt_id'].nunique():,} attempts, "
+               f"analysed in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    st.markdown("### Accuracy by Topic")
+    fig = px.bar(topic_stats, x="topic", y="accuracy", color="test", hover_data=["answers", "skip_rate", "median_seconds"],
+                 labels={"accuracy": "Accuracy", "topic": "Topic"})
+    fig.update_yaxes(tickformat=".0%", range=[0, 1])
+    st.plotly_chart(fig, use_container_width=True)
+    st.dataframe(topic_stats, hide_index=True)
+
+    st.markdown("### Item Statistics")
+    st.caption(f"Questions answered at least {ANALYTICS_MIN_ITEM_ANSWERS} times. Difficulty is the share answered "
+               "correctly; discrimination below 0.2 means the question barely separates strong from weak candidates.")
+    item_stats["review"] = item_stats["discrimination"] < 0.2
+    st.dataframe(item_stats, hide_index=True)
+
+def show_leaderboard():
+    """Displays the live leaderboard of a test, for the candidate's cohort or across cohorts."""
+    st.markdown("---")
+    st.markdown("## 🏆 Live Leaderboard")
+    col1, col2 = st.columns(2)
+    with col1:
+        test_name = st.selectbox("Test:", list(TEST_CONFIGS), key="leaderboard_test_select")
+    with col2:
+        cohorts = [st.session_state.cohort] + [c for c in get_leaderboards().cohorts(test_name) if c != st.session_state.cohort]
+        cohort = st.selectbox("Cohort:", cohorts + [LEADERBOARD_ALL_COHORTS], key="leaderboard_cohort_select")
+    show_leaderboard_board(test_name, cohort)
+
+@st.fragment(run_every=LEADERBOARD_REFRESH_SECONDS)
+@governed
+def show_leaderboard_board(test_name, cohort):
+    """The board itself; reruns on its own every refresh interval to pick up new results."""
+    leaderboards = get_leaderboards()
+    snapshot = leaderboards.snapshot(test_name, cohort)
+    if not snapshot["size"]:
+        st.info(f"No {test_name} results in {cohort} yet. Finish the test to open the board.")
+        return
+
+    mine = leaderboards.rank(test_name, cohort, st.session_state.candidate_id)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Your Rank", f"#{mine[0]} of {snapshot['size']}" if mine else "–")
+    with col2:
+        st.metric("Your Best Score", f"{mine[1]:.1f}%" if mine else "–")
+    with col3:
+        st.metric("Ahead of", f"{mine[2]:.0f}% of candidates" if mine else "–")
+
+    board = pd.DataFrame([{"Rank": rank, "Candidate": leaderboard_label(candidate_id), "Best Score": score}
+                          for rank, candidate_id, score in snapshot["top"]])
+    st.dataframe(board, hide_index=True, use_container_width=True)
+    st.caption(f"{snapshot['size']} candidate{'s' if snapshot['size'] != 1 else ''} · updated {max(0, time.time() - snapshot['published_at']):.0f} s ago · "
+               f"refreshes every {LEADERBOARD_REFRESH_SECONDS:.0f} s")
 
 # Run the main application
 if __name__ == "__main__":
-    main()
+    with governed_session():
+        main()
@@ -0,0 +1,269 @@
+"""
+Microbenchmarks for the app's test-assembly and rendering hot paths.
+
+Times sample-question fallback at large bank sizes, the LLM-response JSON extraction shared by
+`generate_questions` and `generate_coding_problems` (on realistic and pathological responses),
+full MCQ test assembly against the stub LLM with injected latency, reading journal payloads from
+the compressed blob store against reading them as raw JSON, and headless reruns of the
+dashboard, an in-progress MCQ test and the results pages with large progress histories and answer
+lists (Streamlit's AppTest, no browser). Everything runs offline in a throwaway data directory.
+
+Medians are compared with the stored baseline (bench_baseline.json); a benchmark regresses when
+its median exceeds the baseline by more than its allowed ratio (and by more than a millisecond,
+so sub-millisecond noise never fails a run). The exit status is 1 if any benchmark regressed.
+
+`--judge-overhead` instead prints the judge's startup overhead per language (compiling an empty
+program, then running it cold and in a warm process), which depends on the installed toolchains
+and is not compared with the baseline.
+
+Usage:
+    python bench.py                            # Compare with the baseline
+    python bench.py --filter render --repeat 3
+    python bench.py --save-baseline            # Record this machine's timings as the new baseline
+    python bench.py --judge-overhead
+"""
+import argparse
+import atexit
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+DEFAULT_MAX_RATIO = 1.5 # Allowed slowdown over the baseline median before a benchmark counts as regressed
+MIN_REGRESSION_MS = 1.0 # Slowdowns smaller than this are noise, whatever the ratio
+
+# --- Benchmarks ---
+# Each benchmark is a setup function taking the imported app module and returning a zero-argument
+# callable to time. Setup (building inputs, starting an AppTest) is not timed.
+
+BENCHMARKS = {}
+
+def benchmark(name, repeat=20, max_ratio=DEFAULT_MAX_RATIO):
+    """Registers a setup function under `name`, timed `repeat` times by default."""
+    def register(setup):
+        BENCHMARKS[name] = {"setup": setup, "repeat": repeat, "max_ratio": max_ratio}
+        return setup
+    return register
+
+for bank_size in (100, 1000, 10000):
+    @benchmark(f"sample_questions/{bank_size}", repeat=10)
+    def bench_sample_questions(app, bank_size=bank_size):
+        rng = random.Random(0)
+        return lambda: [app.create_sample_questions(test_name, "", bank_size, "Any", rng)
+                        for test_name in ("English Usage Test", "Quantitative Ability Test", "Domain Test (DSA)")]
+
+def stub_response(app, test_name, count):
+    """The stub LLM's answer to the app's own question prompt, shaped like real model output."""
+    prompt = app.question_prompt(test_name, include_examples=True)
+    return app.stub_completion(prompt.format(count=count, topic=app.TEST_CONFIGS[test_name]["topics"][0], difficulty="Medium"))
+
+def llm_responses(app):
+    """Response name -> (response text, first key of its objects): realistic shapes first, then pathological ones."""
+    items = json.loads(stub_response(app, "Quantitative Ability Test", 10))
+    array = json.dumps(items, indent=2) # Models pretty-print their JSON
+    objects = "\n".join(json.dumps(item, indent=2) for item in items)
+    large = json.dumps(items * 20, indent=2)
+    unclosed = "[{" * 2000 # Many array starts and no closing brackets: every start scans to the end
+    fragments = '{"question": "' * 400 # Object starts whose strings never close, for the fallback object search
+    coding = app.stub_completion("Generate 2 distinct coding problems ... 'title' ...")
+    return {
+        "array": (array, "question"),
+        "fenced_prose": (f"Sure! Here are the questions you asked for.\n```json\n{array}\n```\nLet me know if you need more.", "question"),
+        "concatenated_objects": (objects, "question"),
+        "large_array": (large, "question"),
+        "coding_problems": (coding, "title"),
+        "unclosed_arrays": (unclosed, "question"),
+        "unterminated_objects": (fragments, "question"),
+    }
+
+for response_name in ("array", "fenced_prose", "concatenated_objects", "large_array", "coding_problems",
+                      "unclosed_arrays", "unterminated_objects"):
+    @benchmark(f"extract_json/{response_name}", repeat=10 if response_name.startswith("un") else 50)
+    def bench_extract_json(app, response_name=response_name):
+        response, first_key = llm_responses(app)[response_name]
+
+        def extract():
+            try:
+                return app.extract_llm_json(response, first_key)
+            except ValueError: # Includes json.JSONDecodeError; the app falls back to sample content here
+                return None
+        return extract
+
+for test_name in ("Quantitative Ability Test", "Domain Test (DSA)"):
+    @benchmark(f"assemble_test/{test_name}", repeat=5)
+    def bench_assemble_test(app, test_name=test_name):
+        seeds = iter(range(10 ** 6))
+        # coalesce=False, as bulk provisioning does: every run pays for its own (stubbed) LLM calls
+        return lambda: app.generate_test_questions(test_name, "Medium", random.Random(next(seeds)), coalesce=False)
+
+def bank_payloads(app):
+    """Distinct sample questions of every MCQ test, as journals store them."""
+    return [q for test_name in ("English Usage Test", "Analytical Reasoning Test", "Quantitative Ability Test", "Domain Test (DSA)")
+            for q in app.create_sample_questions(test_name, "", 100, "Any", random.Random(0))]
+
+@benchmark("blob_read/compressed", repeat=20)
+def bench_blob_read(app):
+    store = app.get_blob_store()
+    refs = [store.put(q) for q in bank_payloads(app)]
+    return lambda: [store.get(ref) for ref in refs]
+
+@benchmark("blob_read/raw_json", repeat=20)
+def bench_raw_json_read(app):
+    # The same payloads stored verbatim as JSON values, the cost decompress-on-access is compared against
+    backend = app.get_state_backend()
+    keys = [f"bench:{i}" for i in range(len(bank_payloads(app)))]
+    for key, q in zip(keys, bank_payloads(app)):
+        backend.put("bench_raw", key, q)
+    return lambda: [backend.get("bench_raw", key) for key in keys]
+
+def progress_history(app, entries):
+    """`entries` dashboard progress records spread over the tests and the past year."""
+    rng = random.Random(0)
+    start = datetime.now() - timedelta(days=365)
+    return [{"date": (start + timedelta(days=rng.randrange(365))).strftime("%Y-%m-%d"),
+             "test_type": rng.choice(list(app.TEST_CONFIGS)), "score": round(rng.uniform(0, 100), 1)}
+            for _ in range(entries)]
+
+def answered_questions(app, test_name, count, answered):
+    """`count` questions of `test_name` with the first `answered` of them answered (every fifth skipped)."""
+    rng = random.Random(0)
+    questions = app.create_sample_questions(test_name, "", count, "Any", rng)
+    answers = []
+    for i, question in enumerate(questions[:answered]):
+        letter = None if i % 5 == 4 else rng.choice("ABCD")
+        answers.append(app.make_answer_record(i, letter, letter == question["correct_answer"], rng.uniform(5, 90)))
+    return questions, answers
+
+def app_test(app, **session_state):
+    """An AppTest of app.py that has run once, with `session_state` set for the next (timed) rerun."""
+    from streamlit.testing.v1 import AppTest # Imported lazily, like the app itself
+    at = AppTest.from_file(APP_PATH, default_timeout=300)
+    at.run()
+    for key, value in session_state.items():
+        at.session_state[key] = value
+    at.run() # Untimed first render in the new mode, so timed runs are steady-state reruns
+
+    def rerun():
+        at.run()
+        if at.exception:
+            raise RuntimeError(f"App raised during the benchmark: {at.exception}")
+    return rerun
+
+@benchmark("render/dashboard_5000_results", repeat=5)
+def bench_render_dashboard(app):
+    return app_test(app, mode="dashboard", progress_data=progress_history(app, 5000))
+
+@benchmark("render/mcq_question_30_of_30", repeat=5)
+def bench_render_mcq(app):
+    questions, answers = answered_questions(app, "Quantitative Ability Test", 30, 29)
+    return app_test(app, mode="test", current_test="Quantitative Ability Test", questions=questions, answers=answers,
+                    current_question=29, test_start_time=datetime.now(), progress_data=progress_history(app, 500))
+
+@benchmark("render/results_30_answers", repeat=5)
+def bench_render_results(app):
+    questions, answers = answered_questions(app, "Quantitative Ability Test", 30, 30)
+    return app_test(app, mode="results", current_test="Quantitative Ability Test", questions=questions, answers=answers,
+                    current_question=30, progress_data=progress_history(app, 500))
+
+@benchmark("render/practice_review_300_answers", repeat=3)
+def bench_render_practice_review(app):
+    questions, answers = answered_questions(app, "Domain Test (DSA)", 300, 300)
+    return app_test(app, mode="practice_results_review", current_test="Domain Test (DSA)", questions=questions,
+                    answers=answers, current_question=300, progress_data=progress_history(app, 500))
+
+# --- Runner ---
+
+def time_benchmark(name, app, repeat):
+    """Runs one benchmark; returns its timings in milliseconds."""
+    run = BENCHMARKS[name]["setup"](app)
+    run() # Warm-up: first-call caches and lazy imports are not billed
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+def compare(name, median_ms, baseline):
+    """(baseline median, ratio, status) of a result against the stored baseline."""
+    entry = baseline.get("benchmarks", {}).get(name)
+    if entry is None:
+        return None, None, "new"
+    ratio = median_ms / entry["median_ms"] if entry["median_ms"] else float("inf")
+    regressed = ratio > entry.get("max_ratio", DEFAULT_MAX_RATIO) and median_ms - entry["median_ms"] > MIN_REGRESSION_MS
+    return entry["median_ms"], round(ratio, 2), "REGRESSED" if regressed else "ok"
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark test assembly and page rendering against a stored baseline.")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=None, help="Timed runs per benchmark (default: each benchmark's own)")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds the stub LLM waits per response")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file to compare with or save to")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run's medians as the baseline")
+    parser.add_argument("--judge-overhead", action="store_true", help="Print the judge's startup overhead per language and exit")
+    args = parser.parse_args()
+
+    # Offline and isolated: the stub LLM and a throwaway data directory, set before the app is imported
+    os.environ.pop("GROQ_API_KEY", None)
+    os.environ["LLM_PROVIDER"] = "stub"
+    os.environ["STUB_LLM_LATENCY"] = str(args.llm_latency)
+    os.environ["STUB_LLM_FAILURE_RATE"] = "0"
+    os.environ["STATE_BACKEND"] = "sqlite"
+    os.environ.pop("STATE_BACKEND_URL", None)
+    os.environ["PREP_AI_DATA_DIR"] = tempfile.mkdtemp(prefix="prep_ai_bench_")
+    atexit.register(shutil.rmtree, os.environ["PREP_AI_DATA_DIR"], ignore_errors=True)
+    import app # Imported lazily: importing app prints Streamlit bare-mode warnings
+
+    if args.judge_overhead:
+        runner = app.JudgeRunner(app.JUDGE_BUILD_DIR, app.JUDGE_WARM_POOL_SIZE)
+        print(f"Sandbox: {runner.sandbox}")
+        print(runner.measure_overhead().to_string(index=False))
+        return
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    rows = []
+    for name, config in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        timings = time_benchmark(name, app, args.repeat or config["repeat"])
+        median_ms = statistics.median(timings)
+        baseline_ms, ratio, status = compare(name, median_ms, baseline)
+        rows.append({"benchmark": name, "runs": len(timings), "median_ms": round(median_ms, 3),
+                     "min_ms": round(min(timings), 3), "baseline_ms": baseline_ms, "ratio": ratio, "status": status})
+        print(f"{name}: {median_ms:.3f} ms ({status})", file=sys.stderr)
+
+    print(pd.DataFrame(rows).to_string(index=False))
+    if args.save_baseline:
+        saved = baseline.get("benchmarks", {})
+        saved.update({row["benchmark"]: {"median_ms": row["median_ms"], "max_ratio": BENCHMARKS[row["benchmark"]]["max_ratio"]}
+                      for row in rows})
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"machine": {"python": platform.python_version(), "platform": platform.platform(),
+                                   "cpus": os.cpu_count(), "llm_latency": args.llm_latency,
+                                   "recorded": datetime.now().strftime("%Y-%m-%d")},
+                       "benchmarks": dict(sorted(saved.items()))}, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+    regressed = [row["benchmark"] for row in rows if row["status"] == "REGRESSED"]
+    if regressed:
+        print(f"\n{len(regressed)} benchmark(s) regressed beyond their allowed ratio: {', '.join(regressed)}")
+        sys.exit(1)
+    print(f"\nNo regressions against {args.baseline}" if baseline else "\nNo baseline yet; run with --save-baseline to record one.")
+
+if __name__ == "__main__":
+    main()
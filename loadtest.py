@@ -0,0 +1,346 @@
+"""
+Load-testing harness for the CSE Employability Test Prep app.
+
+Starts `app.py` under `streamlit run` with the Groq client pointed at a local mock LLM server,
+then drives many simulated candidates against it over Streamlit's websocket protocol, exactly
+as browsers would. Each candidate opens the dashboard, starts a test from TEST_CONFIGS, answers
+it (MCQs, essay or code) and views the results. Concurrency is ramped through `--levels` to
+find the point where the instance saturates.
+
+With `--workers N`, N app processes share one state backend (SQLite in WAL mode). Candidates
+are spread across them and switch to another worker halfway through their test, as they would
+behind a load balancer without sticky sessions; afterwards every candidate's attempt journal and
+progress history are checked in the shared backend.
+
+Usage:
+    python loadtest.py --levels 5,10,25,50 --llm-latency 0.5 --llm-failure-rate 0.02
+    python loadtest.py --workers 3 --levels 10,30
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+import websockets
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+ESSAY_TEXT = " ".join(["Technology keeps reshaping how engineers learn, build and collaborate."] * 15)
+CODE_TEXT = "def solve(nums):\n    return sorted(nums)\n"
+FINISHED_EARLY_FOR_RERUN = 2 # ForwardMsg.script_finished status sent when st.rerun() interrupts a run
+MCQ_ANSWERS_BEFORE_SWITCH = 3 # With several workers, MCQ candidates move to another worker after this many answers
+
+# --- Mock LLM Server ---
+
+def mock_completion(prompt):
+    """Response text for a prompt, shaped like the real model output (see app.stub_completion)."""
+    from app import stub_completion # Imported lazily: importing app prints Streamlit bare-mode warnings
+    return stub_completion(prompt)
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """Answers Groq's OpenAI-compatible chat completions endpoint with configurable latency and failures."""
+    latency = 0.0
+    failure_rate = 0.0
+    requests_served = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with MockLLMHandler.lock:
+            MockLLMHandler.requests_served += 1
+        if self.latency:
+            time.sleep(random.uniform(0.5, 1.5) * self.latency) # Jitter around the configured mean
+        if random.random() < self.failure_rate:
+            self._send(500, {"error": {"message": "Injected mock failure", "type": "server_error"}})
+            return
+        prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+        content = mock_completion(prompt)
+        self._send(200, {
+            "id": f"mock-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                      "total_tokens": (len(prompt) + len(content)) // 4},
+        })
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass # Keep the report readable
+
+def start_mock_llm_server(latency, failure_rate):
+    """Starts the mock server on a free local port and returns (server, base_url)."""
+    MockLLMHandler.latency = latency
+    MockLLMHandler.failure_rate = failure_rate
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockLLMHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+# --- App Server ---
+
+def start_app_server(port, env):
+    """Runs app.py under `streamlit run` and waits until it reports healthy."""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP_PATH, "--server.headless", "true", "--server.port", str(port),
+         "--server.enableXsrfProtection", "false", "--browser.gatherUsageStats", "false"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.3)
+    process.terminate()
+    raise RuntimeError("Streamlit server did not start within 60 seconds.")
+
+def process_rss_bytes(pid):
+    """Resident memory of a process (Linux), or 0 where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+# --- Simulated Candidates ---
+
+class CandidateSession:
+    """One browser session: sends reruns with widget states and collects the rendered widgets."""
+    def __init__(self, url, samples, query_string=""):
+        self.url = url
+        self.samples = samples
+        self.query_string = query_string # Page URL query, updated when the app sets st.query_params
+        self.widgets = {} # user key -> widget proto from the latest completed run
+        self.conn = None
+
+    async def connect(self):
+        self.conn = await websockets.connect(self.url, max_size=64 * 2 ** 20)
+
+    async def rerun(self, action, states=()):
+        """Sends one rerun and waits for the script to finish. Returns False on errors."""
+        message = BackMsg()
+        message.rerun_script.query_string = self.query_string
+        message.rerun_script.widget_states.widgets.extend(states)
+        started = time.perf_counter()
+        widgets, errors = {}, []
+        await self.conn.send(message.SerializeToString())
+        while True:
+            try:
+                raw = await self.conn.recv()
+            except websockets.ConnectionClosed:
+                errors.append("connection closed")
+                break
+            forward = ForwardMsg()
+            forward.ParseFromString(raw)
+            kind = forward.WhichOneof("type")
+            if kind == "page_info_changed":
+                self.query_string = forward.page_info_changed.query_string
+            elif kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                proto = getattr(element, element.WhichOneof("type"))
+                if element.WhichOneof("type") == "exception":
+                    errors.append(proto.message)
+                elif getattr(proto, "id", ""):
+                    widgets[proto.id.split("-", 2)[-1]] = proto # Widget ids end with the user-supplied key
+            elif kind == "script_finished":
+                if forward.script_finished != FINISHED_EARLY_FOR_RERUN:
+                    break
+                widgets, errors = {}, [] # st.rerun(): only the final run's elements count
+        self.samples.append((action, time.perf_counter() - started, not errors))
+        self.widgets = widgets
+        return not errors
+
+    async def click(self, action, key, states=()):
+        if key not in self.widgets:
+            self.samples.append((action, 0.0, False))
+            return False
+        return await self.rerun(action, [*states, WidgetState(id=self.widgets[key].id, trigger_value=True)])
+
+    def keys_starting_with(self, prefix):
+        return [key for key in self.widgets if key.startswith(prefix)]
+
+    async def close(self):
+        if self.conn is not None:
+            await self.conn.close()
+
+async def switch_worker(session, url):
+    """Reconnects the candidate to the worker at `url` with the same page URL, as after a failover."""
+    await session.close()
+    moved = CandidateSession(url, session.samples, session.query_string)
+    await moved.connect()
+    await moved.rerun("switch_worker")
+    return moved
+
+async def run_candidate(urls, test_name, samples, at_results, candidate_id):
+    """
+    Drives one candidate through dashboard -> test -> results -> dashboard on `urls[0]`,
+    moving to `urls[1]` halfway through the test when it names a different worker.
+    """
+    session = CandidateSession(urls[0], samples, urllib.parse.urlencode({"candidate": candidate_id}))
+    try:
+        await session.connect()
+        if not await session.rerun("dashboard") or not await session.click("start_test", f"start_{test_name}"):
+            return
+        hop_url = urls[1] if urls[1] != urls[0] else None
+
+        if hop_url and test_name in ("Written English Test", "Coding Test"):
+            session = await switch_worker(session, hop_url)
+
+        if test_name == "Written English Test":
+            essay = WidgetState(id=session.widgets["essay_input"].id, string_value=ESSAY_TEXT)
+            await session.click("submit_essay", "submit_essay_btn", [essay])
+        elif test_name == "Coding Test":
+            code = [WidgetState(id=session.widgets[key].id, string_value=CODE_TEXT) for key in session.keys_starting_with("code_")]
+            await session.click("submit_code", "submit_all_code_btn", code)
+        else:
+            answered = 0
+            while session.keys_starting_with("submit_mcq_"):
+                radio = session.widgets[session.keys_starting_with("mcq_q_")[0]]
+                choice = WidgetState(id=radio.id, string_value=random.choice(radio.options))
+                if not await session.click("answer_mcq", session.keys_starting_with("submit_mcq_")[0], [choice]):
+                    break
+                answered += 1
+                if hop_url and answered == MCQ_ANSWERS_BEFORE_SWITCH:
+                    session = await switch_worker(session, hop_url)
+                    hop_url = None
+
+        await session.rerun("view_results")
+        await at_results() # Hold the session open until every candidate has reached its results
+        await session.click("dashboard", "back_to_dashboard_btn")
+    except Exception:
+        samples.append(("error", 0.0, False))
+    finally:
+        await session.close()
+
+def check_shared_state(backend, candidates):
+    """Counts candidates whose completed test is not recorded exactly once in the shared progress history."""
+    missing = 0
+    for candidate_id in candidates:
+        progress = backend.read(f"progress:{candidate_id}")
+        if len(progress) != 1:
+            missing += 1
+    return missing
+
+async def run_level(urls, server_pids, concurrency, tests, backend=None):
+    """Runs `concurrency` candidates at once and summarizes throughput, latency and memory."""
+    samples = []
+    candidates = [uuid.uuid4().hex for _ in range(concurrency)]
+
+    def total_rss():
+        return sum(process_rss_bytes(pid) for pid in server_pids)
+
+    rss_before = total_rss()
+    rss_peak = [rss_before]
+    arrived = [0]
+    all_arrived = asyncio.Event()
+
+    async def at_results():
+        arrived[0] += 1
+        rss_peak[0] = max(rss_peak[0], total_rss())
+        if arrived[0] == concurrency:
+            all_arrived.set()
+        await all_arrived.wait()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_candidate([urls[i % len(urls)], urls[(i + 1) % len(urls)]], tests[i % len(tests)],
+                                         samples, at_results, candidates[i]) for i in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    df = pd.DataFrame(samples, columns=["action", "seconds", "ok"])
+    latencies = df.groupby("action")["seconds"].quantile([0.5, 0.95, 0.99]).unstack()
+    latencies.columns = ["p50", "p95", "p99"]
+    latencies["count"] = df.groupby("action").size()
+    return {
+        "concurrency": concurrency,
+        "wall_seconds": wall,
+        "throughput": len(df) / wall, # Actions per second across all candidates
+        "error_rate": 1 - df["ok"].mean() if len(df) else 0.0,
+        "p95_max": latencies["p95"].max() if len(latencies) else 0.0,
+        "rss_mb_per_session": max(0, rss_peak[0] - rss_before) / concurrency / 2 ** 20,
+        "lost_state": check_shared_state(backend, candidates) if backend else 0,
+    }, latencies
+
+def find_saturation(summaries, slo_seconds):
+    """First level where throughput gains under 10% or any action's p95 exceeds the SLO."""
+    for previous, current in zip([None] + summaries, summaries):
+        if current["p95_max"] > slo_seconds:
+            return current["concurrency"]
+        if previous and current["throughput"] < previous["throughput"] * 1.1:
+            return current["concurrency"]
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test app.py with simulated concurrent candidates.")
+    parser.add_argument("--levels", default="5,10,25,50", help="Comma-separated concurrency levels to ramp through")
+    parser.add_argument("--tests", default="all", help="Comma-separated TEST_CONFIGS names, or 'all'")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Mean mock LLM latency in seconds")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0, help="Fraction of mock LLM calls that fail")
+    parser.add_argument("--slo", type=float, default=5.0, help="p95 seconds per action considered saturated")
+    parser.add_argument("--port", type=int, default=8599, help="Port for the first app worker; others use the next ports")
+    parser.add_argument("--workers", type=int, default=1, help="Number of app processes sharing one state backend")
+    parser.add_argument("--respect-rate-limit", action="store_true", help="Keep the app's Groq rate limits instead of lifting them")
+    args = parser.parse_args()
+
+    # Every worker (and this harness, which reads the results back) shares a fresh SQLite state backend
+    data_dir = tempfile.mkdtemp(prefix="prep_ai_loadtest_")
+    os.environ.update(PREP_AI_DATA_DIR=data_dir, STATE_BACKEND="sqlite", STATE_BACKEND_URL="")
+    mock_server, base_url = start_mock_llm_server(args.llm_latency, args.llm_failure_rate)
+    # Point the app's Groq client at the mock server
+    env = dict(os.environ, GROQ_API_KEY="loadtest", GROQ_API_BASE=base_url, LLM_PROVIDER="groq")
+    if not args.respect_rate_limit:
+        env.update(LLM_REQUESTS_PER_MINUTE="1000000", LLM_TOKENS_PER_MINUTE="1000000000")
+    ports = [args.port + i for i in range(args.workers)]
+    app_servers = []
+
+    try:
+        for port in ports:
+            app_servers.append(start_app_server(port, env))
+
+        from app import TEST_CONFIGS, SQLiteStateBackend
+        tests = list(TEST_CONFIGS) if args.tests == "all" else [t.strip() for t in args.tests.split(",")]
+        urls = [f"ws://127.0.0.1:{port}/_stcore/stream" for port in ports]
+        pids = [server.pid for server in app_servers]
+        backend = SQLiteStateBackend(os.path.join(data_dir, "state.db"))
+
+        asyncio.run(run_level(urls, pids, len(urls), tests)) # Warm-up so import and cache costs aren't billed to the first level
+        summaries = []
+        for level in [int(x) for x in args.levels.split(",")]:
+            summary, latencies = asyncio.run(run_level(urls, pids, level, tests, backend))
+            summaries.append(summary)
+            print(f"\n=== {level} concurrent candidates ({summary['wall_seconds']:.1f}s) ===")
+            print(latencies.round(3).to_string())
+
+        print("\n=== Summary ===")
+        print(pd.DataFrame(summaries).round(3).to_string(index=False))
+        print(f"Mock LLM requests served: {MockLLMHandler.requests_served}")
+        print(f"Shared rate-limit buckets: {backend.get('rate_limits', 'llm')}")
+        saturation = find_saturation(summaries, args.slo)
+        print(f"Saturation point: {saturation} concurrent candidates" if saturation else "No saturation within the tested levels")
+    finally:
+        for server in app_servers:
+            server.terminate()
+        mock_server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Throughput benchmark for the app's CPU-only local model backend (LLM_PROVIDER=local).
+
+Loads the model once with `app.LocalModelServer`, exactly as the app does, then sends the app's own
+question-generation prompts for a test's topics concurrently at each batch size in `--batch-sizes`.
+Responses are decoded under the JSON constraint and parsed like the app parses them. For every batch
+size it reports valid questions per second, and per core (the torch threads the model runs on).
+
+Needs torch and transformers (see requirements.txt); the model is downloaded from Hugging Face on
+first use unless LOCAL_LLM_MODEL points at a local directory.
+
+Usage:
+    python localbench.py --batch-sizes 1,2,4,8 --prompts 8 --count 3
+    python localbench.py --model Qwen/Qwen2.5-1.5B-Instruct --quantize none --threads 4
+"""
+import argparse
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import app
+
+def parse_questions(response):
+    """Valid MCQs in a response, found the way `generate_questions` looks for the JSON array."""
+    match = re.search(r'\[\s*\{.*\}\s*\]', response, re.DOTALL)
+    if not match:
+        return []
+    try:
+        questions = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return []
+    return [q for q in questions if app.is_valid_mcq(q)]
+
+def question_prompts(test_name, prompts, count, difficulty):
+    """`prompts` question-generation prompts cycling through the test's topics, as test assembly sends them."""
+    topics = app.TEST_CONFIGS[test_name]["topics"]
+    template = app.question_prompt(test_name, include_examples=False)
+    return [template.format(count=count, topic=topics[i % len(topics)], difficulty=difficulty) for i in range(prompts)]
+
+def run_batch_size(server, batch_size, prompts, max_tokens):
+    """Sends every prompt at once with the server batching up to `batch_size`; returns one summary row."""
+    server.batch_size = batch_size
+    server.stats.update(requests=0, batches=0, generated_tokens=0, generate_seconds=0.0)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(prompts)) as pool:
+        responses = list(pool.map(lambda prompt: server.complete(prompt, max_tokens, json_output=True), prompts))
+    seconds = time.perf_counter() - started
+    questions = sum(len(parse_questions(response)) for response in responses)
+    return {
+        "batch_size": batch_size,
+        "batches": server.stats["batches"],
+        "seconds": round(seconds, 1),
+        "valid_json": sum(bool(parse_questions(response)) for response in responses) / len(responses),
+        "questions": questions,
+        "tokens_per_second": round(server.stats["generated_tokens"] / seconds, 1),
+        "questions_per_second": round(questions / seconds, 3),
+        "questions_per_second_per_core": round(questions / seconds / server.threads, 4),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local model question generation on CPU.")
+    parser.add_argument("--model", default=app.LOCAL_LLM_MODEL, help="Hugging Face model ID or local path")
+    parser.add_argument("--quantize", default=app.LOCAL_LLM_QUANTIZE, choices=["int8", "none"], help="Weight quantization")
+    parser.add_argument("--threads", type=int, default=app.LOCAL_LLM_THREADS, help="torch threads (cores) to run on")
+    parser.add_argument("--batch-sizes", default="1,2,4,8", help="Comma-separated batch sizes to compare")
+    parser.add_argument("--prompts", type=int, default=8, help="Prompts sent per batch size")
+    parser.add_argument("--count", type=int, default=3, help="Questions requested per prompt")
+    parser.add_argument("--test", default="Domain Test (DSA)", help="TEST_CONFIGS name whose prompts are used")
+    parser.add_argument("--difficulty", default="Medium")
+    args = parser.parse_args()
+
+    server = app.LocalModelServer(args.model, quantize=args.quantize, threads=args.threads)
+    print(f"Loaded {args.model} ({args.quantize}) in {server.load_seconds:.1f}s on {args.threads} thread(s)")
+    prompts = question_prompts(args.test, args.prompts, args.count, args.difficulty)
+    max_tokens = app.question_output_budget(args.test, args.count)
+
+    run_batch_size(server, 1, prompts[:1], max_tokens) # Warm-up, so one-off allocation costs are not billed
+    rows = [run_batch_size(server, int(size), prompts, max_tokens) for size in args.batch_sizes.split(",")]
+    print(pd.DataFrame(rows).to_string(index=False))
+    best = max(rows, key=lambda row: row["questions_per_second_per_core"])
+    print(f"\nBest: batch size {best['batch_size']} at {best['questions_per_second_per_core']} questions/s per core")
+
+if __name__ == "__main__":
+    main()
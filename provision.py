@@ -0,0 +1,170 @@
+"""
+Bulk test-paper provisioning for the CSE Employability Test Prep app.
+
+Pre-generates N distinct papers per TEST_CONFIGS entry with the app's own generation functions
+(`generate_test_questions`, `generate_essay_topic`, `generate_coding_problems`), several at a time,
+and writes them to PAPERS_DIR with `app.write_paper_set`. Every paper is validated, papers that
+repeat an earlier one or fall back to the built-in sample content are rejected and regenerated.
+When a candidate starts a test, the app hands out the next unused paper instantly instead of
+calling the LLM.
+The exit status is 1 if any set ends up with fewer than the requested number of papers.
+
+The LLM provider, rate limits and data directory come from the same environment variables as
+the app (GROQ_API_KEY, LLM_PROVIDER, PREP_AI_DATA_DIR, ...).
+
+Usage:
+    python provision.py --papers 60 --difficulties Easy,Medium,Hard --parallel 8
+    python provision.py --papers 30 --tests "Coding Test,Written English Test"
+
+Python API:
+    from provision import provision_papers
+    papers, stats = provision_papers("Quantitative Ability Test", "Medium", 40, parallel=8)
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import pandas as pd
+
+import app
+
+# --- Paper Generation ---
+
+def generate_paper(test_name, difficulty, seed):
+    """
+    One paper for `test_name`, reproducible from `seed`, as a dict with its "seed" and "items". The seed
+    is also the prompts' paper variant, so papers differ even where the LLM answers a repeated prompt
+    the same way (the stub provider, fixture replay, low temperatures).
+    """
+    rng = random.Random(seed)
+    if test_name == "Written English Test":
+        items = [app.generate_essay_topic(rng, variant=seed)]
+    elif test_name == "Coding Test":
+        items = app.generate_coding_problems(rng, variant=seed)
+    else:
+        # Every paper makes its own LLM calls; coalescing would hand concurrent papers the same questions
+        items = app.generate_test_questions(test_name, difficulty, rng, coalesce=False, variant=seed)
+    return {"seed": seed, "items": items}
+
+def item_fingerprint(item):
+    """Normalized text identifying a question, coding problem or essay topic."""
+    if isinstance(item, dict):
+        item = item.get("question") or item.get("title") or ""
+    return " ".join(str(item).lower().split())
+
+def sample_fingerprints(test_name):
+    """Fingerprints of the built-in fallback content, which provisioned papers must not contain."""
+    if test_name == "Written English Test":
+        items = app.SAMPLE_ESSAY_TOPICS
+    elif test_name == "Coding Test":
+        items = app.SAMPLE_CODING_PROBLEMS
+    else:
+        items = app.create_sample_questions(test_name, "", 100, "Any")
+    return {item_fingerprint(item) for item in items}
+
+def validate_paper(test_name, paper):
+    """Returns why a paper is unusable ("invalid", "duplicate item"), or None if it is fine."""
+    items = paper["items"]
+    if test_name == "Written English Test":
+        valid = len(items) == 1 and isinstance(items[0], str) and items[0].strip()
+    elif test_name == "Coding Test":
+        # Generated problems carry a "problem_id" once their judge fixtures are built, so they can be graded
+        valid = len(items) == 2 and all(app.is_valid_coding_problem(p) and "problem_id" in p for p in items)
+    else:
+        valid = len(items) == app.TEST_CONFIGS[test_name]["question_count"] and all(app.is_valid_mcq(q) for q in items)
+    if not valid:
+        return "invalid"
+    if len({item_fingerprint(item) for item in items}) < len(items):
+        return "duplicate item"
+    return None
+
+def provision_papers(test_name, difficulty, count, parallel=4, seed=None, allow_samples=False, max_attempts=None):
+    """
+    Generates up to `count` distinct, valid papers, `parallel` at a time. Gives up after
+    `max_attempts` generations (default 3 per paper). Returns (papers, stats), where stats
+    counts generated, rejected and failed papers.
+    """
+    seeds = random.Random(seed)
+    max_attempts = max_attempts or count * 3
+    samples = set() if allow_samples else sample_fingerprints(test_name)
+    papers, seen = [], set()
+    stats = {"generated": 0, "invalid": 0, "duplicate item": 0, "duplicate paper": 0, "sample content": 0, "failed": 0}
+
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        pending = set()
+        while len(papers) < count and (pending or stats["generated"] < max_attempts):
+            # Keep `parallel` generations in flight, but never more than the papers still needed
+            while stats["generated"] < max_attempts and len(pending) < parallel and len(papers) + len(pending) < count:
+                pending.add(pool.submit(generate_paper, test_name, difficulty, seeds.randrange(2 ** 32)))
+                stats["generated"] += 1
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    paper = future.result()
+                except Exception:
+                    stats["failed"] += 1
+                    continue
+                fingerprints = [item_fingerprint(item) for item in paper["items"]]
+                reason = validate_paper(test_name, paper)
+                if reason is None and samples.intersection(fingerprints):
+                    reason = "sample content"
+                if reason is None and frozenset(fingerprints) in seen:
+                    reason = "duplicate paper"
+                if reason is not None:
+                    stats[reason] += 1
+                elif len(papers) < count:
+                    seen.add(frozenset(fingerprints))
+                    papers.append(paper)
+    return papers, stats
+
+def provision_cohort(tests, difficulties, count, parallel=4, seed=None, allow_samples=False):
+    """Provisions and writes a paper set per test and difficulty. Returns one summary row per set written."""
+    summaries, written = [], set()
+    for test_name in tests:
+        for difficulty in difficulties:
+            if (test_name, app.paper_set_difficulty(test_name, difficulty)) in written:
+                continue # Essay and coding sets do not depend on difficulty
+            written.add((test_name, app.paper_set_difficulty(test_name, difficulty)))
+            started = time.perf_counter()
+            papers, stats = provision_papers(test_name, difficulty, count, parallel, seed, allow_samples)
+            path = app.write_paper_set(test_name, difficulty, papers) if papers else None
+            summaries.append({
+                "test": test_name,
+                "difficulty": app.paper_set_difficulty(test_name, difficulty),
+                "papers": len(papers),
+                **stats,
+                "kb": round(os.path.getsize(path) / 1024, 1) if papers else 0.0,
+                "seconds": round(time.perf_counter() - started, 1),
+            })
+    return summaries
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate test papers for a cohort.")
+    parser.add_argument("--papers", type=int, required=True, help="Distinct papers to generate per test and difficulty")
+    parser.add_argument("--tests", default="all", help="Comma-separated TEST_CONFIGS names, or 'all'")
+    parser.add_argument("--difficulties", default="Medium", help="Comma-separated difficulties for the MCQ tests")
+    parser.add_argument("--parallel", type=int, default=4, help="Papers generated at the same time")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the per-paper seeds, to make a run reproducible")
+    parser.add_argument("--allow-samples", action="store_true", help="Accept papers that fall back to built-in sample content")
+    args = parser.parse_args()
+
+    if not app.llm_available() and not args.allow_samples:
+        parser.error("No LLM is configured (set GROQ_API_KEY or LLM_PROVIDER); only sample content could be generated.")
+    tests = list(app.TEST_CONFIGS) if args.tests == "all" else [t.strip() for t in args.tests.split(",")]
+    difficulties = [d.strip() for d in args.difficulties.split(",")]
+
+    summaries = provision_cohort(tests, difficulties, args.papers, args.parallel, args.seed, args.allow_samples)
+    print(pd.DataFrame(summaries).to_string(index=False))
+    print(f"Paper sets written to {app.PAPERS_DIR}")
+    short = [s for s in summaries if s["papers"] < args.papers]
+    if short:
+        sets = ", ".join(f"{s['test']} ({s['difficulty']}): {s['papers']}" for s in short)
+        print(f"\nERROR: {len(short)} set(s) have fewer than {args.papers} papers ({sets}). The LLM kept returning "
+              f"invalid, repeated or sample content (see the counts above).", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+Shared test setup: the app is imported offline (stub LLM provider), on in-memory shared state and
+with a throwaway data directory. Streamlit runs in bare mode, where session state is a plain store.
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+os.environ["GROQ_API_KEY"] = "" # Set, so load_dotenv() does not pick up a real key from .env
+os.environ["LLM_PROVIDER"] = "stub"
+os.environ["STATE_BACKEND"] = "memory"
+os.environ["PREP_AI_DATA_DIR"] = tempfile.mkdtemp(prefix="prep_ai_tests_")
+atexit.register(shutil.rmtree, os.environ["PREP_AI_DATA_DIR"], ignore_errors=True)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module # noqa: E402 (needs the environment above)
+
+@pytest.fixture
+def app():
+    return app_module
+
+@pytest.fixture
+def backend(app):
+    """A fresh in-memory state backend."""
+    return app.MemoryStateBackend()
@@ -0,0 +1,31 @@
+import pytest
+
+QUESTION = {"question": "Which structure is FIFO?", "options": ["A) Stack", "B) Queue", "C) Heap", "D) Tree"],
+            "correct_answer": "B", "explanation": "A queue removes items in insertion order."}
+
+@pytest.mark.parametrize("options, letter, text", [
+    (QUESTION["options"], "C", "C) Heap"),
+    (["B) Queue", "A) Stack"], "A", "A) Stack"), # Out of order: found by its prefix
+    (["Stack", "Queue"], "B", "B"), # No option carries the letter: the letter itself
+    (QUESTION["options"], "E", "E"),
+])
+def test_option_for_letter(app, options, letter, text):
+    assert app.option_for_letter(options, letter) == text
+
+@pytest.mark.parametrize("letter, correct, shown", [
+    ("B", True, ("B", "B) Queue")),
+    ("A", False, ("A", "A) Stack")),
+    (None, False, ("Skipped", "Skipped")),
+])
+def test_answer_view_joins_the_record_with_its_question(app, letter, correct, shown):
+    view = app.answer_view(app.make_answer_record(1, letter, correct, 8.0), [{}, QUESTION])
+    assert (view["user_answer_letter"], view["user_answer_text"]) == shown
+    assert (view["correct_answer_letter"], view["correct_answer_text"]) == ("B", "B) Queue")
+    assert view["is_correct"] is correct
+    assert (view["question"], view["options"], view["explanation"]) == \
+        (QUESTION["question"], QUESTION["options"], QUESTION["explanation"])
+
+def test_answer_view_of_an_unmatched_letter_shows_the_letter(app):
+    question = {**QUESTION, "options": ["Stack", "Queue", "Heap", "Tree"]} # Options without letter prefixes
+    view = app.answer_view(app.make_answer_record(0, "A", False), [question])
+    assert (view["user_answer_text"], view["correct_answer_text"]) == ("A", "B")
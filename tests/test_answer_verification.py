@@ -0,0 +1,60 @@
+import pytest
+
+def item(explanation, answer, options=("A) ₹150", "B) ₹200", "C) ₹250", "D) ₹300")):
+    return {"question": "What is the profit?", "options": list(options), "correct_answer": answer, "explanation": explanation}
+
+def test_a_supported_answer_is_verified(app):
+    kept, counts = app.verify_quantitative_questions([item("Profit = 1,200 - 1,000 = ₹200", "B")])
+    assert kept[0]["correct_answer"] == "B"
+    assert counts["verified"] == 1
+
+def test_a_wrong_letter_is_corrected_when_the_result_matches_one_option(app):
+    kept, counts = app.verify_quantitative_questions([item("Profit = 1250 - 1000 = 250", "B")])
+    assert kept[0]["correct_answer"] == "C"
+    assert counts["corrected"] == 1
+
+def test_a_result_matching_no_option_is_rejected(app):
+    kept, counts = app.verify_quantitative_questions([item("Profit = 1400 - 1000 = 400", "B")])
+    assert kept == []
+    assert counts["rejected"] == 1
+
+def test_an_intermediate_result_does_not_verify_a_claim(app):
+    question = item("Discount = 300 - 50 = 250, so profit = 1200 - 1000 = 200", "C")
+    kept, counts = app.verify_quantitative_questions([question])
+    assert kept == [question] # Mentioned along the way, so not rewritten either
+    assert counts["verified"] == 0 and counts["unchecked"] == 1
+
+def test_a_claim_mentioned_before_a_different_final_result_is_kept_unchecked(app):
+    question = item("Selling price = ₹200 more than cost, so the margin = 200 / 1000 = 0.2", "B")
+    kept, counts = app.verify_quantitative_questions([question])
+    assert kept == [question]
+    assert counts["unchecked"] == 1
+
+def test_a_contradicted_claim_without_a_single_final_value_is_rejected(app):
+    kept, counts = app.verify_quantitative_questions([item("Profit = 250. The cost was 1000", "B")])
+    assert kept == []
+    assert counts["rejected"] == 1
+
+def test_items_without_arithmetic_are_kept_unchecked(app):
+    questions = [item("The seller gains on every unit sold.", "B"),
+                 item("Speed = 60 x 2 = 120", "A", options=("A) Fast", "B) Slow", "C) Same", "D) None"))]
+    kept, counts = app.verify_quantitative_questions(questions)
+    assert kept == questions
+    assert counts["unchecked"] == 2
+
+def test_rounded_results_are_tolerated(app):
+    options = ("A) 33.33%", "B) 25%", "C) 50%", "D) 66.67%")
+    kept, counts = app.verify_quantitative_questions([item("Gain % = 100 / 3 = 33.33%", "A", options)])
+    assert counts["verified"] == 1
+
+@pytest.mark.parametrize("text, values", [
+    ("₹1,815 = 1650 × 1.1", [1815.0, 1815.0]),
+    ("60 x 2 = 120 km", [120.0, 120.0]),
+    ("(3 + 5) ^ 2 = 64", [64.0, 64.0]),
+])
+def test_arithmetic_values_normalise_notation(app, text, values):
+    assert app.arithmetic_values(text) == pytest.approx(values)
+
+@pytest.mark.parametrize("expression", ["__import__('os')", "2 ** 1000", "1 / 0", "abs(-3)"])
+def test_safe_eval_refuses_anything_but_small_arithmetic(app, expression):
+    assert app.safe_eval(expression) is None
@@ -0,0 +1,76 @@
+from datetime import datetime
+
+import pytest
+
+@pytest.fixture
+def session(app):
+    """Session state of a candidate who has just been handed a three-question DSA paper."""
+    state = app.st.session_state
+    state.current_test = "Domain Test (DSA)"
+    state.mode = "test"
+    state.attempt_seed = 7
+    state.test_start_time = datetime(2026, 1, 5, 10, 0)
+    state.questions = app.create_sample_questions("Domain Test (DSA)", "", 3, "Any")
+    state.essay_topic = ""
+    state.coding_problems = []
+    state.answers = []
+    return state
+
+def test_mcq_attempt_resumes_with_its_answers_and_deadline(app, session):
+    questions = list(session.questions)
+    app.start_attempt()
+    attempt_id = session.attempt_id
+    answers = [app.make_answer_record(0, "A", True, 12.0), app.make_answer_record(1, None, False)]
+    for i, record in enumerate(answers):
+        app.record_attempt_event("answer", index=i, record=list(record))
+
+    session.questions, session.answers, session.current_test = [], [], None # The session is gone
+    assert app.resume_attempt(attempt_id)
+    assert session.questions == questions
+    assert session.answers == answers
+    assert session.current_question == 2
+    assert session.attempt_seed == 7
+    assert session.test_start_time == datetime(2026, 1, 5, 10, 0)
+
+def test_latest_code_and_essay_edits_win(app, session):
+    session.questions, session.current_test = [], "Coding Test"
+    session.coding_problems = [{"title": "Two Sum", "description": "Find two numbers adding up to target."}]
+    app.start_attempt()
+    for code in ("print(1)", "print(2)"):
+        app.record_attempt_event("code", problem=0, code=app.get_blob_store().put(code))
+    app.record_attempt_event("code_language", problem=0, language="cpp")
+    state = app.load_attempt(session.attempt_id)
+    assert state["code"] == {0: "print(2)"}
+    assert state["languages"] == {0: "cpp"}
+
+    assert app.resume_attempt(session.attempt_id)
+    assert session.answers[0]["problems_solved"][0]["user_code"] == "print(2)"
+    assert session.answers[0]["problems_solved"][0]["language"] == "cpp"
+
+def test_journal_stores_questions_as_blob_references(app, session):
+    app.start_attempt()
+    start = app.get_state_backend().read(app.attempt_stream(session.attempt_id))[0]
+    assert start["event"] == "start"
+    assert all(app.is_blob_ref(q) for q in start["questions"])
+    assert app.load_attempt(session.attempt_id)["questions"] == session.questions
+
+def test_only_the_candidate_who_started_an_attempt_can_resume_it(app, session):
+    app.start_attempt()
+    attempt_id, owner = session.attempt_id, session.candidate_id
+    session.candidate_id = "someone-else" # e.g. opened from a shared link with ?attempt=
+    assert not app.resume_attempt(attempt_id)
+    session.candidate_id = owner
+    assert app.resume_attempt(attempt_id)
+
+def test_finished_attempts_cannot_be_resumed(app, session):
+    app.start_attempt()
+    attempt_id = session.attempt_id
+    app.finish_attempt()
+    assert session.attempt_id is None
+    assert app.load_attempt(attempt_id) is None
+    assert not app.resume_attempt(attempt_id)
+
+@pytest.mark.parametrize("attempt_id", [None, "", "../progress:x", "A" * 32, "0" * 31])
+def test_malformed_attempt_ids_are_rejected(app, attempt_id):
+    assert app.attempt_stream(attempt_id) is None
+    assert app.load_attempt(attempt_id) is None
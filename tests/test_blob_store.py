@@ -0,0 +1,42 @@
+import pytest
+
+PAYLOAD = {"question": "Which data structure gives O(1) average lookup?", "options": ["A) List", "B) Hash map", "C) Heap",
+           "D) Queue"], "correct_answer": "B", "explanation": "Hash maps index buckets by key hash."}
+
+@pytest.fixture(params=["zstd", "zlib"])
+def store(app, backend, request):
+    return app.BlobStore(backend, codec=request.param)
+
+def test_put_then_get_returns_the_payload(app, store):
+    ref = store.put(PAYLOAD)
+    assert app.is_blob_ref(ref)
+    assert store.get(ref) == PAYLOAD
+
+def test_identical_payloads_are_stored_once(store):
+    first = store.put(PAYLOAD)
+    second = store.put(dict(reversed(list(PAYLOAD.items())))) # Same content, different key order
+    assert first == second
+    assert store.report()["blobs_written"] == 1
+    assert store.report()["references"] == 2
+
+def test_blobs_stay_readable_after_a_dictionary_is_trained(app, store, backend):
+    old_ref = store.put(PAYLOAD)
+    samples = [app.canonical_json({**PAYLOAD, "question": f"{PAYLOAD['question']} ({i})"}) for i in range(200)]
+    store.train(samples)
+    new_ref = store.put({**PAYLOAD, "question": "Which structure is LIFO?"})
+    fresh = app.BlobStore(backend, codec=store.codec) # Another worker, with no dictionaries in memory
+    assert fresh.get(old_ref) == PAYLOAD
+    assert fresh.get(new_ref)["question"] == "Which structure is LIFO?"
+
+def test_strings_round_trip(store):
+    code = "def solve():\n    return 'ünïcode'\n"
+    assert store.get(store.put(code)) == code
+
+def test_incompressible_payloads_are_stored_verbatim(store, backend):
+    ref = store.put("x") # Compressed and base64-encoded, one character would grow
+    assert backend.get("blobs", ref["blob"])["codec"] == "none"
+    assert store.get(ref) == "x"
+
+def test_missing_blob_raises_key_error(store):
+    with pytest.raises(KeyError):
+        store.get({"blob": "0" * 64})
@@ -0,0 +1,68 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Rows are attempts, columns the items of one paper: item 0 separates strong from weak candidates,
+# item 2 is answered correctly by everyone
+RESULTS = [
+    [1, 1, 1, 1],
+    [1, 1, 1, 0],
+    [1, 0, 1, 1],
+    [0, 1, 1, 0],
+    [0, 0, 1, 0],
+    [0, 0, 1, 0],
+]
+TOPICS = ["Arrays", "Arrays", "Graphs", None]
+
+@pytest.fixture
+def log(app, tmp_path):
+    return app.AnswerEventLog(str(tmp_path), flush_rows=1000, flush_seconds=3600, compact_segments=2)
+
+def record_attempts(log, results, seconds=10.0):
+    for attempt, row in enumerate(results):
+        for index, correct in enumerate(row):
+            log.record(answered_at=datetime(2026, 1, 5, 10, index), cohort="2026-A", candidate_id=f"c{attempt}",
+                       attempt_id=f"a{attempt}", test="Domain Test (DSA)", topic=TOPICS[index], difficulty="Medium",
+                       practice=False, question_id=f"q{index}", question=f"Question {index}?", question_index=index,
+                       answer=("A" if correct else "B") if attempt or index != 3 else None, is_correct=bool(correct),
+                       seconds=seconds * (index + 1))
+
+def report(app, log):
+    log.flush()
+    return app.cohort_report(log.read(app.REPORT_COLUMNS).to_pandas())
+
+def test_topic_accuracy_skips_and_time(app, log):
+    record_attempts(log, RESULTS)
+    topics, _ = report(app, log)
+    by_topic = topics.set_index(topics["topic"].fillna("(none)"))
+    assert by_topic.loc["Arrays", "answers"] == 12
+    assert by_topic.loc["Arrays", "accuracy"] == pytest.approx(6 / 12)
+    assert by_topic.loc["Graphs", "accuracy"] == 1.0
+    assert by_topic.loc["Arrays", "median_seconds"] == pytest.approx(15.0)
+    assert by_topic.loc["(none)", "skip_rate"] == pytest.approx(1 / 6) # Untagged questions form their own group
+
+def test_item_difficulty_and_discrimination_match_the_point_biserial(app, log):
+    record_attempts(log, RESULTS)
+    _, items = report(app, log)
+    results = np.array(RESULTS, dtype=float)
+    item = items.set_index("question").loc["Question 0?"]
+    rest = (results.sum(axis=1) - results[:, 0]) / 3
+    assert item["difficulty"] == pytest.approx(0.5)
+    assert item["discrimination"] == pytest.approx(np.corrcoef(results[:, 0], rest)[0, 1])
+    assert items["question"].iloc[0] != "Question 0?" # Sorted with the least discriminating items first
+    assert pd.isna(items.set_index("question").loc["Question 2?", "discrimination"]) # No variance to correlate
+
+def test_rarely_answered_items_are_left_out(app, log):
+    record_attempts(log, RESULTS[:app.ANALYTICS_MIN_ITEM_ANSWERS - 1])
+    _, items = report(app, log)
+    assert items.empty
+
+def test_segments_are_compacted_without_losing_events(app, log):
+    record_attempts(log, RESULTS[:3])
+    log.flush()
+    record_attempts(log, RESULTS[3:])
+    log.flush() # The second segment triggers compaction into one Parquet part
+    assert log._files(".arrow") == [] and len(log._files(".parquet")) == 1
+    assert log.read(["attempt_id"]).num_rows == 24
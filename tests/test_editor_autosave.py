@@ -0,0 +1,42 @@
+import pytest
+
+@pytest.fixture
+def saves(app):
+    """Journal writes of one editor, with a fresh autosave state."""
+    app.st.session_state.editor_autosave = {}
+    return []
+
+def let_interval_pass(app, editor_id):
+    app.st.session_state.editor_autosave[editor_id]["saved_at"] -= app.EDITOR_AUTOSAVE_INTERVAL
+
+def test_unchanged_content_is_not_persisted(app, saves):
+    assert app.autosave_editor("essay", "Draft", saves.append)
+    let_interval_pass(app, "essay")
+    assert not app.autosave_editor("essay", "Draft", saves.append)
+    assert saves == ["Draft"]
+
+def test_a_change_inside_the_interval_is_deferred_then_flushed(app, saves):
+    app.autosave_editor("essay", "Draft", saves.append)
+    assert not app.autosave_editor("essay", "Draft, then the last edit", saves.append)
+    app.flush_editor_autosaves({"essay": saves.append})
+    assert saves == ["Draft"] # Still inside the interval
+
+    let_interval_pass(app, "essay")
+    app.flush_editor_autosaves({"essay": saves.append})
+    app.flush_editor_autosaves({"essay": saves.append}) # Nothing is pending any more
+    assert saves == ["Draft", "Draft, then the last edit"]
+
+def test_a_pending_change_edited_back_is_not_flushed(app, saves):
+    app.autosave_editor("essay", "Draft", saves.append)
+    app.autosave_editor("essay", "Draft!", saves.append)
+    app.autosave_editor("essay", "Draft", saves.append)
+    let_interval_pass(app, "essay")
+    app.flush_editor_autosaves({"essay": saves.append})
+    assert saves == ["Draft"]
+
+def test_forced_saves_always_persist_a_change(app, saves):
+    app.autosave_editor("code_0", "print(1)", saves.append)
+    assert app.autosave_editor("code_0", "print(2)", saves.append, force=True)
+    assert saves == ["print(1)", "print(2)"]
+    app.flush_editor_autosaves({"code_0": saves.append})
+    assert saves == ["print(1)", "print(2)"] # The forced save cleared the pending edit
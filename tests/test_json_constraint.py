@@ -0,0 +1,59 @@
+import pytest
+
+QUESTIONS = ('[{"question": "What is 2 + 2?", "options": ["A) 3", "B) 4"], "correct_answer": "B",\n'
+             ' "explanation": "Say \\"4\\"\\n", "score": -1.5e3, "verified": true, "topic": null}, []]')
+
+def feed(app, text, state=("", "start", "")):
+    for char in text:
+        state = app.json_prefix_step(state, char)
+        if state is None:
+            return None
+    return state
+
+def test_a_complete_array_is_accepted(app):
+    assert feed(app, QUESTIONS)[1] == "done"
+    assert feed(app, "  [1, 2]\n ")[1] == "done" # Whitespace around the array is allowed
+
+def test_every_truncated_prefix_is_still_open(app):
+    for end in range(len(QUESTIONS)):
+        state = feed(app, QUESTIONS[:end])
+        assert state is not None and state[1] != "done", QUESTIONS[:end]
+
+@pytest.mark.parametrize("text", [
+    '{"question": "Q?"}', # Not an array
+    '[1, ]', # Trailing comma
+    '[{"question" "Q?"}]', # Missing colon
+    '[{1: 2}]', # Non-string key
+    '[tru]', # Broken literal
+    '["\\q"]', # Unknown escape
+    '["two\nlines"]', # Raw control character in a string
+    '[1}', # Mismatched bracket
+    '[] []', # Text after the array
+])
+def test_invalid_json_is_rejected(app, text):
+    assert feed(app, text) is None
+
+class Tokenizer:
+    """Decodes token IDs from a fixed vocabulary."""
+    vocab = ["[", "]", "{", '"a"', ":", "1", ",", "x", "<eos>"]
+    eos_token_id = 8
+
+    def decode(self, ids):
+        return "".join(self.vocab[i] for i in ids)
+
+def allowed(scores, row):
+    return {Tokenizer.vocab[i] for i, score in enumerate(scores[row].tolist()) if score != float("-inf")}
+
+def test_logits_processor_masks_tokens_that_would_break_the_array(app):
+    torch = pytest.importorskip("torch")
+    processor = app.JSONLogitsProcessor(Tokenizer(), prompt_length=2, batch_size=2)
+    scores = torch.zeros(2, len(Tokenizer.vocab))
+    assert allowed(processor(torch.tensor([[7, 7], [7, 7]]), scores), 0) == {"["}
+
+    # Row 0 opens the array; row 1 ignored the constraint and leaves the grammar
+    constrained = processor(torch.tensor([[7, 7, 0], [7, 7, 7]]), scores)
+    assert allowed(constrained, 0) == {"[", "]", "{", '"a"', "1"}
+    assert allowed(constrained, 1) == set(Tokenizer.vocab) # Unconstrained once outside the grammar
+
+    constrained = processor(torch.tensor([[7, 7, 0, 1], [7, 7, 7, 7]]), scores)
+    assert allowed(constrained, 0) == {"<eos>"} # Only the end of sequence may follow a complete array
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+FACTORIAL = {
+    "python": "import math\nprint(math.factorial(int(input())))\n",
+    "c": "#include <stdio.h>\nint main(void) {\n    long long n, f = 1;\n    scanf(\"%lld\", &n);\n"
+         "    while (n > 1) f *= n--;\n    printf(\"%lld\\n\", f);\n    return 0;\n}\n",
+}
+
+@pytest.fixture
+def make_runner(app, monkeypatch, tmp_path):
+    """Installs a fresh judge runner (and fixtures directory) for the test."""
+    monkeypatch.setattr(app, "JUDGE_FIXTURES_DIR", str(tmp_path / "fixtures"))
+
+    def make():
+        runner = app.JudgeRunner(str(tmp_path / "builds"), 1)
+        monkeypatch.setattr(app, "get_judge_runner", lambda: runner)
+        return runner
+    return make
+
+@pytest.fixture
+def runner(app, make_runner):
+    runner = make_runner()
+    if runner.sandbox in (None, "none"):
+        pytest.skip("no judge sandbox is installed here")
+    return runner
+
+def sample_problem(app, title):
+    return next(p for p in app.SAMPLE_CODING_PROBLEMS if p["title"] == title)
+
+def test_no_code_runs_without_a_sandbox(app, monkeypatch, make_runner, tmp_path):
+    monkeypatch.setattr(app, "JUDGE_SANDBOX", "auto")
+    monkeypatch.setattr(app.shutil, "which", lambda name: None) # No bwrap, nsjail or unshare
+    runner = make_runner()
+    assert runner.sandbox is None
+    assert not any(runner.available(language) for language in app.JUDGE_LANGUAGES)
+
+    marker = tmp_path / "ran"
+    status, output, _ = runner.run("python", f"open({str(marker)!r}, 'w').close()\nprint('hi')\n", "", 5)
+    assert status == "compile error: No judge sandbox is installed on this server."
+    assert output == "" and not marker.exists()
+
+    fixtures = app.coding_fixtures(sample_problem(app, "Factorial Calculation"))
+    assert fixtures["tests"] == [] and fixtures["error"] == "no judge sandbox is installed"
+    assert not os.path.exists(app.JUDGE_FIXTURES_DIR) # Not stored, so it is built once a sandbox is installed
+
+def test_unknown_sandbox_setting_is_refused(app, monkeypatch):
+    monkeypatch.setattr(app, "JUDGE_SANDBOX", "docker")
+    assert app.judge_sandbox_kind() is None
+
+@pytest.mark.parametrize("language", ["python", "c"])
+def test_sample_problem_is_judged(app, runner, language):
+    if not runner.available(language):
+        pytest.skip(f"{language} is not installed here")
+    problem = sample_problem(app, "Factorial Calculation")
+    fixtures = app.coding_fixtures(problem)
+    assert fixtures["error"] is None
+    assert fixtures["tests"][0] == {"kind": "sample", "input": "4\n", "output": "24\n"}
+
+    verdicts = app.grade_coding_solution(problem, FACTORIAL[language], language)
+    assert verdicts and all(v["verdict"] == "Accepted" for v in verdicts)
+
+def test_wrong_and_crashing_solutions(app, runner):
+    problem = sample_problem(app, "Factorial Calculation")
+    assert app.grade_coding_solution(problem, "print(int(input()) + 1)\n")[0]["verdict"] == "Wrong Answer"
+    assert app.grade_coding_solution(problem, "raise SystemExit(3)\n")[0]["verdict"] == "Runtime Error"
+
+def test_builds_are_cached_by_source(app, runner):
+    for _ in range(2):
+        assert runner.run("python", "print(input())\n", "hi\n", 5, warm=False)[:2] == ("ok", "hi\n")
+    stats = runner.report().set_index("language").loc["Python 3"]
+    assert (stats["builds"], stats["build_cache_hits"], stats["runs"]) == (1, 1, 2)
+
+@pytest.mark.parametrize("warm", [False, True])
+def test_sandbox_hides_the_app_directory(app, runner, warm):
+    source = f"print(open({os.path.abspath(app.__file__)!r}).read()[:10])\n"
+    status, output, _ = runner.run("python", source, "", 5, warm=warm)
+    assert status.startswith("error:") and output == ""
+
+def test_warm_processes_see_only_their_own_program(app, runner):
+    runner.build("python", "print('other candidate')\n") # Another submission in the shared build directory
+    status, output, _ = runner.run("python", f"import os\nprint(os.path.exists({runner.build_dir!r}))\n", "", 5, warm=True)
+    assert (status, output) == ("ok", "False\n")
+
+def test_slow_programs_time_out(app, runner):
+    status, _, seconds = runner.run("python", "while True: pass\n", "", 0.5)
+    assert status == "timeout"
+    assert seconds < 5
@@ -0,0 +1,55 @@
+import pytest
+
+TEST = "Quantitative Ability Test"
+
+@pytest.fixture
+def service(app, backend):
+    return app.LeaderboardService(backend, refresh_seconds=0, top_n=3)
+
+def test_best_score_counts_and_ties_share_a_rank(app):
+    board = app.Leaderboard()
+    board.update("a", 70, 1.0)
+    board.update("b", 90, 2.0)
+    board.update("c", 70, 3.0)
+    assert not board.update("b", 60, 4.0) # Worse than b's best
+    assert board.update("a", 80, 5.0)
+    assert board.top(3) == [(1, "b", 90), (2, "a", 80), (3, "c", 70)]
+
+    board.update("d", 80, 6.0)
+    assert board.top(4) == [(1, "b", 90), (2, "a", 80), (2, "d", 80), (4, "c", 70)] # a was first to 80
+    assert board.rank("d") == (2, 80, 25.0) # d beats one of the four candidates
+    assert board.rank("nobody") is None
+
+def test_results_are_on_the_cohort_and_all_cohorts_boards(app, service):
+    service.record(TEST, "Batch A", "a", 70)
+    service.record(TEST, "Batch B", "b", 90)
+    assert [row[1] for row in service.snapshot(TEST, "Batch A")["top"]] == ["a"]
+    assert [row[1] for row in service.snapshot(TEST, app.LEADERBOARD_ALL_COHORTS)["top"]] == ["b", "a"]
+    assert service.cohorts(TEST) == ["Batch A", "Batch B"]
+    assert service.snapshot(TEST, "Batch C") == {"top": [], "size": 0, "published_at": service.refreshed_at}
+
+def test_snapshot_keeps_top_n_rows_and_board_size(app, service):
+    for i, score in enumerate([50, 60, 70, 80, 90]):
+        service.record(TEST, "Batch A", f"c{i}", score)
+    snapshot = service.snapshot(TEST, "Batch A")
+    assert snapshot["top"] == [(1, "c4", 90), (2, "c3", 80), (3, "c2", 70)]
+    assert snapshot["size"] == 5
+    assert service.rank(TEST, "Batch A", "c4") == (1, 90, 80.0)
+    assert service.rank(TEST, "Batch A", "c0") == (5, 50, 0.0)
+
+def test_other_workers_results_arrive_on_refresh(app, backend, service):
+    other = app.LeaderboardService(backend, refresh_seconds=0)
+    service.record(TEST, "Batch A", "a", 70)
+    other.record(TEST, "Batch A", "b", 90)
+    assert [row[1] for row in service.snapshot(TEST, "Batch A")["top"]] == ["b", "a"]
+    service.refresh() # Re-reading its own result from the stream changes nothing
+    assert service.snapshot(TEST, "Batch A")["size"] == 2
+
+def test_snapshots_are_republished_at_most_once_per_interval(app, backend):
+    service = app.LeaderboardService(backend, refresh_seconds=3600)
+    other = app.LeaderboardService(backend, refresh_seconds=0)
+    service.refresh()
+    other.record(TEST, "Batch A", "b", 90)
+    assert service.snapshot(TEST, "Batch A")["size"] == 0 # Still within the refresh interval
+    service.refreshed_at = 0.0
+    assert service.snapshot(TEST, "Batch A")["size"] == 1
@@ -0,0 +1,39 @@
+import os
+import random
+
+import pytest
+
+TEST = "Analytical Reasoning Test"
+
+@pytest.fixture
+def fixtures(app, backend, monkeypatch, tmp_path):
+    """A fresh fixtures directory and question bank, with attempt seeds pinned."""
+    monkeypatch.setattr(app, "LLM_FIXTURE_DIR", str(tmp_path))
+    monkeypatch.setattr(app, "get_state_backend", lambda: backend)
+    monkeypatch.setenv("PREP_AI_SEED", "1234")
+    return tmp_path
+
+def test_a_recorded_paper_is_replayed_exactly(app, fixtures, monkeypatch):
+    seed = app.new_attempt_seed()
+    assert seed == 1234
+    monkeypatch.setattr(app, "LLM_FIXTURE_MODE", "record")
+    recorded = app.generate_test_questions(TEST, "Medium", rng=random.Random(seed))
+    assert len(recorded) == app.TEST_CONFIGS[TEST]["question_count"]
+    assert len(os.listdir(fixtures / "question_generation")) == len(app.TEST_CONFIGS[TEST]["topics"])
+
+    def unreachable(prompt):
+        raise AssertionError("replay called the model")
+    monkeypatch.setattr(app, "LLM_FIXTURE_MODE", "replay")
+    monkeypatch.setattr(app, "stub_completion", unreachable)
+    assert app.generate_test_questions(TEST, "Medium", rng=random.Random(app.new_attempt_seed())) == recorded
+
+def test_fixtures_are_keyed_by_task_and_prompt(app, fixtures):
+    app.save_llm_fixture("essay_topic", "Suggest a topic.", "Remote Work")
+    assert app.load_llm_fixture("essay_topic", "Suggest a topic.") == "Remote Work"
+    assert app.llm_fixture_path("essay_topic", "Suggest a topic.") != app.llm_fixture_path("essay_topic", "Suggest two.")
+    with pytest.raises(LookupError):
+        app.load_llm_fixture("question_generation", "Suggest a topic.")
+
+def test_attempt_seeds_are_random_unless_pinned(app, monkeypatch):
+    monkeypatch.delenv("PREP_AI_SEED", raising=False)
+    assert len({app.new_attempt_seed() for _ in range(5)}) > 1
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+PROFILE = {"models": ["stub:primary", "stub:backup"], "max_tokens": 100, "timeout": 2, "latency_slo": 1.0,
+           "hedge_after": 0.2}
+
+@pytest.fixture
+def router(app):
+    router = app.LLMRouter({"task": dict(PROFILE)}, max_workers=4)
+    yield router
+    router.executor.shutdown(wait=False)
+
+def fake_model(latencies, calls, failing=(), queued=None):
+    """
+    A `call_model` that waits `queued` seconds for the rate limiter, then sleeps for the model's
+    latency and answers with (or fails on) its name.
+    """
+    def call_model(spec, on_admitted, deadline):
+        calls.append(spec)
+        time.sleep((queued or {}).get(spec, 0))
+        on_admitted()
+        time.sleep(latencies.get(spec, 0))
+        if spec in failing:
+            raise RuntimeError(f"{spec} failed")
+        return spec
+    return call_model
+
+def test_unmeasured_models_keep_the_profile_order(router):
+    assert router.rank("task") == ["stub:primary", "stub:backup"]
+
+def test_models_whose_p95_breaks_the_slo_are_demoted(router):
+    for seconds in (0.5, 0.6, 3.0): # p95 of 3s is over the 1s SLO
+        router.record("stub:primary", seconds)
+    assert router.rank("task") == ["stub:backup", "stub:primary"]
+
+def test_demoted_models_are_ordered_by_p50(app):
+    router = app.LLMRouter({"task": dict(PROFILE, models=["stub:a", "stub:b", "stub:c"])})
+    for spec, samples in (("stub:a", (4, 5, 9)), ("stub:b", (2, 3, 9)), ("stub:c", (0.1, 0.2, 0.3))):
+        for seconds in samples:
+            router.record(spec, seconds)
+    assert router.rank("task") == ["stub:c", "stub:b", "stub:a"]
+
+def test_hedge_delay_is_the_p95_bounded_by_hedge_after(router):
+    assert router.hedge_delay("task", "stub:primary") == 0.2 # No measurements yet
+    for seconds in (0.05, 0.05, 0.1):
+        router.record("stub:primary", seconds)
+    assert router.hedge_delay("task", "stub:primary") == 0.1
+
+def test_a_fast_primary_is_not_hedged(router):
+    calls = []
+    assert router.complete("task", fake_model({}, calls)) == "stub:primary"
+    assert calls == ["stub:primary"]
+
+def test_a_slow_primary_is_hedged_by_the_backup(router):
+    calls = []
+    started = time.monotonic()
+    assert router.complete("task", fake_model({"stub:primary": 1.5}, calls)) == "stub:backup"
+    assert calls == ["stub:primary", "stub:backup"]
+    assert time.monotonic() - started < 1
+
+def test_time_queued_for_the_rate_limiter_does_not_trigger_a_hedge(router):
+    calls = []
+    assert router.complete("task", fake_model({"stub:primary": 0.05}, calls, queued={"stub:primary": 0.5})) == "stub:primary"
+    assert calls == ["stub:primary"]
+
+def test_a_failing_primary_fails_over_straight_away(app):
+    router = app.LLMRouter({"task": dict(PROFILE, hedge_after=1.5)})
+    calls = []
+    started = time.monotonic()
+    assert router.complete("task", fake_model({}, calls, failing={"stub:primary"})) == "stub:backup"
+    assert time.monotonic() - started < 1 # Did not sit out the hedge delay
+
+def test_tasks_without_hedging_use_only_the_primary(app):
+    router = app.LLMRouter({"task": dict(PROFILE, hedge_after=None)})
+    calls = []
+    with pytest.raises(RuntimeError, match="stub:primary failed"):
+        router.complete("task", fake_model({}, calls, failing={"stub:primary"}))
+    assert calls == ["stub:primary"]
+
+def test_no_answer_before_the_timeout_raises(app):
+    router = app.LLMRouter({"task": dict(PROFILE, timeout=0.3)})
+    release = threading.Event()
+    with pytest.raises(TimeoutError):
+        router.complete("task", lambda spec, on_admitted, deadline: release.wait(5))
+    release.set()
+
+def test_models_are_given_the_profile_deadline(router):
+    deadlines = []
+    started = time.monotonic()
+    router.complete("task", lambda spec, on_admitted, deadline: deadlines.append(deadline))
+    assert started + PROFILE["timeout"] <= deadlines[0] <= time.monotonic() + PROFILE["timeout"]
+
+def test_rate_limited_requests_are_dropped_at_the_profile_deadline(app, backend, monkeypatch):
+    limiter = app.LLMRateLimiter(app.SharedBucketStore(backend, {"requests": 1, "tokens": 1000}))
+    limiter.acquire("other", 10) # Capacity is gone for the next minute
+    router = app.LLMRouter({"task": dict(PROFILE, timeout=0.3, hedge_after=None)})
+    monkeypatch.setitem(app.LLM_TASK_PROFILES, "task", router.profiles["task"])
+    monkeypatch.setitem(app.LLM_PROVIDERS, "stub", (app.LLM_PROVIDERS["stub"][0], True)) # Rate limited like Groq
+    monkeypatch.setattr(app, "get_llm_router", lambda: router)
+    monkeypatch.setattr(app, "get_llm_rate_limiter", lambda: limiter)
+
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        app.run_llm_chain("task", app.PromptTemplate(input_variables=[], template="Hello"), {})
+    router.executor.shutdown(wait=True) # The queued request gives up with the router...
+    assert time.monotonic() - started < 2
+    assert limiter.pending == {} # ...and leaves the rate limiter's queue
@@ -0,0 +1,78 @@
+import gzip
+import itertools
+import json
+import threading
+
+import pytest
+
+import provision
+
+@pytest.fixture
+def fake_generation(monkeypatch):
+    """Replaces paper generation with one that returns the given essay topics, one paper per call."""
+    def install(*topics):
+        lock, topics = threading.Lock(), iter(topics)
+
+        def generate_paper(test_name, difficulty, seed):
+            with lock:
+                topic = next(topics)
+            if isinstance(topic, Exception):
+                raise topic
+            return {"seed": seed, "items": [topic]}
+        monkeypatch.setattr(provision, "generate_paper", generate_paper)
+    return install
+
+def test_repeated_papers_are_rejected_and_regenerated(fake_generation):
+    fake_generation("Topic A", "Topic A", "topic  a", "Topic B", "Topic C")
+    papers, stats = provision.provision_papers("Written English Test", "Medium", 3, parallel=1, seed=1)
+    assert [p["items"] for p in papers] == [["Topic A"], ["Topic B"], ["Topic C"]]
+    assert stats["duplicate paper"] == 2 # Compared after normalizing case and whitespace
+    assert stats["generated"] == 5
+
+def test_sample_content_is_rejected_unless_allowed(app, fake_generation):
+    fake_generation(app.SAMPLE_ESSAY_TOPICS[0], "Topic A")
+    papers, stats = provision.provision_papers("Written English Test", "Medium", 1, parallel=1)
+    assert papers[0]["items"] == ["Topic A"]
+    assert stats["sample content"] == 1
+
+    fake_generation(app.SAMPLE_ESSAY_TOPICS[0])
+    papers, _ = provision.provision_papers("Written English Test", "Medium", 1, parallel=1, allow_samples=True)
+    assert papers[0]["items"] == [app.SAMPLE_ESSAY_TOPICS[0]]
+
+def test_invalid_and_failed_papers_count_against_the_attempt_budget(fake_generation):
+    fake_generation("", RuntimeError("model down"), *itertools.repeat("", 10))
+    papers, stats = provision.provision_papers("Written English Test", "Medium", 2, parallel=2, max_attempts=4)
+    assert papers == []
+    assert (stats["generated"], stats["invalid"], stats["failed"]) == (4, 3, 1)
+
+def test_mcq_papers_need_the_full_question_count(app):
+    count = app.TEST_CONFIGS["Quantitative Ability Test"]["question_count"]
+    questions = [{"question": f"Q{i}?", "options": ["A) 1", "B) 2", "C) 3", "D) 4"], "correct_answer": "A",
+                  "explanation": "Because."} for i in range(count)]
+    assert provision.validate_paper("Quantitative Ability Test", {"items": questions}) is None
+    assert provision.validate_paper("Quantitative Ability Test", {"items": questions[1:]}) == "invalid"
+    assert provision.validate_paper("Quantitative Ability Test", {"items": questions[:-1] + questions[:1]}) == "duplicate item"
+
+def test_claims_hand_out_each_written_paper_once(app):
+    shared = {"title": "Shared", "description": "d", "difficulty": "Easy", "example": "e"}
+    papers = [{"seed": seed, "items": [shared, {**shared, "title": f"Own {seed}"}]} for seed in (11, 22)]
+    path = app.write_paper_set("Coding Test", "Medium", papers)
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert len(json.load(f)["items"]) == 3 # The shared problem is stored once
+
+    claims = [app.claim_provisioned_paper("Coding Test", "Medium") for _ in range(3)]
+    assert claims == [(11, papers[0]["items"]), (22, papers[1]["items"]), None]
+
+def test_papers_from_a_deterministic_provider_still_differ(app):
+    papers, stats = provision.provision_papers("Written English Test", "Medium", 3, parallel=1, seed=1)
+    assert len(papers) == 3 # The stub answers a repeated prompt the same way; the paper variant tells them apart
+    assert stats["duplicate paper"] == 0
+
+def test_short_sets_fail_the_run(monkeypatch, capsys):
+    summary = {"test": "Coding Test", "difficulty": "Medium", "papers": 1}
+    monkeypatch.setattr(provision, "provision_cohort", lambda *args: [summary])
+    monkeypatch.setattr("sys.argv", ["provision.py", "--papers", "3", "--tests", "Coding Test"])
+    with pytest.raises(SystemExit) as exit_info:
+        provision.main()
+    assert exit_info.value.code == 1
+    assert "Coding Test (Medium): 1" in capsys.readouterr().err
@@ -0,0 +1,37 @@
+TEST = "Analytical Reasoning Test"
+
+def request(app, variant, include_examples=True):
+    prompt = app.question_prompt(TEST, include_examples, variant)
+    return app.question_llm_request(TEST, "Logical Reasoning", 5, "Medium", prompt, True, include_examples, variant)
+
+def test_requests_for_different_prompts_have_different_coalesce_keys(app):
+    assert request(app, 1)["coalesce_key"] == request(app, 1)["coalesce_key"]
+    assert request(app, 1)["coalesce_key"] != request(app, 2)["coalesce_key"]
+    assert request(app, 1)["coalesce_key"] != request(app, 1, include_examples=False)["coalesce_key"]
+
+def test_concurrent_requests_for_two_variants_are_not_coalesced(app, monkeypatch):
+    prompts = []
+    stub_completion = app.stub_completion
+    monkeypatch.setattr(app, "STUB_LLM_LATENCY", 0.3) # Long enough for all three requests to be in flight together
+    monkeypatch.setattr(app, "stub_completion", lambda prompt: prompts.append(prompt) or stub_completion(prompt))
+
+    futures = [app.submit_llm_chain(**request(app, variant)) for variant in (1, 1, 2)]
+    responses = [future.result(10) for future in futures]
+    assert len(prompts) == 2 # The two variant 1 requests share a call
+    assert responses[0] == responses[1]
+    assert "(variant 1)" in responses[0] and "(variant 2)" in responses[2]
+
+def test_examples_go_with_the_first_topic_that_has_questions(app, backend, monkeypatch):
+    topics = app.TEST_CONFIGS[TEST]["topics"]
+    monkeypatch.setattr(app, "get_state_backend", lambda: backend) # Keeps the generated questions out of the shared bank
+    monkeypatch.setattr(app, "allocate_questions", lambda topics, total, stats=None: [0, 10, 10, 5]) # Strongest topic left out
+    sent = {}
+    question_llm_request = app.question_llm_request
+
+    def record(test_type, topic, count, difficulty, prompt, coalesce=True, include_examples=True, variant=None):
+        sent[topic] = include_examples
+        return question_llm_request(test_type, topic, count, difficulty, prompt, coalesce, include_examples, variant)
+    monkeypatch.setattr(app, "question_llm_request", record)
+
+    assert len(app.generate_test_questions(TEST, "Medium", coalesce=False)) == 25
+    assert sent == {topics[1]: True, topics[2]: False, topics[3]: False}
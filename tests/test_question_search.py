@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+TOPICS = {
+    "Graphs": ["Which traversal finds the shortest path in an unweighted graph?",
+               "How does Dijkstra's algorithm relax the edges of a weighted graph?"],
+    "Sorting": ["What is the worst-case running time of quicksort?",
+                "Which sorting algorithm is stable and runs in O(n log n) time?"],
+    "Hashing": ["How does a hash table resolve collisions with chaining?"],
+}
+
+def mcq(text):
+    return {"question": text, "options": ["A) One", "B) Two", "C) Three", "D) Four"], "correct_answer": "A",
+            "explanation": "See the definition."}
+
+@pytest.fixture
+def index(app, tmp_path):
+    index = app.QuestionIndex(str(tmp_path), compact_segments=100)
+    for topic, questions in TOPICS.items():
+        index.add("Domain Test (DSA)", topic, "Medium", [mcq(q) for q in questions])
+    index.flush()
+    yield index
+    index.executor.shutdown(wait=True)
+
+def search(app, index, query, **kwargs):
+    return index.snapshot().search(app.embed_texts([query])[0], kwargs.pop("k", 3), **kwargs)
+
+def test_the_closest_question_ranks_first(app, index):
+    results = search(app, index, "quicksort worst case running time")
+    assert results[0][1]["question"]["question"] == TOPICS["Sorting"][0]
+    assert results[0][1]["topic"] == "Sorting"
+    assert [score for score, _ in results] == sorted((score for score, _ in results), reverse=True)
+
+def test_results_can_be_limited_to_a_test_and_exclude_questions(app, index):
+    index.add("Aptitude", "Graphs", "Easy", [mcq("Shortest path between two cities on a map?")])
+    index.flush()
+    results = search(app, index, "shortest path graph", k=10, test_type="Domain Test (DSA)",
+                     exclude=[app.question_id(mcq(TOPICS["Graphs"][0]))])
+    questions = [item["question"]["question"] for _, item in results]
+    assert TOPICS["Graphs"][0] not in questions
+    assert all(item["test"] == "Domain Test (DSA)" for _, item in results)
+    assert len(questions) == 4
+
+def test_a_re_added_question_is_indexed_once(app, index):
+    index.add("Domain Test (DSA)", "Sorting", "Hard", [mcq(TOPICS["Sorting"][0])])
+    index.flush()
+    snapshot = index.snapshot()
+    assert len(snapshot.ids) == 5
+    assert snapshot.items[snapshot.row_of[app.question_id(mcq(TOPICS["Sorting"][0]))]]["difficulty"] == "Hard"
+
+def test_removed_questions_are_not_found_until_added_again(app, index):
+    removed = app.question_id(mcq(TOPICS["Hashing"][0]))
+    index.remove([removed])
+    index.flush()
+    assert removed not in index.snapshot().row_of
+    assert all(item["topic"] != "Hashing" for _, item in search(app, index, "hash table collisions", k=10))
+
+    index.add("Domain Test (DSA)", "Hashing", "Medium", [mcq(TOPICS["Hashing"][0])])
+    index.flush()
+    assert search(app, index, "hash table collisions")[0][1]["topic"] == "Hashing"
+
+def test_consecutive_additions_are_written_as_one_segment(app, tmp_path):
+    index = app.QuestionIndex(str(tmp_path), compact_segments=100)
+    release = threading.Event()
+    index.executor.submit(release.wait) # Holds the writer back until everything is queued
+    for topic, questions in TOPICS.items():
+        index.add("Domain Test (DSA)", topic, "Medium", [mcq(q) for q in questions])
+    release.set()
+    index.flush()
+    assert len(index._files("segment-")) == 1
+    assert len(index.snapshot().ids) == 5
+    index.executor.shutdown(wait=True)
+
+def test_compaction_drops_removed_questions(app, index):
+    index.remove([app.question_id(mcq(TOPICS["Graphs"][0]))])
+    index.flush()
+    index.compact()
+    assert index._files("deleted-") == [] and len(index.snapshot().ids) == 4
+
+def test_compaction_builds_ivf_lists_without_changing_results(app, index, monkeypatch):
+    before = search(app, index, "hash table collisions")
+    monkeypatch.setattr(app, "QUESTION_INDEX_IVF_MIN", 4)
+    index.compact()
+    assert index._files("segment-") == [] and len(index._files("part-")) == 1
+    snapshot = index.snapshot()
+    assert snapshot.centroids is not None
+    after = search(app, index, "hash table collisions")
+    assert [item["question"] for _, item in after] == [item["question"] for _, item in before]
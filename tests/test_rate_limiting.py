@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pytest
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(app, tmp_path, request):
+    """Builds bucket stores on the parametrized state backend."""
+    def make(capacities):
+        if request.param == "sqlite":
+            return app.SharedBucketStore(app.SQLiteStateBackend(str(tmp_path / "state.db")), capacities)
+        return app.SharedBucketStore(app.MemoryStateBackend(), capacities)
+    return make
+
+def make_limiter(app, backend, requests=2, tokens=100):
+    return app.LLMRateLimiter(app.SharedBucketStore(backend, {"requests": requests, "tokens": tokens}))
+
+def test_buckets_grant_until_empty_then_report_the_wait(make_store):
+    store = make_store({"requests": 2, "tokens": 100})
+    assert store.try_consume({"requests": 1, "tokens": 10}) == 0
+    assert store.try_consume({"requests": 1, "tokens": 10}) == 0
+    wait = store.try_consume({"requests": 1, "tokens": 10})
+    assert 29 < wait <= 30 # One request refills every 60 / 2 seconds
+
+def test_requests_larger_than_a_bucket_are_capped(make_store):
+    store = make_store({"requests": 10, "tokens": 100})
+    assert store.try_consume({"requests": 1, "tokens": 500}) == 0
+    assert store.try_consume({"requests": 1, "tokens": 1}) > 0
+
+def test_refunded_tokens_can_be_reserved_again(make_store):
+    store = make_store({"requests": 10, "tokens": 100})
+    assert store.try_consume({"requests": 1, "tokens": 100}) == 0
+    assert store.try_consume({"requests": 1, "tokens": 60}) > 0
+    store.refund({"tokens": 60})
+    assert store.try_consume({"requests": 1, "tokens": 60}) == 0
+
+def test_acquire_times_out_when_no_capacity_frees_up(app, backend):
+    limiter = make_limiter(app, backend, requests=1)
+    limiter.acquire("a", 10, max_wait=0.1)
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        limiter.acquire("a", 10, max_wait=0.1)
+    assert time.monotonic() - started < 1
+    assert not limiter.pending and not limiter.turns # The timed-out ticket left the queue
+
+def test_waiting_sessions_are_served_round_robin(app, backend):
+    limiter = make_limiter(app, backend, requests=1)
+    limiter.acquire("hog", 1) # Empties the bucket, so the calls below queue
+    served = []
+
+    def call(session_id):
+        limiter.acquire(session_id, 1, max_wait=10)
+        served.append(session_id)
+
+    threads = []
+    for session_id in ("hog", "hog", "other"):
+        threads.append(threading.Thread(target=call, args=(session_id,)))
+        threads[-1].start()
+        time.sleep(0.05) # Queue in this order
+    for expected in range(1, 4): # Free one request slot at a time; the queue decides who gets it
+        limiter.store.refund({"requests": 1})
+        with limiter.cond:
+            limiter.cond.notify_all()
+        deadline = time.monotonic() + 5
+        while len(served) < expected and time.monotonic() < deadline:
+            time.sleep(0.01)
+    for thread in threads:
+        thread.join(5)
+    assert served == ["hog", "other", "hog"]
+
+def test_buckets_are_shared_by_workers_on_the_same_backend(app, tmp_path):
+    path = str(tmp_path / "state.db")
+    first = app.SharedBucketStore(app.SQLiteStateBackend(path), {"requests": 1, "tokens": 100})
+    second = app.SharedBucketStore(app.SQLiteStateBackend(path), {"requests": 1, "tokens": 100}) # Another worker
+    assert first.try_consume({"requests": 1, "tokens": 10}) == 0
+    assert second.try_consume({"requests": 1, "tokens": 10}) > 0
+
+def test_coalescer_runs_concurrent_identical_requests_once(app):
+    coalescer = app.RequestCoalescer()
+    release, calls, results = threading.Event(), [], []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return "response"
+
+    threads = [threading.Thread(target=lambda: results.append(coalescer.run("key", fetch))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert results == ["response"] * 5
+    assert coalescer.run("key", lambda: "fresh") == "fresh" # Finished calls are not cached
+
+def test_coalescer_hands_the_leaders_error_to_followers(app):
+    coalescer = app.RequestCoalescer()
+    started, release, errors = threading.Event(), threading.Event(), []
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("model down")
+
+    def call(fn):
+        try:
+            coalescer.run("key", fn)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call, args=(fail,))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call, args=(lambda: "never called",))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert errors == ["model down", "model down"]
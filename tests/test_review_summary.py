@@ -0,0 +1,60 @@
+import pytest
+
+OUTCOMES = [("A", True), ("B", False), (None, False)] # Correct, incorrect, skipped
+
+@pytest.fixture
+def session(app):
+    """Session state of a finished 12-question attempt: every third answer is correct, incorrect or skipped."""
+    state = app.st.session_state
+    state.current_test = "Domain Test (DSA)"
+    state.attempt_seed = 7
+    state.questions = [{"question": f"Question {i}?", "options": ["A) One", "B) Two", "C) Three", "D) Four"],
+                        "correct_answer": "A", "explanation": ""} for i in range(12)]
+    state.answers = [app.make_answer_record(i, *OUTCOMES[i % 3], 10.0) for i in range(12)]
+    state.review_summary = None
+    return state
+
+@pytest.fixture
+def summaries(app, monkeypatch):
+    """Counts the summaries actually computed."""
+    calls = []
+    attempt_summary = app.attempt_summary
+    monkeypatch.setattr(app, "attempt_summary", lambda *args: calls.append(1) or attempt_summary(*args))
+    return calls
+
+def test_filters_list_the_matching_answer_positions(app, session):
+    summary = app.attempt_summary(session.questions, session.answers)
+    assert (summary["correct"], summary["incorrect"], summary["skipped"]) == (4, 4, 4)
+    assert summary["percentage"] == pytest.approx(100 / 3)
+    assert summary["positions"]["All"] == list(range(12))
+    assert summary["positions"]["Incorrect only"] == [1, 4, 7, 10]
+    assert summary["positions"]["Skipped only"] == [2, 5, 8, 11]
+
+def test_reruns_reuse_the_memoized_summary(app, session, summaries):
+    first = app.current_attempt_summary()
+    assert app.current_attempt_summary()["positions"] is first["positions"]
+    assert len(summaries) == 1
+
+def test_a_new_answer_or_attempt_recomputes_the_summary(app, session, summaries):
+    app.current_attempt_summary()
+    session.answers.append(app.make_answer_record(0, "A", True))
+    assert app.current_attempt_summary()["correct"] == 5
+    session.attempt_seed = 8 # The next attempt, with the same questions and answer count
+    app.current_attempt_summary()
+    assert len(summaries) == 3
+
+def test_time_reports_are_memoized_per_time_limit(app, session, monkeypatch):
+    reports = []
+    monkeypatch.setattr(app, "attempt_time_report", lambda questions, answers, limit: reports.append(limit) or limit)
+    assert app.current_attempt_summary()["time_report"] is None
+    assert app.current_attempt_summary(30)["time_report"] == 30
+    assert app.current_attempt_summary(30)["time_report"] == 30
+    assert app.current_attempt_summary(45)["time_report"] == 45
+    assert reports == [30, 45]
+
+def test_review_pages_slice_the_filtered_positions(app, monkeypatch):
+    monkeypatch.setattr(app, "REVIEW_PAGE_SIZE", 4)
+    positions = [1, 4, 7, 10, 13, 16]
+    assert app.review_page(positions, 1) == [1, 4, 7, 10]
+    assert app.review_page(positions, 2) == [13, 16] # The last page is short
+    assert app.review_page(positions, 3) == []
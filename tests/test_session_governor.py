@@ -0,0 +1,53 @@
+import pytest
+
+class State(dict):
+    """Stands in for a session's state (plain dicts cannot be weakly referenced)."""
+
+@pytest.fixture
+def make_governor(app, tmp_path):
+    def make(idle_seconds=3600, ceiling_bytes=2 ** 30):
+        return app.SessionGovernor(str(tmp_path), idle_seconds, ceiling_bytes)
+    return make
+
+def run(governor, session_id, state):
+    governor.touch(session_id, state)
+    governor.release(session_id, state)
+
+def test_idle_sessions_are_spilled_and_restored_on_their_next_run(make_governor):
+    governor = make_governor(idle_seconds=0)
+    state = State(questions=[{"question": "q"}] * 3, essay_topic="Remote work", mode="test")
+    run(governor, "a", state)
+    assert state["questions"] == [] and state["essay_topic"] == ""
+    assert state["mode"] == "test" # Only the bulky fields are spilled
+    governor.touch("a", state)
+    assert state["questions"] == [{"question": "q"}] * 3 and state["essay_topic"] == "Remote work"
+
+def test_least_recently_used_sessions_are_spilled_over_the_ceiling(make_governor):
+    governor = make_governor(ceiling_bytes=1000)
+    old, new = State(questions=["x" * 800]), State(questions=["y" * 800])
+    run(governor, "old", old)
+    run(governor, "new", new)
+    assert old["questions"] == []
+    assert new["questions"] == ["y" * 800]
+
+def test_running_sessions_are_never_spilled(make_governor):
+    governor = make_governor(idle_seconds=0)
+    state = State(questions=["q"])
+    governor.touch("a", state)
+    governor.touch("a", state) # A callback or fragment nested in the rerun
+    governor.release("a", state)
+    governor.enforce()
+    assert state["questions"] == ["q"]
+    governor.release("a", state)
+    assert state["questions"] == []
+
+def test_sessions_are_re_measured_only_when_their_fields_change(make_governor):
+    governor = make_governor()
+    state = State(questions=["q"])
+    run(governor, "a", state)
+    measured_at, size = governor.sessions["a"]["measured_at"], governor.sessions["a"]["bytes"]
+    run(governor, "a", state)
+    assert governor.sessions["a"]["measured_at"] == measured_at
+    state["questions"] = ["q" * 500]
+    run(governor, "a", state)
+    assert governor.sessions["a"]["bytes"] > size
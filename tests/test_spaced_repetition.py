@@ -0,0 +1,69 @@
+import heapq
+import uuid
+
+import pytest
+
+DAY = 86400.0
+
+def new_card():
+    """A card as `update_review_deck` creates it for a missed question."""
+    return {"ef": 2.5, "reps": 0, "interval": 0, "lapses": 1, "due": 0.0}
+
+@pytest.fixture(autouse=True)
+def real_days(app, monkeypatch):
+    monkeypatch.setattr(app, "REVIEW_DAY_SECONDS", DAY)
+
+def test_correct_answers_space_reviews_1_6_then_by_easiness(app):
+    card = new_card()
+    intervals = []
+    for _ in range(4):
+        app.sm2_schedule(card, 4, now=0.0)
+        intervals.append(card["interval"])
+    assert intervals == [1, 6, 15, 38] # round(6 * 2.5), round(15 * 2.5)
+    assert card["ef"] == pytest.approx(2.5) # Quality 4 leaves easiness unchanged
+    assert card["due"] == 38 * DAY
+
+def test_perfect_answers_raise_easiness(app):
+    card = new_card()
+    app.sm2_schedule(card, 5, now=0.0)
+    assert card["ef"] == pytest.approx(2.6)
+
+def test_a_lapse_restarts_the_schedule_and_lowers_easiness(app):
+    card = new_card()
+    for _ in range(3):
+        app.sm2_schedule(card, 4, now=0.0)
+    app.sm2_schedule(card, app.REVIEW_QUALITY["incorrect"], now=100.0)
+    assert (card["reps"], card["interval"], card["lapses"]) == (0, 1, 2)
+    assert card["ef"] == pytest.approx(2.5 - 0.54)
+    assert card["due"] == 100.0 + DAY
+    app.sm2_schedule(card, 4, now=200.0)
+    assert card["interval"] == 1 # The first successful review after a lapse is again one day out
+
+def test_easiness_never_drops_below_1_3(app):
+    card = new_card()
+    for _ in range(10):
+        app.sm2_schedule(card, 0, now=0.0)
+    assert card["ef"] == pytest.approx(1.3)
+
+def test_due_cards_skip_outdated_heap_entries(app):
+    cards = {"q1": {"due": 10.0}, "q2": {"due": 500.0}, "q3": {"due": 20.0}}
+    heap = [[10.0, "q1"], [50.0, "q2"], [20.0, "q3"], [500.0, "q2"]] # q2 was rescheduled from 50 to 500
+    heapq.heapify(heap)
+    due = app.pop_due_cards({"cards": cards, "heap": heap}, now=100.0, limit=10)
+    assert due == [cards["q1"], cards["q3"]]
+
+def test_a_question_repeated_in_one_attempt_is_scheduled_once(app):
+    app.st.session_state.current_test = "Domain Test (DSA)"
+    app.st.session_state.candidate_id = uuid.uuid4().hex # A fresh deck
+    question = app.create_sample_questions("Domain Test (DSA)", "", 1, "Any")[0]
+    questions = [question, dict(question), question] # The sample fallback repeats questions in short banks
+    answers = [app.make_answer_record(0, "A", False), app.make_answer_record(1, None, False),
+               app.make_answer_record(2, question["correct_answer"], True)]
+    app.update_review_deck(questions, answers)
+    deck = app.load_review_deck(app.st.session_state.candidate_id)
+    assert len(deck["cards"]) == 1 and len(deck["heap"]) == 1
+    assert deck["cards"][app.question_id(question)]["lapses"] == 1 # Scheduled by its worst answer, the skip
+
+    app.update_review_deck(questions, answers) # Next attempt: one SM-2 step, not three
+    card = app.load_review_deck(app.st.session_state.candidate_id)["cards"][app.question_id(question)]
+    assert (card["reps"], card["lapses"]) == (0, 2)
@@ -0,0 +1,79 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+WORKERS = 4
+UPDATES = 50 # Counter increments and stream entries per worker
+TOKENS_PER_MINUTE = 60 # Refills one token a second, so the bucket can be checked against elapsed time
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(app, tmp_path, request):
+    if request.param == "sqlite":
+        return app.SQLiteStateBackend(str(tmp_path / "state.db"))
+    return app.MemoryStateBackend()
+
+def test_values_are_grouped_by_namespace(store):
+    store.put("decks", "a", {"cards": 1})
+    store.put("leases", "a", 5)
+    assert store.get("decks", "a") == {"cards": 1}
+    assert store.get("decks", "b", "missing") == "missing"
+    assert sorted(store.keys("decks")) == ["a"]
+
+def test_update_applies_the_function_to_the_current_value(store):
+    assert store.update("counters", "n", lambda value, now: ((value or 0) + 1, "first")) == "first"
+    store.update("counters", "n", lambda value, now: (value + 1, None))
+    assert store.update("counters", "n", lambda value, now: (None, value)) == 2 # None leaves the value unchanged
+    assert store.get("counters", "n") == 2
+
+def test_streams_are_read_from_a_position(store):
+    for i in range(3):
+        store.append("events", {"i": i})
+    assert store.read("events") == [{"i": 0}, {"i": 1}, {"i": 2}]
+    assert store.read("events", 2) == [{"i": 2}]
+    assert store.read("other") == []
+
+def test_backends_must_implement_the_whole_interface(app):
+    class PartialBackend(app.StateBackend):
+        def get(self, namespace, key, default=None):
+            return default
+    with pytest.raises(TypeError):
+        PartialBackend()
+
+def run_worker(worker, path, start, results):
+    """One app worker process on the shared SQLite file: bumps a counter, appends entries and draws tokens."""
+    os.environ.update(STATE_BACKEND="sqlite", STATE_BACKEND_URL=path)
+    import app # Imported here, so the worker picks up the backend settings above
+    backend = app.get_state_backend()
+    store = app.SharedBucketStore(backend, {"tokens": TOKENS_PER_MINUTE})
+    start.wait() # Every worker is loaded, so the calls below really overlap
+    granted = 0
+    for i in range(UPDATES):
+        backend.update("counters", "n", lambda value, now: ((value or 0) + 1, None))
+        backend.append("events", {"worker": worker, "i": i})
+        granted += store.try_consume({"tokens": 1}) == 0
+    results.put((type(backend).__name__, granted))
+
+def test_worker_processes_share_one_sqlite_backend(app, tmp_path):
+    path = str(tmp_path / "state.db")
+    context = multiprocessing.get_context("spawn") # Fresh interpreters, like separate app workers
+    start, results = context.Barrier(WORKERS), context.Queue()
+    workers = [context.Process(target=run_worker, args=(i, path, start, results)) for i in range(WORKERS)]
+    started = time.time()
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get(timeout=120) for _ in workers]
+    for worker in workers:
+        worker.join(30)
+    elapsed = time.time() - started
+    assert [worker.exitcode for worker in workers] == [0] * WORKERS
+    assert {backend for backend, _ in outcomes} == {"SQLiteStateBackend"}
+
+    backend = app.SQLiteStateBackend(path)
+    assert backend.get("counters", "n") == WORKERS * UPDATES # No increment was lost
+    events = backend.read("events")
+    assert sorted((e["worker"], e["i"]) for e in events) == [(w, i) for w in range(WORKERS) for i in range(UPDATES)]
+    # The bucket starts full and refills one token a second: granting more would mean a token went out twice
+    granted = sum(count for _, count in outcomes)
+    assert TOKENS_PER_MINUTE <= granted <= TOKENS_PER_MINUTE + elapsed * TOKENS_PER_MINUTE / 60 + 1
@@ -0,0 +1,42 @@
+import pytest
+
+TOPICS = ["Arrays", "Arrays", "Graphs", "Graphs", "Trees", "Trees", "Trees"]
+# (letter, correct, seconds) of each answer; the last one was recorded without timing
+ANSWERS = [("A", True, 50), ("A", True, 60), ("A", True, 70), (None, False, 60), ("B", False, 5), ("A", True, 400),
+           ("A", True, None)]
+
+@pytest.fixture
+def time_report(app):
+    """Report of a seven-question attempt with a seven-minute limit: an even pace of 60 s per question."""
+    questions = [{"question": f"Question {i}?", "topic": topic} for i, topic in enumerate(TOPICS)]
+    answers = [app.make_answer_record(i, *answer) for i, answer in enumerate(ANSWERS)]
+    return app.attempt_time_report(questions, answers, 7)
+
+def test_only_timed_answers_are_reported(time_report):
+    report, _ = time_report
+    assert report["question"].tolist() == [1, 2, 3, 4, 5, 6]
+    assert report["outcome"].tolist() == ["Correct", "Correct", "Correct", "Skipped", "Incorrect", "Correct"]
+
+def test_pace_is_measured_against_the_time_limit(time_report):
+    report, target = time_report
+    assert target == 60 # Untimed answers still count toward the paper's length
+    assert report["cumulative_seconds"].tolist() == [50, 110, 180, 240, 245, 645]
+    assert report["target_cumulative_seconds"].tolist() == [60, 120, 180, 240, 300, 360]
+
+def test_slow_and_rushed_answers_are_flagged(time_report):
+    report, _ = time_report
+    # Median 60 s, scaled MAD about 15 s: slow beyond about 104 s, rushed below 15 s when incorrect
+    assert report["flag"].tolist() == ["", "", "", "", "rushed", "slow"]
+
+def test_time_is_broken_down_by_outcome_and_topic(app, time_report):
+    report, _ = time_report
+    assert app.time_by_outcome(report).to_dict() == pytest.approx({"Correct": 145, "Incorrect": 5, "Skipped": 60})
+    by_topic = app.time_by_topic(report).set_index("topic")
+    assert by_topic["questions"].to_dict() == {"Arrays": 2, "Graphs": 2, "Trees": 2}
+    assert by_topic["median_seconds"].to_dict() == {"Arrays": 55, "Graphs": 65, "Trees": 202.5}
+    assert by_topic["accuracy"].to_dict() == {"Arrays": 1.0, "Graphs": 0.5, "Trees": 0.5}
+
+def test_an_untimed_attempt_has_an_empty_report(app):
+    questions = [{"question": "Question?", "topic": "Arrays"}]
+    report, _ = app.attempt_time_report(questions, [app.make_answer_record(0, "A", True)], 1)
+    assert report.empty
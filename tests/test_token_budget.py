@@ -0,0 +1,29 @@
+import pytest
+
+@pytest.fixture
+def ledger(app, monkeypatch):
+    """A fresh token ledger in place of the process-wide one."""
+    ledger = app.TokenUsageLedger()
+    monkeypatch.setattr(app, "get_token_usage_ledger", lambda: ledger)
+    return ledger
+
+def test_unmeasured_test_types_budget_the_default_per_question(app, ledger):
+    assert app.question_output_budget("Domain Test (DSA)", 5) == int(5 * 150 * 1.3) + 100
+
+def test_budget_follows_the_measured_tokens_per_question(app, ledger):
+    ledger.record_questions("Domain Test (DSA)", response_tokens=400, generated=5, delivered=5) # 80 per question
+    assert app.question_output_budget("Domain Test (DSA)", 10) == int(10 * 80 * 1.3) + 100
+    assert app.question_output_budget("Aptitude Test", 10) == int(10 * 150 * 1.3) + 100 # Measured per test type
+
+def test_measurements_are_a_moving_average(ledger):
+    ledger.record_questions("Aptitude Test", response_tokens=500, generated=5, delivered=5)
+    ledger.record_questions("Aptitude Test", response_tokens=1000, generated=5, delivered=4)
+    assert ledger.tokens_per_question("Aptitude Test") == pytest.approx(0.8 * 100 + 0.2 * 200)
+    assert ledger.usage["Aptitude Test"]["delivered"] == 9
+
+def test_responses_without_questions_leave_the_measurement_alone(ledger):
+    ledger.record_questions("Aptitude Test", response_tokens=300, generated=0, delivered=0)
+    assert ledger.tokens_per_question("Aptitude Test") == 150
+
+def test_budget_is_capped_by_the_task_profile(app, ledger):
+    assert app.question_output_budget("Domain Test (DSA)", 100) == app.LLM_TASK_PROFILES["question_generation"]["max_tokens"]
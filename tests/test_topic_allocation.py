@@ -0,0 +1,32 @@
+import pytest
+
+TOPICS = ["Arrays", "Graphs", "Trees"]
+
+def test_without_stats_questions_are_split_evenly(app):
+    assert app.allocate_questions(TOPICS, 9) == [3, 3, 3]
+    assert app.allocate_questions(TOPICS, 10) == [4, 3, 3] # The leftover goes to the earlier topic
+
+def test_weaker_topics_get_more_questions(app):
+    stats = {"Arrays": [10, 9], "Graphs": [10, 3], "Trees": [10, 6]}
+    counts = app.allocate_questions(TOPICS, 12, stats)
+    assert sum(counts) == 12
+    assert counts[1] > counts[2] > counts[0]
+
+def test_skewed_stats_still_leave_one_question_per_topic(app):
+    stats = {"Arrays": [100, 100], "Graphs": [100, 0], "Trees": [100, 100]}
+    assert app.allocate_questions(TOPICS, 12, stats) == [1, 10, 1]
+
+@pytest.mark.parametrize("stats, counts", [
+    (None, [1, 1, 0]), # Ties go to the earlier topics
+    ({"Arrays": [10, 9], "Graphs": [10, 3], "Trees": [10, 6]}, [0, 1, 1]), # The strongest topic is left out
+])
+def test_fewer_questions_than_topics_go_to_the_weakest(app, stats, counts):
+    assert app.allocate_questions(TOPICS, 2, stats) == counts
+
+def test_unseen_topics_count_as_average(app):
+    assert app.topic_weakness(None) == pytest.approx(0.5)
+    assert app.topic_weakness([2, 2]) == pytest.approx(1 - 4 / 6) # Two right answers barely move the prior
+
+def test_even_weighting_ignores_stats(app, monkeypatch):
+    monkeypatch.setattr(app, "TOPIC_WEIGHTING", "even")
+    assert app.allocate_questions(TOPICS, 9, {"Graphs": [20, 0]}) == [3, 3, 3]